@@ -0,0 +1,46 @@
+"""
+Author: SmileSion
+Date: 2026-10-18
+Description: Prometheus 指标接口。
+"""
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from app.core.plugin.admission import global_limiter, plugin_limiters
+from app.core.plugin.health_monitor import CLOSED, HALF_OPEN, OPEN, circuit_breakers
+from app.core.plugin.metrics import render_metrics
+from app.core.plugin.result_cache import result_caches
+from app.core.plugin.worker_pool import worker_pools
+
+router = APIRouter()
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def collect_gauges():
+    """进程池、限流器、结果缓存与熔断器的当前状态在抓取时读取，不在调用路径上维护"""
+    samples = []
+    for name, pool in list(worker_pools.items()):
+        stats = pool.stats()
+        labels = (("plugin", name),)
+        samples.append(("plugin_workers", labels + (("state", "busy"),), stats["size"] - stats["idle"]))
+        samples.append(("plugin_workers", labels + (("state", "idle"),), stats["idle"]))
+        samples.append(("plugin_workers_spawned_total", labels, stats["spawned"]))
+        samples.append(("plugin_workers_recycled_total", labels, stats["recycled"]))
+    for name, limiter in [("_global", global_limiter), *plugin_limiters.items()]:
+        stats = limiter.stats()
+        samples.append(("plugin_admission_active", (("plugin", name),), stats["active"]))
+        samples.append(("plugin_admission_queued", (("plugin", name),), stats["queued"]))
+    for name, cache in list(result_caches.items()):
+        samples.append(("plugin_cache_hits_total", (("plugin", name),), cache.hits))
+        samples.append(("plugin_cache_misses_total", (("plugin", name),), cache.misses))
+    for name, breaker in list(circuit_breakers.items()):
+        for state in (CLOSED, OPEN, HALF_OPEN):
+            samples.append(("plugin_circuit_state", (("plugin", name), ("state", state)), int(breaker.state == state)))
+        samples.append(("plugin_circuit_rejected_total", (("plugin", name),), breaker.rejected))
+    return samples
+
+
+@router.get("/metrics")
+def metrics():
+    return PlainTextResponse(render_metrics(collect_gauges()), media_type=PROMETHEUS_CONTENT_TYPE)
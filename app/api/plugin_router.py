@@ -4,47 +4,136 @@ Date: 2025-07-30
 Description: 接口路由注册模块。
 """
 import os
+import json
 import shutil
-import subprocess
-import inspect
+import asyncio
+import time
+from typing import Literal, Optional
 
-from fastapi import APIRouter, Body, HTTPException, UploadFile, Depends, Query
+from fastapi import APIRouter, Body, Header, HTTPException, Request, Response, UploadFile, Depends, Query
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, StreamingResponse
 from sqlalchemy.orm import Session
 
-from app.utils.file_utils import extract_and_parse_manifest
-from app.utils.log_utils import setup_logger
+from app.utils.file_utils import PluginPackageError, PluginPackageTooLarge, get_plugin_folder, open_plugin_package
+from app.utils.log_utils import log_payload, setup_logger
 from app.core.plugin.plugin_loader import (
-    call_plugin_method_in_process,
+    DEFAULT_CALL_TIMEOUT,
+    PLUGIN_ROOT,
+    call_plugin_method_in_process_async,
+    stream_plugin_method_async,
     enable_plugin,
     disable_plugin,
     loaded_plugins,
+    plugin_states,
 )
+from app.core.plugin.hook.startup_hooks import startup_state
+from app.core.plugin.dependency_builder import (
+    get_install_blocker,
+    get_install_state,
+    remove_install_state,
+    submit_install,
+)
+from app.core.plugin.admission import PluginOverloadedError, get_plugin_limits, global_limiter, override_plugin_limits
+from app.core.plugin.dispatcher import run_async
+from app.core.plugin.job_scheduler import job_scheduler
 from app.core.plugin.plugin_update import update_plugin
-from app.db.database import get_db
+from app.core.plugin.package_store import (
+    collect_garbage,
+    find_package_tree,
+    get_plugin_ref,
+    materialize_package,
+    remove_plugin_ref,
+    set_plugin_ref,
+)
+from app.core.plugin.metrics import remove_plugin_metrics
+from app.core.plugin.profiler import (
+    configure_profiling,
+    disable_profiling,
+    get_profile,
+    get_profiling_config,
+    list_profiles,
+    remove_profiles,
+    render_pstats_text,
+)
+from app.core.plugin.method_index import PluginArgumentError, get_method_index, validate_call
+from app.core.plugin.health_monitor import get_health_state
+from app.core.plugin.result_cache import get_cache_stats
+from app.core.plugin.worker_pool import get_pool_stats
+from app.core.plugin.plugin_registry import (
+    get_enabled_plugin,
+    get_plugin,
+    list_enabled_plugins,
+    query_plugin_page,
+    refresh_plugin,
+    remove_plugin,
+)
+from app.db.database import get_db, run_db
 from app.db.models import PluginInfo, PluginStatus
-from .schemas.call_schemas import PluginCallRequest
+from .schemas.call_schemas import MAX_CALL_TIMEOUT, PluginCallRequest, PluginBatchCallRequest, PluginJobRequest
+from .schemas.limit_schemas import PluginLimitsRequest
+from .schemas.profile_schemas import PluginProfilingRequest
 
 router = APIRouter()
 logger = setup_logger("plugin_router")
 
 MAX_PLUGIN_SIZE = 3 * 1024 * 1024  # 3MB
-CHUNK_SIZE = 1024 * 1024  # 每次最多读取 1MB
+LIST_MAX_LIMIT = 1000  # /list 单页最多返回的插件数
+MAX_JOB_WAIT = 60  # 长轮询最长等待时间（秒）
+CLIENT_CLOSED_REQUEST = 499  # 客户端在调用完成前断开
+
+
+def request_timeout_header(x_request_timeout: Optional[float] = Header(None, gt=0, le=MAX_CALL_TIMEOUT)):
+    """请求头 X-Request-Timeout：整个请求的截止时间（秒）"""
+    return x_request_timeout
+
+
+def effective_timeout(*timeouts):
+    """请求头与请求体中的超时取较小者，都未指定时使用默认超时"""
+    values = [t for t in timeouts if t is not None]
+    return min(values) if values else DEFAULT_CALL_TIMEOUT
+
+
+async def wait_disconnect(request: Request):
+    # 请求体已读完，之后收到的只会是断开消息
+    while (await request.receive())["type"] != "http.disconnect":
+        pass
+
+
+async def until_disconnect(request: Request, awaitable):
+    """等待 awaitable 完成；客户端先断开时取消它（工作进程中的调用随之取消）并返回 499"""
+    task = asyncio.ensure_future(awaitable)
+    disconnect = asyncio.ensure_future(wait_disconnect(request))
+    try:
+        await asyncio.wait({task, disconnect}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        disconnect.cancel()
+        if not task.done():
+            task.cancel()
+            # 取消在下一轮事件循环才生效，结果（CancelledError）不再需要
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+    if not task.done():
+        raise HTTPException(status_code=CLIENT_CLOSED_REQUEST, detail="客户端已断开，调用已取消")
+    return task.result()
+
 
 @router.post("/upload")
 def upload_plugin(file: UploadFile, db: Session = Depends(get_db)):
     logger.info(f"收到插件上传请求：{file.filename}")
-    temp_path = f"/tmp/{file.filename}"
-    save_upload_file_limited(file, temp_path)
-
-    with open(temp_path, "rb") as f:
-        file.file = f
-        manifest = extract_and_parse_manifest(file)
+    package = open_package_or_reject(file)
 
-    existing_plugin = db.query(PluginInfo).filter_by(name=manifest["name"]).first()
+    # 重名检查在解压之前完成，被拒绝的上传不产生任何磁盘写入
+    existing_plugin = db.query(PluginInfo).filter_by(name=package.name).first()
     if existing_plugin:
-        os.remove(temp_path)
-        logger.warning(f"上传失败，插件已存在：{manifest['name']}")
-        raise HTTPException(status_code=400, detail=f"插件名 '{manifest['name']}' 已存在，请更换名称")
+        # 重复上传同一插件包且内容与当前版本一致时视为成功，不再写入
+        tree = find_package_tree(package.sha256)
+        if tree and tree == get_plugin_ref(package.name):
+            logger.info(f"插件包与已安装版本内容相同，跳过：{package.name}")
+            return {"msg": "插件已安装，内容未变", "plugin": package.name, "sha256": package.sha256, "unchanged": True}
+        logger.warning(f"上传失败，插件已存在：{package.name}")
+        raise HTTPException(status_code=400, detail=f"插件名 '{package.name}' 已存在，请更换名称")
+
+    manifest, tree = materialize_package(package, os.path.join(PLUGIN_ROOT, package.name))
 
     plugin = PluginInfo(
         name=manifest["name"],
@@ -55,18 +144,14 @@ def upload_plugin(file: UploadFile, db: Session = Depends(get_db)):
     )
     db.add(plugin)
     db.commit()
+    refresh_plugin(plugin)
+    set_plugin_ref(plugin.name, tree)
 
-    requirements_path = os.path.join(os.path.dirname(manifest["entry_path"]), "requirements.txt")
-    if os.path.exists(requirements_path):
-        try:
-            subprocess.check_call(["pip", "install", "-r", requirements_path])
-        except subprocess.CalledProcessError:
-            logger.error(f"插件 {plugin.name} 安装 requirements 失败")
-            raise HTTPException(status_code=500, detail="插件上传失败：requirements 安装出错")
+    # 依赖在后台安装，安装进度见 /status/{name}
+    install_state = submit_install(plugin.name, get_plugin_folder(manifest["entry_path"]))
 
-    os.remove(temp_path)
     logger.info(f"插件上传成功：{plugin.name}")
-    return {"msg": "上传成功", "plugin": plugin.name}
+    return {"msg": "上传成功", "plugin": plugin.name, "sha256": package.sha256, "install": install_state}
 
 @router.post("/enable/{name}")
 def enable(name: str, db: Session = Depends(get_db)):
@@ -75,10 +160,25 @@ def enable(name: str, db: Session = Depends(get_db)):
     if not plugin:
         logger.warning(f"启用失败，插件不存在：{name}")
         raise HTTPException(status_code=404, detail="插件不存在")
-    
-    enable_plugin(plugin.entry_path, name)
+
+    blocker = get_install_blocker(name, get_plugin_folder(plugin.entry_path))
+    if blocker:
+        raise HTTPException(status_code=409, detail=blocker)
+
+    try:
+        enable_plugin(plugin.entry_path, name)
+    except TimeoutError as e:
+        logger.error(f"插件启用超时：{name}，原因：{e}")
+        raise HTTPException(status_code=504, detail=f"插件启用超时：{e}")
+    except ValueError as e:
+        logger.error(f"插件启用失败：{name}，原因：{e}")
+        raise HTTPException(status_code=400, detail=f"插件启用失败：{e}")
+    except Exception as e:
+        logger.error(f"插件启用失败：{name}，原因：{e}")
+        raise HTTPException(status_code=500, detail=f"插件启用失败：{e}")
     plugin.status = PluginStatus.ENABLED
     db.commit()
+    refresh_plugin(plugin)
     logger.info(f"插件已启用：{name}")
     return {"msg": f"插件 {name} 已启用"}
 
@@ -88,35 +188,227 @@ def disable(name: str, db: Session = Depends(get_db)):
     plugin = db.query(PluginInfo).filter_by(name=name).first()
     plugin.status = PluginStatus.DISABLED
     db.commit()
+    refresh_plugin(plugin)
     logger.info(f"插件已停用：{name}")
     return {"msg": f"插件 {name} 已停用"}
 
 @router.get("/list")
-def list_plugins(db: Session = Depends(get_db)):
-    logger.info("获取插件列表")
-    return db.query(PluginInfo).all()
+async def list_plugins(response: Response,
+                       offset: int = Query(0, ge=0),
+                       limit: int = Query(LIST_MAX_LIMIT, ge=1, le=LIST_MAX_LIMIT),
+                       status: Optional[PluginStatus] = None):
+    logger.info("获取插件列表：offset=%d, limit=%d, status=%s", offset, limit, status)
+    total, items = await run_db(query_plugin_page, offset, limit, status)
+    # 响应体保持为插件列表，总数与分页参数通过响应头返回
+    response.headers["X-Total-Count"] = str(total)
+    response.headers["X-Offset"] = str(offset)
+    response.headers["X-Limit"] = str(limit)
+    return items
 
 @router.post("/call/{name}")
-def call(name: str,
-         payload: PluginCallRequest = Body(...),
-         db: Session = Depends(get_db)):
-    plugin = db.query(PluginInfo).filter_by(name=name).first()
-    if not plugin or plugin.status != PluginStatus.ENABLED:
-        logger.warning(f"插件调用失败，未启用或不存在：{name}")
+async def call(name: str,
+               request: Request,
+               payload: PluginCallRequest = Body(...),
+               header_timeout: Optional[float] = Depends(request_timeout_header)):
+    plugin = get_enabled_plugin(name)
+    if not plugin:
+        logger.warning("插件调用失败，未启用或不存在：%s", name)
         raise HTTPException(status_code=400, detail="插件未启用或不存在")
 
     method = payload.method
     args = payload.args
-    logger.info(f"调用插件 {name} 方法 {method}，参数：{args}")
+    logger.info("调用插件 %s 方法 %s，参数：%s", name, method, log_payload(args))
 
     try:
-        result = call_plugin_method_in_process(plugin.entry_path, method, args)
-        logger.info(f"插件调用成功：{name}.{method} 返回 {result}")
+        validate_call(name, method, args)
+    except PluginArgumentError as e:
+        logger.warning("插件调用参数校验失败：%s.%s，原因：%s", name, method, e)
+        raise HTTPException(status_code=422, detail={"msg": str(e), "errors": e.errors})
+
+    timeout = effective_timeout(header_timeout, payload.timeout)
+    try:
+        result = await until_disconnect(
+            request, call_plugin_method_in_process_async(name, plugin.entry_path, method, args, timeout)
+        )
+        logger.info("插件调用成功：%s.%s 返回 %s", name, method, log_payload(result))
         return {"result": result}
+    except HTTPException:
+        logger.warning("客户端已断开，取消插件调用：%s.%s", name, method)
+        raise
+    except PluginOverloadedError as e:
+        logger.warning("插件调用被拒绝：%s.%s，原因：%s", name, method, e)
+        raise HTTPException(status_code=e.status_code, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except TimeoutError as e:
+        logger.warning("插件调用超时：%s.%s，原因：%s", name, method, e)
+        raise HTTPException(status_code=504, detail=str(e))
     except Exception as e:
-        logger.exception(f"插件调用出错：{name}.{method}")
+        logger.exception("插件调用出错：%s.%s", name, method)
         raise HTTPException(status_code=500, detail=str(e))
     
+@router.post("/call-batch")
+async def call_batch(request: Request,
+                     payload: PluginBatchCallRequest = Body(...),
+                     header_timeout: Optional[float] = Depends(request_timeout_header)):
+    plugins = {item.plugin: get_enabled_plugin(item.plugin) for item in payload.items}
+    entry_paths = {name: p.entry_path for name, p in plugins.items() if p}
+    logger.info("批量调用插件，共 %d 项，并发上限 %d", len(payload.items), payload.concurrency)
+
+    semaphore = asyncio.Semaphore(payload.concurrency)
+    loop = asyncio.get_running_loop()
+    # 请求头中的超时是整个批量请求的截止时间，每项的超时不超过剩余时间
+    deadline = loop.time() + header_timeout if header_timeout is not None else None
+
+    async def run_item(index, item):
+        if item.plugin not in entry_paths:
+            return index, {"error": f"插件 {item.plugin} 未启用或不存在"}
+        try:
+            validate_call(item.plugin, item.method, item.args)
+        except PluginArgumentError as e:
+            return index, {"error": str(e), "errors": e.errors}
+        async with semaphore:
+            remaining = deadline - loop.time() if deadline is not None else None
+            if remaining is not None and remaining <= 0:
+                return index, {"error": "批量调用超过截止时间", "status": 504}
+            try:
+                result = await call_plugin_method_in_process_async(
+                    item.plugin, entry_paths[item.plugin], item.method, item.args,
+                    effective_timeout(remaining, item.timeout)
+                )
+                return index, {"result": result}
+            except PluginOverloadedError as e:
+                return index, {"error": str(e), "status": e.status_code, "retry_after": e.retry_after}
+            except TimeoutError as e:
+                return index, {"error": str(e), "status": 504}
+            except Exception as e:
+                logger.warning("批量调用第 %d 项出错：%s.%s，原因：%s", index, item.plugin, item.method, e)
+                return index, {"error": str(e)}
+
+    tasks = [asyncio.ensure_future(run_item(i, item)) for i, item in enumerate(payload.items)]
+
+    if payload.stream:
+        async def stream_results():
+            try:
+                for finished in asyncio.as_completed(tasks):
+                    index, output = await finished
+                    line = jsonable_encoder({"index": index, **output})
+                    yield json.dumps(line, ensure_ascii=False) + "\n"
+            finally:
+                # 客户端提前断开时取消尚未完成的调用
+                for task in tasks:
+                    task.cancel()
+
+        return StreamingResponse(stream_results(), media_type="application/x-ndjson")
+
+    results = [output for _, output in await until_disconnect(request, asyncio.gather(*tasks))]
+    logger.info("批量调用完成，共 %d 项", len(results))
+    return {"results": results}
+
+@router.post("/stream/{name}")
+async def stream(name: str,
+                 payload: PluginCallRequest = Body(...),
+                 format: str = Query("ndjson", pattern="^(ndjson|sse)$"),
+                 header_timeout: Optional[float] = Depends(request_timeout_header)):
+    plugin = get_enabled_plugin(name)
+    if not plugin:
+        logger.warning("插件流式调用失败，未启用或不存在：%s", name)
+        raise HTTPException(status_code=400, detail="插件未启用或不存在")
+    method = payload.method
+    try:
+        validate_call(name, method, payload.args)
+    except PluginArgumentError as e:
+        raise HTTPException(status_code=422, detail={"msg": str(e), "errors": e.errors})
+
+    # 指定了超时时作为整个流式响应的截止时间，否则只限制相邻两块之间的等待时间
+    timeout = effective_timeout(header_timeout, payload.timeout)
+    deadline = time.monotonic() + timeout if header_timeout or payload.timeout else None
+    chunks = stream_plugin_method_async(name, plugin.entry_path, method, payload.args, timeout, deadline)
+
+    # 先取第一块，准入拒绝、进程池异常等错误仍可以作为普通 HTTP 错误返回
+    try:
+        first = [await chunks.__anext__()]
+    except StopAsyncIteration:
+        first = []
+    except PluginOverloadedError as e:
+        logger.warning("插件流式调用被拒绝：%s.%s，原因：%s", name, method, e)
+        raise HTTPException(status_code=e.status_code, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except TimeoutError as e:
+        logger.warning("插件流式调用超时：%s.%s，原因：%s", name, method, e)
+        raise HTTPException(status_code=504, detail=str(e))
+    except Exception as e:
+        logger.exception("插件流式调用出错：%s.%s", name, method)
+        raise HTTPException(status_code=500, detail=str(e))
+
+    def encode(data, event=None):
+        text = json.dumps(jsonable_encoder(data), ensure_ascii=False)
+        if format == "sse":
+            return (f"event: {event}\n" if event else "") + f"data: {text}\n\n"
+        return text + "\n"
+
+    async def body():
+        try:
+            for chunk in first:
+                yield encode(chunk)
+            while True:
+                try:
+                    chunk = await chunks.__anext__()
+                except StopAsyncIteration:
+                    break
+                yield encode(chunk)
+            if format == "sse":
+                yield encode({"msg": "done"}, event="end")
+        except Exception as e:
+            # 响应头已发出，错误只能作为最后一条消息返回
+            logger.warning("插件流式调用中断：%s.%s，原因：%s", name, method, e)
+            yield encode({"error": str(e)}, event="error")
+        finally:
+            await chunks.aclose()
+
+    media_type = "text/event-stream" if format == "sse" else "application/x-ndjson"
+    return StreamingResponse(body(), media_type=media_type)
+
+@router.post("/jobs", status_code=202)
+async def submit_job(payload: PluginJobRequest = Body(...)):
+    plugin = get_enabled_plugin(payload.plugin)
+    if not plugin:
+        logger.warning(f"任务提交失败，插件未启用或不存在：{payload.plugin}")
+        raise HTTPException(status_code=400, detail="插件未启用或不存在")
+    try:
+        validate_call(payload.plugin, payload.method, payload.args)
+    except PluginArgumentError as e:
+        raise HTTPException(status_code=422, detail={"msg": str(e), "errors": e.errors})
+
+    try:
+        job = await run_async(job_scheduler.submit(
+            payload.plugin, plugin.entry_path, payload.method, payload.args, payload.priority, payload.timeout
+        ))
+    except PluginOverloadedError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    return {"job_id": job.id, "status": job.status}
+
+@router.get("/jobs/{job_id}")
+async def get_job(job_id: str, wait: float = Query(0, ge=0, le=MAX_JOB_WAIT)):
+    async def fetch():
+        job = await job_scheduler.wait(job_id, wait)
+        return job.to_dict() if job else None
+
+    # wait > 0 时长轮询，任务结束或超时后返回
+    job = await run_async(fetch())
+    if job is None:
+        raise HTTPException(status_code=404, detail="任务不存在或已过期")
+    return jsonable_encoder(job)
+
+@router.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    async def cancel():
+        job = job_scheduler.cancel(job_id)
+        return job.to_dict() if job else None
+
+    job = await run_async(cancel())
+    if job is None:
+        raise HTTPException(status_code=404, detail="任务不存在或已过期")
+    logger.info(f"任务取消请求：{job_id}")
+    return jsonable_encoder(job)
+
 @router.delete("/uninstall/{name}")
 def uninstall_plugin(name: str, db: Session = Depends(get_db)):
     plugin = db.query(PluginInfo).filter_by(name=name).first()
@@ -131,9 +423,14 @@ def uninstall_plugin(name: str, db: Session = Depends(get_db)):
     # 删除插件记录
     db.delete(plugin)
     db.commit()
+    remove_plugin(name)
+    remove_install_state(name)
+    remove_plugin_ref(name)
+    remove_plugin_metrics(name)
+    remove_profiles(name)
 
-    # 删除插件文件夹（假设插件路径格式固定）
-    plugin_folder = os.path.dirname(plugin.entry_path)
+    # 删除插件文件夹
+    plugin_folder = get_plugin_folder(plugin.entry_path)
     if os.path.exists(plugin_folder):
         shutil.rmtree(plugin_folder)
     logger.info(f"插件已卸载并删除：{name}")
@@ -141,27 +438,21 @@ def uninstall_plugin(name: str, db: Session = Depends(get_db)):
 
 @router.get("/methods/{name}")
 def get_plugin_methods(name: str):
-    plugin = loaded_plugins.get(name)
-    if not plugin:
+    index = get_method_index(name)
+    if index is None:
         logger.warning(f"获取方法失败，插件未启用或不存在：{name}")
         raise HTTPException(status_code=400, detail="插件未启用或不存在")
 
-    methods_info = {}
-    for attr_name in dir(plugin):
-        if attr_name.startswith("_"):
-            continue  # 跳过私有和特殊方法
-        attr = getattr(plugin, attr_name)
-        if callable(attr):
-            sig = inspect.signature(attr)
-            # 过滤掉 self 参数，只展示外部调用需要传的参数
-            params = [p.name for p in sig.parameters.values() if p.name != "self"]
-            methods_info[attr_name] = params
+    # 只展示外部调用需要传的参数（不含 self）
+    methods_info = {method_name: spec.param_names for method_name, spec in index.items()}
+    signatures = {method_name: spec.to_dict() for method_name, spec in index.items()}
     logger.info(f"插件方法获取成功：{name}")
-    return {"plugin": name, "methods": methods_info}
+    return {"plugin": name, "methods": methods_info, "signatures": signatures}
 
 @router.get("/status/{name}")
-def check_plugin_status(name: str, db: Session = Depends(get_db)):
-    plugin = db.query(PluginInfo).filter_by(name=name).first()
+def check_plugin_status(name: str):
+    # 注册表与数据库同步更新，状态查询不访问数据库
+    plugin = get_plugin(name)
     if not plugin:
         logger.warning(f"插件状态查询失败，不存在：{name}")
         raise HTTPException(status_code=404, detail="插件不存在")
@@ -174,16 +465,61 @@ def check_plugin_status(name: str, db: Session = Depends(get_db)):
         "version": plugin.version,
         "description": plugin.description,
         "status_db": plugin.status.name,  # 数据库中状态（比如 INSTALLED, ENABLED, DISABLED）
-        "is_loaded_in_memory": is_enabled  # 是否内存中已启用
+        "is_loaded_in_memory": is_enabled,  # 是否内存中已启用
+        "cache": get_cache_stats(name),  # 结果缓存命中/未命中/淘汰计数，未启用缓存时为 None
+        "workers": get_pool_stats(name),  # 进程池规模、启动方式与工作进程启动耗时
+        "health": get_health_state(name),  # 熔断器状态（closed / open / half_open）与最近一次健康检查结果，未启用时为 None
+        "install": get_install_state(name)  # 依赖安装状态（building / ready / failed），本次运行未安装过时为 None
+    }
+
+@router.get("/ready")
+def readiness():
+    plugins = {p.name: plugin_states.get(p.name, {"state": "cold"}) for p in list_enabled_plugins()}
+    warm = sum(1 for state in plugins.values() if state["state"] == "warm")
+    body = {
+        "ready": startup_state["complete"],
+        "mode": startup_state["mode"],
+        "warm": warm,
+        "total": len(plugins),
+        "plugins": plugins,
     }
+    # 启动加载流程结束前返回 503，便于负载均衡器判断是否可以接入流量
+    return JSONResponse(status_code=200 if body["ready"] else 503, content=body)
+
+@router.get("/limits/{name}")
+def get_limits(name: str):
+    limits = get_plugin_limits(name)
+    if limits is None:
+        raise HTTPException(status_code=400, detail="插件未启用或不存在")
+    return {"plugin": name, "limits": limits, "global": global_limiter.stats()}
+
+@router.post("/limits/{name}")
+async def update_limits(name: str, payload: PluginLimitsRequest = Body(...)):
+    async def apply():
+        limiter = override_plugin_limits(name, **payload.model_dump())
+        return limiter.stats() if limiter else None
+
+    # 限流器只在调度循环中修改
+    limits = await run_async(apply())
+    if limits is None:
+        raise HTTPException(status_code=400, detail="插件未启用或不存在")
+    return {"plugin": name, "limits": limits}
 
 @router.post("/update/{name}")
 def update(name: str, file: UploadFile, db: Session = Depends(get_db)):
     logger.info(f"收到插件更新请求：{name}")
-    temp_path = f"/tmp/update_{file.filename}"
-    save_upload_file_limited(file, temp_path)
+    package = open_package_or_reject(file)
     try:
-        plugin = update_plugin(db, name, file)
+        plugin, outcome = update_plugin(db, name, package)
+        if outcome == "unchanged":
+            logger.info(f"插件内容未变，跳过更新：{name}")
+            return {"msg": f"插件 {name} 内容未变，无需更新", "version": plugin.version, "unchanged": True}
+        if outcome == "installing":
+            logger.info(f"插件更新已受理，依赖安装完成后切换：{name}")
+            return JSONResponse(status_code=202, content={
+                "msg": f"插件 {name} 新版本依赖安装中，完成后自动切换",
+                "install": get_install_state(name),
+            })
         logger.info(f"插件更新成功：{name} -> 版本 {plugin.version}")
         return {"msg": f"插件 {name} 更新成功", "version": plugin.version}
     except ValueError as ve:
@@ -195,18 +531,57 @@ def update(name: str, file: UploadFile, db: Session = Depends(get_db)):
         # 其他未处理异常，返回 500
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/profiling/{name}")
+def enable_profiling(name: str, payload: PluginProfilingRequest = Body(...)):
+    if not get_enabled_plugin(name):
+        raise HTTPException(status_code=400, detail="插件未启用或不存在")
+    configure_profiling(name, **payload.model_dump())
+    return {"plugin": name, "profiling": get_profiling_config(name)}
+
+@router.get("/profiling/{name}")
+def get_profiling(name: str):
+    return {"plugin": name, "profiling": get_profiling_config(name)}
+
+@router.delete("/profiling/{name}")
+def stop_profiling(name: str):
+    disable_profiling(name)
+    return {"plugin": name, "profiling": None}
+
+@router.get("/profiles")
+def get_profiles(plugin: Optional[str] = None):
+    return {"profiles": list_profiles(plugin)}
 
+@router.get("/profiles/{call_id}")
+def download_profile(call_id: str, format: Optional[Literal["pstats", "text", "collapsed"]] = None):
+    entry = get_profile(call_id)
+    if not entry or not os.path.exists(entry["path"]):
+        raise HTTPException(status_code=404, detail="剖析结果不存在")
+    # cprofile 结果可下载 pstats 文件或文本报表，sampling 结果为折叠栈，可直接用于生成火焰图
+    native = "pstats" if entry["profiler"] == "cprofile" else "collapsed"
+    format = format or native
+    if format == "text" and native == "pstats":
+        return PlainTextResponse(render_pstats_text(entry["path"]))
+    if format != native:
+        raise HTTPException(status_code=400, detail=f"{entry['profiler']} 剖析结果不支持 {format} 格式")
+    if format == "collapsed":
+        return FileResponse(entry["path"], media_type="text/plain; charset=utf-8", filename=f"{call_id}.collapsed")
+    return FileResponse(entry["path"], media_type="application/octet-stream", filename=f"{call_id}.prof")
 
-# 限制上传大小函数
-def save_upload_file_limited(file: UploadFile, dest_path: str):
-    total_size = 0
-    with open(dest_path, "wb") as out_file:
-        while chunk := file.file.read(CHUNK_SIZE):
-            total_size += len(chunk)
-            if total_size > MAX_PLUGIN_SIZE:
-                out_file.close()
-                os.remove(dest_path)
-                size_mb = MAX_PLUGIN_SIZE / (1024 * 1024)
-                logger.warning(f"上传失败，插件文件过大：{file.filename} 大小超过 {size_mb:.2f} MB")
-                raise HTTPException(status_code=413, detail=f"文件过大，不能超过 {size_mb:.2f} MB")
-            out_file.write(chunk)
\ No newline at end of file
+@router.post("/store/gc")
+def store_gc():
+    # 删除已没有任何插件版本引用的文件与插件包记录
+    return collect_garbage()
+
+
+
+# 插件包读取与校验
+def open_package_or_reject(file: UploadFile):
+    """读取并校验上传的插件包，超过大小限制返回 413，格式错误返回 400"""
+    try:
+        return open_plugin_package(file, MAX_PLUGIN_SIZE)
+    except PluginPackageTooLarge as e:
+        logger.warning(f"上传失败，插件包过大：{file.filename}，{e}")
+        raise HTTPException(status_code=413, detail=str(e))
+    except PluginPackageError as e:
+        logger.warning(f"上传失败，插件包不合法：{file.filename}，{e}")
+        raise HTTPException(status_code=400, detail=str(e))
@@ -1,8 +1,27 @@
 # 定义调用的参数
 
-from pydantic import BaseModel
-from typing import Dict, Any
+from pydantic import BaseModel, Field
+from typing import Dict, Any, List, Literal, Optional
+
+MAX_BATCH_ITEMS = 1000
+MAX_BATCH_CONCURRENCY = 64
+MAX_JOB_TIMEOUT = 24 * 3600
+MAX_CALL_TIMEOUT = 600
 
 class PluginCallRequest(BaseModel):
     method: str
     args: Dict[str, Any] = {}
+    timeout: Optional[float] = Field(None, gt=0, le=MAX_CALL_TIMEOUT)  # 调用截止时间（秒），含排队与执行
+
+class PluginBatchCallItem(PluginCallRequest):
+    plugin: str
+
+class PluginBatchCallRequest(BaseModel):
+    items: List[PluginBatchCallItem] = Field(..., max_length=MAX_BATCH_ITEMS)
+    concurrency: int = Field(16, ge=1, le=MAX_BATCH_CONCURRENCY)  # 同时执行的调用数上限
+    stream: bool = False  # 为 True 时按完成顺序以 NDJSON 逐条返回
+
+class PluginJobRequest(PluginCallRequest):
+    plugin: str
+    priority: Literal["high", "normal", "low"] = "normal"
+    timeout: float = Field(3600, gt=0, le=MAX_JOB_TIMEOUT)  # 任务执行超时（秒）
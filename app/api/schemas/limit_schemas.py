@@ -0,0 +1,9 @@
+# 定义并发限制的调整参数
+
+from pydantic import BaseModel, Field
+from typing import Optional
+
+class PluginLimitsRequest(BaseModel):
+    max_concurrency: Optional[int] = Field(None, ge=1)  # 同时执行的调用数上限
+    max_queue: Optional[int] = Field(None, ge=0)  # 等待队列长度上限
+    queue_timeout: Optional[float] = Field(None, gt=0)  # 排队超时（秒）
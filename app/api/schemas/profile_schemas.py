@@ -0,0 +1,11 @@
+# 定义性能剖析的开启参数
+
+from pydantic import BaseModel, Field
+from typing import List, Literal, Optional
+
+class PluginProfilingRequest(BaseModel):
+    profiler: Literal["cprofile", "sampling"] = "cprofile"  # cprofile 输出 pstats，sampling 输出折叠栈
+    methods: Optional[List[str]] = None  # 只剖析这些方法，为空时剖析全部方法
+    sample_every: int = Field(1, ge=1)  # 每 N 次执行剖析 1 次
+    interval: Optional[float] = Field(None, gt=0, le=1)  # 采样剖析的采样间隔（秒）
+    limit: Optional[int] = Field(None, ge=1)  # 保存指定数量的结果后自动关闭
@@ -0,0 +1,172 @@
+"""
+Author: SmileSion
+Date: 2026-10-18
+Description: 插件调用并发限制与准入控制。
+"""
+import asyncio
+import os
+from collections import deque
+from contextlib import asynccontextmanager
+
+from app.utils.log_utils import setup_logger
+
+DEFAULT_MAX_QUEUE = 64
+DEFAULT_QUEUE_TIMEOUT = 10  # 排队等待执行的最长时间（秒）
+GLOBAL_MAX_CONCURRENCY = int(os.getenv("PLUGIN_GLOBAL_MAX_CONCURRENCY", 256))
+GLOBAL_MAX_QUEUE = int(os.getenv("PLUGIN_GLOBAL_MAX_QUEUE", 1024))
+
+logger = setup_logger("plugin_admission")
+
+
+class PluginOverloadedError(Exception):
+    """插件或全局并发已饱和；status_code 为 429（队列已满）或 503（排队超时）"""
+
+    def __init__(self, message, status_code=503, retry_after=1):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class AdmissionLimiter:
+    """
+    限制同时执行的调用数，超出部分进入有界的 FIFO 等待队列。
+    释放时名额直接移交给队首等待者；只在调度循环中使用。
+    """
+
+    def __init__(self, name, max_concurrency, max_queue=DEFAULT_MAX_QUEUE, queue_timeout=DEFAULT_QUEUE_TIMEOUT):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self._waiters = deque()
+
+    @property
+    def retry_after(self):
+        return max(1, int(self.queue_timeout))
+
+    async def acquire(self, patient=False):
+        """patient 的调用（异步任务）不受等待队列长度与排队超时限制，由调用方的截止时间约束"""
+        if self.active < self.max_concurrency and not self._waiters:
+            self.active += 1
+            return
+        if not patient and len(self._waiters) >= self.max_queue:
+            self.rejected += 1
+            raise PluginOverloadedError(f"{self.name} 并发已满且等待队列已满", 429, self.retry_after)
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), None if patient else self.queue_timeout)
+        except BaseException as e:
+            if waiter.done() and not waiter.cancelled():
+                # 名额已移交但调用方已放弃，归还名额
+                self.release()
+            else:
+                waiter.cancel()
+                self._remove_waiter(waiter)
+            if isinstance(e, asyncio.TimeoutError):
+                self.timed_out += 1
+                raise PluginOverloadedError(f"{self.name} 排队超时（{self.queue_timeout}s）", 503, self.retry_after)
+            raise
+
+    def _remove_waiter(self, waiter):
+        try:
+            self._waiters.remove(waiter)
+        except ValueError:
+            pass
+
+    def release(self):
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+    def update(self, max_concurrency=None, max_queue=None, queue_timeout=None):
+        if max_concurrency is not None:
+            self.max_concurrency = max_concurrency
+        if max_queue is not None:
+            self.max_queue = max_queue
+        if queue_timeout is not None:
+            self.queue_timeout = queue_timeout
+        # 上限调高后立即放行排队中的调用
+        while self._waiters and self.active < self.max_concurrency:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self.active += 1
+                waiter.set_result(None)
+
+    def stats(self):
+        return {
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "queue_timeout": self.queue_timeout,
+            "active": self.active,
+            "queued": len(self._waiters),
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+        }
+
+
+plugin_limiters = {}
+global_limiter = AdmissionLimiter("全局", GLOBAL_MAX_CONCURRENCY, GLOBAL_MAX_QUEUE)
+_limit_overrides = {}  # 运行时覆盖的限制，插件重新启用后仍然生效
+
+
+def configure_plugin_limits(name, manifest=None, default_concurrency=1):
+    """按 manifest.json 的 concurrency 字段创建插件限流器，默认并发数与进程池上限一致"""
+    config = (manifest or {}).get("concurrency", {})
+    limiter = AdmissionLimiter(
+        name,
+        max_concurrency=int(config.get("max", default_concurrency)),
+        max_queue=int(config.get("queue", DEFAULT_MAX_QUEUE)),
+        queue_timeout=float(config.get("queue_timeout", DEFAULT_QUEUE_TIMEOUT)),
+    )
+    limiter.update(**_limit_overrides.get(name, {}))
+    plugin_limiters[name] = limiter
+    return limiter
+
+
+def override_plugin_limits(name, **limits):
+    """调整已启用插件的限制并记录为覆盖值；插件未启用或不存在时不做任何修改，返回 None"""
+    limiter = plugin_limiters.get(name)
+    if limiter is None:
+        return None
+    limits = {k: v for k, v in limits.items() if v is not None}
+    _limit_overrides.setdefault(name, {}).update(limits)
+    limiter.update(**limits)
+    logger.info(f"插件 {name} 并发限制已调整：{limits}")
+    return limiter
+
+
+def remove_plugin_limits(name):
+    plugin_limiters.pop(name, None)
+
+
+def get_plugin_limits(name):
+    limiter = plugin_limiters.get(name)
+    return limiter.stats() if limiter else None
+
+
+@asynccontextmanager
+async def admit(name, patient=False):
+    """先占用插件名额，再占用全局名额；任一饱和时快速失败，patient 的调用一直排队等待"""
+    limiter = plugin_limiters.get(name)
+    if limiter:
+        await limiter.acquire(patient)
+    try:
+        await global_limiter.acquire(patient)
+    except BaseException:
+        if limiter:
+            limiter.release()
+        raise
+    try:
+        yield
+    finally:
+        global_limiter.release()
+        if limiter:
+            limiter.release()
@@ -0,0 +1,215 @@
+"""
+Author: SmileSion
+Date: 2026-10-18
+Description: 插件依赖后台安装，本地 wheel 缓存与按依赖哈希划分的独立安装目录。
+"""
+import hashlib
+import importlib.abc
+import importlib.machinery
+import os
+import shutil
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from app.utils.log_utils import setup_logger
+
+DEPS_ROOT = os.path.abspath(os.getenv("PLUGIN_DEPS_ROOT", "plugin_envs"))  # 插件依赖安装目录
+WHEELHOUSE = os.path.abspath(os.getenv("PLUGIN_WHEELHOUSE", os.path.join(DEPS_ROOT, "wheelhouse")))
+DEPS_OFFLINE = os.getenv("PLUGIN_DEPS_OFFLINE", "0") == "1"  # 只从本地 wheel 缓存安装，不访问索引
+DEPS_BUILDERS = int(os.getenv("PLUGIN_DEPS_BUILDERS", 2))  # 同时进行的安装任务数
+REQUIREMENTS_FILE = "requirements.txt"
+READY_MARKER = ".ready"
+
+logger = setup_logger("plugin_dependency")
+
+install_states = {}  # 插件名 -> 最近一次安装状态（building / ready / failed）
+_executor = ThreadPoolExecutor(max_workers=DEPS_BUILDERS, thread_name_prefix="plugin-deps")
+_env_locks = {}  # 安装目录 -> 锁，相同依赖的并发安装只构建一次
+_env_locks_guard = threading.Lock()
+
+
+def requirements_hash(plugin_dir):
+    """按规范化后的 requirements.txt 内容计算哈希，没有依赖时返回 None"""
+    requirements_path = os.path.join(plugin_dir, REQUIREMENTS_FILE)
+    if not os.path.exists(requirements_path):
+        return None
+    with open(requirements_path, "r", encoding="utf-8") as f:
+        lines = sorted({line.split("#", 1)[0].strip() for line in f} - {""})
+    if not lines:
+        return None
+    return hashlib.sha256("\n".join(lines).encode("utf-8")).hexdigest()[:16]
+
+
+def plugin_env_path(name, plugin_dir):
+    """插件依赖安装目录；依赖不变时不同版本共用同一目录"""
+    digest = requirements_hash(plugin_dir)
+    return os.path.join(DEPS_ROOT, name, digest) if digest else None
+
+
+def is_env_ready(env_path):
+    return os.path.exists(os.path.join(env_path, READY_MARKER))
+
+
+def activate_plugin_env(name, plugin_dir):
+    """把已安装的依赖目录加入 sys.path，只在该插件自己的模板进程与工作进程中导入插件前调用"""
+    env_path = plugin_env_path(name, plugin_dir)
+    if env_path and is_env_ready(env_path) and env_path not in sys.path:
+        sys.path.insert(0, env_path)
+    return env_path
+
+
+class _PluginEnvFinder(importlib.abc.MetaPathFinder):
+    """
+    主进程中插件依赖目录的导入查找器，排在 sys.meta_path 末尾，只提供主进程环境中找不到的顶层模块。
+    按发起导入的代码所在目录（插件目录或依赖目录）确定所属插件，只在该插件自己的依赖目录中查找，
+    插件之间以及应用代码看不到其他插件安装的依赖（已导入的模块仍在 sys.modules 中共享）
+    """
+
+    def __init__(self):
+        self.envs = {}  # 插件目录或依赖目录 -> 依赖目录
+
+    def _importer_env(self):
+        """沿调用栈找到最近的位于插件目录或依赖目录中的代码，返回其依赖目录"""
+        envs = list(self.envs.items())
+        frame = sys._getframe(2)
+        while frame is not None:
+            filename = frame.f_code.co_filename
+            for folder, env_path in envs:
+                if filename.startswith(folder + os.sep):
+                    return env_path
+            frame = frame.f_back
+        return None
+
+    def find_spec(self, fullname, path=None, target=None):
+        if path is not None or not self.envs:
+            # 子模块由父包的 __path__ 定位
+            return None
+        env_path = self._importer_env()
+        if env_path is None:
+            return None
+        return importlib.machinery.PathFinder.find_spec(fullname, [env_path])
+
+
+_env_finder = _PluginEnvFinder()
+_env_finder_guard = threading.Lock()
+
+
+def expose_plugin_env(name, plugin_dir):
+    """主进程导入插件前调用：依赖目录只对该插件的代码可见，且优先级最低，不修改 sys.path"""
+    env_path = plugin_env_path(name, plugin_dir)
+    if env_path and is_env_ready(env_path):
+        with _env_finder_guard:
+            _env_finder.envs[os.path.abspath(plugin_dir)] = env_path
+            _env_finder.envs[env_path] = env_path  # 依赖包之间相互导入
+            if _env_finder not in sys.meta_path:
+                sys.meta_path.append(_env_finder)
+    return env_path
+
+
+def needs_install(name, plugin_dir):
+    env_path = plugin_env_path(name, plugin_dir)
+    return env_path is not None and not is_env_ready(env_path)
+
+
+def _pip(*args):
+    result = subprocess.run([sys.executable, "-m", "pip", *args], capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip()[-2000:] or f"pip 退出码 {result.returncode}")
+
+
+def _install_offline(requirements_path, target):
+    _pip("install", "--no-index", "--find-links", WHEELHOUSE, "--target", target,
+         "--disable-pip-version-check", "-r", requirements_path)
+
+
+def _build_env(name, requirements_path, env_path):
+    os.makedirs(WHEELHOUSE, exist_ok=True)
+    building_path = f"{env_path}.building"
+    shutil.rmtree(building_path, ignore_errors=True)
+    try:
+        try:
+            # 优先只用本地 wheel 缓存安装，命中时无需联网和重新构建
+            _install_offline(requirements_path, building_path)
+        except RuntimeError:
+            if DEPS_OFFLINE:
+                raise
+            logger.info(f"插件 {name} 依赖未全部命中本地缓存，下载并构建 wheel")
+            shutil.rmtree(building_path, ignore_errors=True)
+            _pip("wheel", "--find-links", WHEELHOUSE, "--wheel-dir", WHEELHOUSE,
+                 "--disable-pip-version-check", "-r", requirements_path)
+            _install_offline(requirements_path, building_path)
+        open(os.path.join(building_path, READY_MARKER), "w").close()
+        os.replace(building_path, env_path)
+    except BaseException:
+        shutil.rmtree(building_path, ignore_errors=True)
+        raise
+
+
+def _env_lock(env_path):
+    with _env_locks_guard:
+        return _env_locks.setdefault(env_path, threading.Lock())
+
+
+def _install(name, plugin_dir, env_path, state, on_ready, on_failed):
+    started = time.monotonic()
+    try:
+        with _env_lock(env_path):
+            if not is_env_ready(env_path):
+                _build_env(name, os.path.join(plugin_dir, REQUIREMENTS_FILE), env_path)
+    except Exception as e:
+        error = e
+        state.update(state="failed", error=str(error))
+        logger.error(f"插件 {name} 依赖安装失败：{error}")
+        callback = on_failed and (lambda: on_failed(error))
+    else:
+        state.update(state="ready", seconds=round(time.monotonic() - started, 3))
+        logger.info(f"插件 {name} 依赖安装完成：{env_path}")
+        callback = on_ready
+    if callback:
+        try:
+            callback()
+        except Exception:
+            logger.exception(f"插件 {name} 依赖安装后续处理失败")
+
+
+def submit_install(name, plugin_dir, on_ready=None, on_failed=None):
+    """
+    在后台安装插件依赖并立即返回安装状态。
+    依赖已安装（或没有依赖）时同步调用 on_ready，否则在安装线程中调用 on_ready / on_failed。
+    """
+    env_path = plugin_env_path(name, plugin_dir)
+    if env_path is None or is_env_ready(env_path):
+        state = {"state": "ready", "env": env_path, "reused": env_path is not None}
+        install_states[name] = state
+        if on_ready:
+            on_ready()
+        return state
+
+    state = {"state": "building", "env": env_path, "started_at": time.time()}
+    install_states[name] = state
+    logger.info(f"插件 {name} 依赖开始后台安装：{env_path}")
+    _executor.submit(_install, name, plugin_dir, env_path, state, on_ready, on_failed)
+    return state
+
+
+def get_install_state(name):
+    return install_states.get(name)
+
+
+def get_install_blocker(name, plugin_dir):
+    """插件该版本的依赖正在安装或安装失败时返回原因，可以启用时返回 None"""
+    state = install_states.get(name)
+    if not state or state["env"] != plugin_env_path(name, plugin_dir):
+        return None
+    if state["state"] == "building":
+        return "插件依赖安装中，请稍后再启用"
+    if state["state"] == "failed":
+        return f"插件依赖安装失败：{state['error']}"
+    return None
+
+
+def remove_install_state(name):
+    install_states.pop(name, None)
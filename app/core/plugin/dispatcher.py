@@ -0,0 +1,71 @@
+"""
+Author: SmileSion
+Date: 2026-10-18
+Description: 插件调用调度事件循环。
+"""
+import asyncio
+import threading
+
+from app.utils.log_utils import setup_logger
+
+logger = setup_logger("plugin_dispatcher")
+
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def get_dispatcher_loop():
+    """返回调度线程中的事件循环，首次调用时启动；所有进程池与工作进程管道只在该循环上操作"""
+    global _loop
+    if _loop is not None:
+        return _loop
+    with _loop_lock:
+        if _loop is None:
+            loop = asyncio.new_event_loop()
+            thread = threading.Thread(target=loop.run_forever, name="plugin-dispatcher", daemon=True)
+            thread.start()
+            _loop = loop
+            logger.info("插件调度事件循环已启动")
+    return _loop
+
+
+def in_dispatcher_loop():
+    try:
+        return asyncio.get_running_loop() is _loop
+    except RuntimeError:
+        return False
+
+
+def run_sync(coro, timeout=None):
+    """在调度循环中执行协程并阻塞等待结果，供同步代码调用"""
+    if in_dispatcher_loop():
+        coro.close()
+        raise RuntimeError("不能在调度事件循环内同步等待协程")
+    future = asyncio.run_coroutine_threadsafe(coro, get_dispatcher_loop())
+    return future.result(timeout)
+
+
+async def run_async(coro):
+    """在调度循环中执行协程，并在调用方所在的事件循环中等待结果，不占用线程"""
+    if in_dispatcher_loop():
+        return await coro
+    future = asyncio.run_coroutine_threadsafe(coro, get_dispatcher_loop())
+    return await asyncio.wrap_future(future)
+
+
+async def wait_readable(fileno, timeout=None):
+    """等待文件描述符可读（管道有数据、对端关闭或进程退出）"""
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+
+    def on_readable():
+        if not future.done():
+            future.set_result(None)
+
+    loop.add_reader(fileno, on_readable)
+    try:
+        await asyncio.wait_for(future, timeout)
+    except asyncio.TimeoutError:
+        raise TimeoutError()
+    finally:
+        loop.remove_reader(fileno)
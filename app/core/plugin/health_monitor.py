@@ -0,0 +1,250 @@
+"""
+Author: SmileSion
+Date: 2026-10-18
+Description: 插件健康检查巡检与熔断：健康检查结果与调用失败率共同决定是否快速拒绝调用。
+"""
+import asyncio
+import math
+import os
+import random
+import time
+from collections import deque
+
+from app.core.plugin.admission import PluginOverloadedError
+from app.core.plugin.metrics import inc
+from app.core.plugin.worker_pool import PluginPoolClosedError, worker_pools
+from app.utils.log_utils import setup_logger
+
+HEALTH_INTERVAL = float(os.getenv("PLUGIN_HEALTH_INTERVAL", 30))  # 健康检查间隔（秒），0 表示不巡检
+HEALTH_JITTER = float(os.getenv("PLUGIN_HEALTH_JITTER", 0.2))  # 间隔随机浮动比例，避免所有插件同时检查
+HEALTH_TIMEOUT = float(os.getenv("PLUGIN_HEALTH_TIMEOUT", 5))  # 单次健康检查超时（秒）
+HEALTH_BATCH = int(os.getenv("PLUGIN_HEALTH_BATCH", 8))  # 同时进行的健康检查数
+HEALTH_TICK = min(1.0, HEALTH_INTERVAL) if HEALTH_INTERVAL > 0 else 1.0  # 巡检循环检查到期插件的间隔
+# 熔断默认配置，可在 manifest.json 的 circuit_breaker 字段中覆盖
+BREAKER_WINDOW = int(os.getenv("PLUGIN_BREAKER_WINDOW", 20))  # 统计失败率的最近调用数
+BREAKER_MIN_CALLS = int(os.getenv("PLUGIN_BREAKER_MIN_CALLS", 10))  # 至少有这么多次调用才按失败率熔断
+BREAKER_FAILURE_RATE = float(os.getenv("PLUGIN_BREAKER_FAILURE_RATE", 0.5))  # 失败（出错或超时）比例阈值
+BREAKER_OPEN_SECONDS = float(os.getenv("PLUGIN_BREAKER_OPEN_SECONDS", 30))  # 熔断后多久进入半开状态
+BREAKER_HEALTH_FAILURES = int(os.getenv("PLUGIN_BREAKER_HEALTH_FAILURES", 2))  # 健康检查连续失败几次后熔断
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+logger = setup_logger("plugin_health")
+
+circuit_breakers = {}  # 插件名 -> CircuitBreaker，只在调度循环中修改
+_next_checks = {}  # 插件名 -> 下次健康检查时间（事件循环时间）
+_monitor_task = None
+
+
+class PluginCircuitOpenError(PluginOverloadedError):
+    """插件已熔断，调用被直接拒绝（503）"""
+
+    def __init__(self, message, retry_after=1):
+        super().__init__(message, 503, retry_after)
+
+
+class CircuitBreaker:
+    """
+    closed：正常放行，最近 window 次调用的失败率达到阈值或健康检查连续失败时熔断；
+    open：直接拒绝，open_seconds 后（或健康检查恢复后）进入 half_open；
+    half_open：只放行一个探测调用，成功则恢复，失败则重新熔断。
+    """
+
+    def __init__(self, name, window=BREAKER_WINDOW, min_calls=BREAKER_MIN_CALLS, failure_rate=BREAKER_FAILURE_RATE,
+                 open_seconds=BREAKER_OPEN_SECONDS, health_failures=BREAKER_HEALTH_FAILURES):
+        self.name = name
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.open_seconds = open_seconds
+        self.health_failures = health_failures
+        self.state = CLOSED
+        self.reason = None
+        self.opened_at = None
+        self.opened = 0
+        self.rejected = 0
+        self.health_failure_streak = 0
+        self.last_health = None
+        self._outcomes = deque(maxlen=window)  # True 为成功
+        self._open_until = 0.0
+        self._probing = False
+
+    def acquire(self):
+        """放行时返回是否为半开状态下的探测调用；熔断中抛出 PluginCircuitOpenError"""
+        if self.state == OPEN and time.monotonic() >= self._open_until:
+            self._half_open()
+        if self.state == CLOSED:
+            return False
+        if self.state == HALF_OPEN and not self._probing:
+            self._probing = True
+            return True
+        self.rejected += 1
+        retry_after = max(1, math.ceil(self._open_until - time.monotonic()))
+        raise PluginCircuitOpenError(f"插件 {self.name} 已熔断：{self.reason}", retry_after)
+
+    def observe(self, status, probe=False):
+        """status 同 metrics.record_call：ok 计为成功，error / timeout 计为失败，其余不计入"""
+        if probe:
+            self._probing = False
+        if status not in ("ok", "error", "timeout"):
+            return
+        success = status == "ok"
+        if probe:
+            if success:
+                self._close()
+            else:
+                self._open(f"探测调用失败（{status}）")
+            return
+        if self.state != CLOSED:
+            return
+        self._outcomes.append(success)
+        if len(self._outcomes) >= self.min_calls:
+            failures = self._outcomes.count(False)
+            if failures >= self.failure_rate * len(self._outcomes):
+                self._open(f"最近 {len(self._outcomes)} 次调用失败 {failures} 次")
+
+    def observe_health(self, healthy, error=None, seconds=None):
+        self.last_health = {
+            "healthy": healthy,
+            "error": error,
+            "seconds": round(seconds, 3) if seconds is not None else None,
+            "checked_at": time.time(),
+        }
+        if healthy:
+            self.health_failure_streak = 0
+            # 健康检查已恢复时不必等满熔断时间，直接放行探测调用
+            if self.state == OPEN:
+                self._half_open()
+            return
+        self.health_failure_streak += 1
+        if self.state == HALF_OPEN or (self.state == CLOSED and self.health_failure_streak >= self.health_failures):
+            self._open(f"健康检查连续失败 {self.health_failure_streak} 次：{error}")
+
+    def _open(self, reason):
+        self.state = OPEN
+        self.reason = reason
+        self.opened_at = time.time()
+        self.opened += 1
+        self._open_until = time.monotonic() + self.open_seconds
+        self._outcomes.clear()
+        logger.warning(f"插件 {self.name} 熔断：{reason}，{self.open_seconds}s 后尝试恢复")
+
+    def _half_open(self):
+        self.state = HALF_OPEN
+        self._probing = False
+        logger.info(f"插件 {self.name} 熔断进入半开状态，放行探测调用")
+
+    def _close(self):
+        self.state = CLOSED
+        self.reason = None
+        self.opened_at = None
+        self.health_failure_streak = 0
+        self._outcomes.clear()
+        logger.info(f"插件 {self.name} 已从熔断中恢复")
+
+    def stats(self):
+        failures = self._outcomes.count(False)
+        return {
+            "state": self.state,
+            "reason": self.reason,
+            "opened_at": self.opened_at,
+            "opened": self.opened,
+            "rejected": self.rejected,
+            "recent_calls": len(self._outcomes),
+            "recent_failures": failures,
+            "health_failure_streak": self.health_failure_streak,
+            "last_health_check": self.last_health,
+        }
+
+
+def configure_circuit_breaker(name, manifest=None):
+    """按 manifest.json 的 circuit_breaker 字段创建熔断器，并确保健康检查巡检已启动（调度循环内调用）"""
+    config = (manifest or {}).get("circuit_breaker", {})
+    breaker = CircuitBreaker(
+        name,
+        window=int(config.get("window", BREAKER_WINDOW)),
+        min_calls=int(config.get("min_calls", BREAKER_MIN_CALLS)),
+        failure_rate=float(config.get("failure_rate", BREAKER_FAILURE_RATE)),
+        open_seconds=float(config.get("open_seconds", BREAKER_OPEN_SECONDS)),
+        health_failures=int(config.get("health_failures", BREAKER_HEALTH_FAILURES)),
+    )
+    circuit_breakers[name] = breaker
+    _next_checks.pop(name, None)
+    start_health_monitor()
+    return breaker
+
+
+def remove_circuit_breaker(name):
+    circuit_breakers.pop(name, None)
+    _next_checks.pop(name, None)
+
+
+def get_circuit_breaker(name):
+    return circuit_breakers.get(name)
+
+
+def get_health_state(name):
+    breaker = circuit_breakers.get(name)
+    return breaker.stats() if breaker else None
+
+
+async def _check(pool, breaker):
+    stats = pool.stats()
+    if stats["idle"] == 0 and stats["size"] >= stats["max_workers"]:
+        # 工作进程全部忙碌时不占用名额；卡住的调用会以超时计入熔断器
+        return
+    started = time.perf_counter()
+    try:
+        output = await pool.call("health_check", {}, HEALTH_TIMEOUT)
+    except PluginPoolClosedError:
+        return
+    except TimeoutError:
+        healthy, error = False, f"健康检查超时（{HEALTH_TIMEOUT}s）"
+    except Exception as e:
+        healthy, error = False, str(e)
+    else:
+        error = output.get("error")
+        healthy = error is None and bool(output.get("result"))
+        if not healthy and error is None:
+            error = "health_check 返回 False"
+    inc("plugin_health_checks_total", (("plugin", pool.name), ("result", "ok" if healthy else "fail")))
+    # 检查期间插件可能已停用或切换了版本
+    if circuit_breakers.get(pool.name) is breaker:
+        breaker.observe_health(healthy, error, time.perf_counter() - started)
+
+
+async def _monitor():
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(HEALTH_BATCH)
+
+    async def check(pool, breaker):
+        async with semaphore:
+            try:
+                await _check(pool, breaker)
+            except Exception:
+                logger.exception(f"插件 {pool.name} 健康检查失败")
+
+    while True:
+        await asyncio.sleep(HEALTH_TICK)
+        now = loop.time()
+        due = []
+        for name, breaker in list(circuit_breakers.items()):
+            pool = worker_pools.get(name)
+            if pool is None:
+                continue
+            # 首次检查时间在一个间隔内随机分布，之后每次间隔随机浮动
+            next_at = _next_checks.setdefault(name, now + random.uniform(0, HEALTH_INTERVAL))
+            if next_at <= now:
+                _next_checks[name] = now + HEALTH_INTERVAL * random.uniform(1 - HEALTH_JITTER, 1 + HEALTH_JITTER)
+                due.append(check(pool, breaker))
+        if due:
+            await asyncio.gather(*due)
+
+
+def start_health_monitor():
+    """在调度循环中启动健康检查巡检（重复调用无副作用）"""
+    global _monitor_task
+    if HEALTH_INTERVAL <= 0:
+        return
+    if _monitor_task is None or _monitor_task.done():
+        _monitor_task = asyncio.get_running_loop().create_task(_monitor())
+        logger.info(f"插件健康检查巡检已启动，间隔 {HEALTH_INTERVAL}s（±{HEALTH_JITTER:.0%}）")
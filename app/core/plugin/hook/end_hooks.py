@@ -4,23 +4,45 @@ Date: 2025-07-30
 Description: 插件关闭钩子。
 """
 import atexit
+import time
 from multiprocessing import Process
 from app.utils.log_utils import setup_logger
 
 logger = setup_logger("plugin_shutdown")
 
-_running_processes = []
+SHUTDOWN_GRACE = 5  # 发送 SIGTERM 后等待子进程退出的时间（秒），超时则 SIGKILL
+
+_running_processes = {}  # pid -> 进程，只保存尚未回收的子进程
 
 def add_process(p: Process):
-    _running_processes.append(p)
+    _running_processes[p.pid] = p
     logger.debug(f"已添加子进程 {p.pid} 到管理列表")
 
+def remove_process(p: Process):
+    if _running_processes.get(p.pid) is p:
+        del _running_processes[p.pid]
+
+def reap_processes():
+    """回收已退出的子进程并移出管理列表"""
+    for pid, p in list(_running_processes.items()):
+        if not p.is_alive():
+            p.join(0)
+            _running_processes.pop(pid, None)
+
 def cleanup_processes():
     logger.info("应用关闭中，开始清理子进程...")
-    for p in _running_processes:
+    processes = [p for p in list(_running_processes.values()) if p.is_alive()]
+    for p in processes:
+        logger.warning(f"[清理] 正在终止子进程 {p.pid}")
+        p.terminate()
+    deadline = time.monotonic() + SHUTDOWN_GRACE
+    for p in processes:
+        p.join(max(0, deadline - time.monotonic()))
         if p.is_alive():
-            logger.warning(f"[清理] 正在终止子进程 {p.pid}")
-            p.terminate()
+            logger.warning(f"[清理] 子进程 {p.pid} 未响应 SIGTERM，强制结束")
+            p.kill()
+            p.join(1)
+    _running_processes.clear()
     logger.info("子进程清理完毕")
 
 atexit.register(cleanup_processes)
@@ -3,29 +3,106 @@ Author: SmileSion
 Date: 2025-07-30
 Description: 插件启动钩子。
 """
+import asyncio
+import os
+
 from sqlalchemy.orm import Session
 from app.db.database import SessionLocal
 from app.db.models import PluginInfo, PluginStatus
-from app.core.plugin.plugin_loader import enable_plugin
+from app.core.plugin.dependency_builder import needs_install, submit_install
+from app.core.plugin.dispatcher import run_sync
+from app.core.plugin.plugin_loader import enable_plugin, enable_plugin_async, set_plugin_state
+from app.core.plugin.plugin_registry import load_registry
+from app.core.plugin.profiler import load_profiles
+from app.utils.file_utils import get_plugin_folder
 from app.utils.log_utils import setup_logger
 
 logger = setup_logger("plugin_startup")
 
+# serial：逐个加载；parallel：并发加载；lazy：只登记，首次调用时再加载
+STARTUP_MODE = os.getenv("PLUGIN_STARTUP_MODE", "serial")
+STARTUP_WORKERS = int(os.getenv("PLUGIN_STARTUP_WORKERS", 4))  # 并发加载的插件数上限
+STARTUP_TIMEOUT = float(os.getenv("PLUGIN_STARTUP_TIMEOUT", 60))  # 单个插件加载超时（秒）
+
+startup_state = {"mode": STARTUP_MODE, "complete": False}
+
+
+def _enable_after_install(name, entry_path):
+    try:
+        enable_plugin(entry_path, name)
+        logger.info(f"插件 {name} 依赖安装完成后启动加载成功")
+    except Exception as e:
+        logger.exception(f"插件 {name} 依赖安装完成后启动加载失败: {e}")
+
+
+def _restore_installs(plugins):
+    """
+    按依赖安装目录的 READY 标记恢复安装状态，上次运行未完成的安装重新排队；
+    返回依赖已就绪、可以立即加载的已启用插件，其余已启用插件在安装完成后加载
+    """
+    ready = []
+    for p in plugins:
+        folder = get_plugin_folder(p.entry_path)
+        enabled = p.status == PluginStatus.ENABLED
+        if not needs_install(p.name, folder):
+            submit_install(p.name, folder)
+            if enabled:
+                ready.append(p)
+            continue
+        logger.info(f"插件 {p.name} 依赖未安装完成，重新排队安装")
+        on_ready = None
+        if enabled and STARTUP_MODE != "lazy":
+            on_ready = lambda p=p: _enable_after_install(p.name, p.entry_path)
+        submit_install(p.name, folder, on_ready=on_ready)
+    return ready
+
+
+def _load_serial(plugins):
+    for p in plugins:
+        try:
+            enable_plugin(p.entry_path, p.name)
+            logger.info(f"插件 {p.name} 启动加载成功")
+        except Exception as e:
+            logger.exception(f"插件 {p.name} 启动加载失败: {e}")
+
+
+async def _load_parallel(plugins):
+    semaphore = asyncio.Semaphore(STARTUP_WORKERS)
+
+    async def load_one(p):
+        async with semaphore:
+            try:
+                await asyncio.wait_for(enable_plugin_async(p.entry_path, p.name), STARTUP_TIMEOUT)
+                logger.info(f"插件 {p.name} 启动加载成功")
+            except asyncio.TimeoutError:
+                set_plugin_state(p.name, "timeout")
+                logger.error(f"插件 {p.name} 启动加载超时（{STARTUP_TIMEOUT}s），将在首次调用时重试")
+            except Exception as e:
+                logger.exception(f"插件 {p.name} 启动加载失败: {e}")
+
+    await asyncio.gather(*(load_one(p) for p in plugins))
+
+
 def register_startup_event(app):
     @app.on_event("startup")
     def load_enabled_plugins():
         db: Session = SessionLocal()
-        logger.info("应用启动，开始加载已启用插件...")
+        logger.info(f"应用启动，开始加载已启用插件（模式：{STARTUP_MODE}）...")
         try:
-            plugins = db.query(PluginInfo).filter(PluginInfo.status == PluginStatus.ENABLED).all()
+            load_registry(db)
+            load_profiles()
+            plugins = _restore_installs(db.query(PluginInfo).all())
             if not plugins:
                 logger.info("未发现启用状态的插件，跳过加载")
-            for p in plugins:
-                try:
-                    enable_plugin(p.entry_path, p.name)
-                    logger.info(f"插件 {p.name} 启动加载成功")
-                except Exception as e:
-                    logger.exception(f"插件 {p.name} 启动加载失败: {e}")
+            if STARTUP_MODE == "lazy":
+                for p in plugins:
+                    set_plugin_state(p.name, "registered")
+                logger.info(f"懒加载模式，已登记 {len(plugins)} 个插件")
+            elif STARTUP_MODE == "parallel":
+                run_sync(_load_parallel(plugins))
+            else:
+                _load_serial(plugins)
         finally:
             db.close()
+            startup_state["complete"] = True
             logger.info("插件加载流程完成，数据库连接关闭")
@@ -0,0 +1,179 @@
+"""
+Author: SmileSion
+Date: 2026-10-18
+Description: 长耗时插件调用的异步任务与优先级调度。
+"""
+import asyncio
+import os
+import time
+import uuid
+from collections import OrderedDict, deque
+
+from app.core.plugin.admission import PluginOverloadedError
+from app.core.plugin.plugin_loader import dispatch_plugin_call
+from app.utils.log_utils import setup_logger
+
+JOB_PRIORITIES = ("high", "normal", "low")  # 严格按优先级出队，同一优先级内按插件轮转
+JOB_RUNNERS = int(os.getenv("PLUGIN_JOB_RUNNERS", 8))  # 同时执行的任务数
+JOB_RESULT_TTL = float(os.getenv("PLUGIN_JOB_RESULT_TTL", 3600))  # 已结束任务的保留时间（秒）
+JOB_MAX_QUEUED = int(os.getenv("PLUGIN_JOB_MAX_QUEUED", 1000))  # 排队任务数上限，超出时拒绝提交
+JOB_RETRY_AFTER = 5
+JOB_SWEEP_INTERVAL = 60
+
+logger = setup_logger("plugin_job_scheduler")
+
+
+class PluginJob:
+    def __init__(self, plugin, entry_path, method, args, priority, timeout):
+        self.id = uuid.uuid4().hex
+        self.plugin = plugin
+        self.entry_path = entry_path
+        self.method = method
+        self.args = args
+        self.priority = priority
+        self.timeout = timeout
+        self.status = "queued"  # queued / running / succeeded / failed / cancelled
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.task = None
+        self.done = asyncio.Event()
+
+    def finish(self, status, result=None, error=None):
+        self.status = status
+        self.result = result
+        self.error = error
+        self.finished_at = time.time()
+        self.done.set()
+
+    def to_dict(self):
+        data = {
+            "job_id": self.id,
+            "plugin": self.plugin,
+            "method": self.method,
+            "priority": self.priority,
+            "status": self.status,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+        if self.status == "succeeded":
+            data["result"] = self.result
+        if self.error is not None:
+            data["error"] = self.error
+        return data
+
+
+class JobScheduler:
+    """任务调度器，所有方法都在调度事件循环中调用"""
+
+    def __init__(self, runners=JOB_RUNNERS, max_queued=JOB_MAX_QUEUED):
+        self.runners = runners
+        self.max_queued = max_queued
+        self.queued = 0
+        self.jobs = {}
+        # 优先级 -> 插件名 -> 排队任务；插件按 OrderedDict 顺序轮转实现公平共享
+        self._queues = {priority: OrderedDict() for priority in JOB_PRIORITIES}
+        self._wakeup = None
+        self._tasks = []
+
+    def _ensure_started(self):
+        if self._tasks:
+            return
+        self._wakeup = asyncio.Condition()
+        self._tasks = [asyncio.ensure_future(self._run()) for _ in range(self.runners)]
+        self._tasks.append(asyncio.ensure_future(self._sweep()))
+        logger.info(f"任务调度器已启动，执行槽位：{self.runners}")
+
+    async def submit(self, plugin, entry_path, method, args, priority="normal", timeout=3600):
+        if self.queued >= self.max_queued:
+            logger.warning("任务队列已满（%d），拒绝提交：%s.%s", self.max_queued, plugin, method)
+            raise PluginOverloadedError(f"任务队列已满（{self.max_queued}）", 429, JOB_RETRY_AFTER)
+        self._ensure_started()
+        job = PluginJob(plugin, entry_path, method, args, priority, timeout)
+        self.jobs[job.id] = job
+        self._queues[priority].setdefault(plugin, deque()).append(job)
+        self.queued += 1
+        async with self._wakeup:
+            self._wakeup.notify()
+        logger.info("任务已提交：%s %s.%s（优先级 %s）", job.id, plugin, method, priority)
+        return job
+
+    def _next_job(self):
+        for priority in JOB_PRIORITIES:
+            queues = self._queues[priority]
+            while queues:
+                plugin, queue = next(iter(queues.items()))
+                job = queue.popleft()
+                if queue:
+                    queues.move_to_end(plugin)  # 该插件排到本优先级末尾，其他插件先行
+                else:
+                    del queues[plugin]
+                if job.status == "queued":
+                    self.queued -= 1
+                    return job
+        return None
+
+    async def _run(self):
+        while True:
+            async with self._wakeup:
+                job = self._next_job()
+                while job is None:
+                    await self._wakeup.wait()
+                    job = self._next_job()
+            job.status = "running"
+            job.started_at = time.time()
+            job.task = asyncio.ensure_future(
+                dispatch_plugin_call(job.plugin, job.entry_path, job.method, job.args, job.timeout, background=True)
+            )
+            try:
+                result = await job.task
+                job.finish("succeeded", result=result)
+                logger.info("任务执行成功：%s", job.id)
+            except asyncio.CancelledError:
+                if job.task.cancelled():
+                    job.finish("cancelled")
+                    logger.info("任务已取消：%s", job.id)
+                else:
+                    raise
+            except Exception as e:
+                job.finish("failed", error=str(e))
+                logger.warning("任务执行失败：%s，原因：%s", job.id, e)
+
+    async def _sweep(self):
+        while True:
+            await asyncio.sleep(JOB_SWEEP_INTERVAL)
+            expire_before = time.time() - JOB_RESULT_TTL
+            expired = [job_id for job_id, job in self.jobs.items()
+                       if job.finished_at is not None and job.finished_at < expire_before]
+            for job_id in expired:
+                del self.jobs[job_id]
+            if expired:
+                logger.info(f"清理过期任务 {len(expired)} 个")
+
+    async def wait(self, job_id, timeout):
+        job = self.jobs.get(job_id)
+        if job and timeout > 0 and not job.done.is_set():
+            try:
+                await asyncio.wait_for(job.done.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return job
+
+    def cancel(self, job_id):
+        job = self.jobs.get(job_id)
+        if not job:
+            return None
+        if job.status == "queued":
+            # 仍在队列中的任务直接标记为取消，出队时跳过
+            job.finish("cancelled")
+            self.queued -= 1
+            logger.info(f"任务已取消：{job_id}")
+        elif job.status == "running" and job.task:
+            job.task.cancel()
+        return job
+
+
+job_scheduler = JobScheduler()
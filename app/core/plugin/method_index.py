@@ -0,0 +1,158 @@
+"""
+Author: SmileSion
+Date: 2026-10-18
+Description: 插件方法签名索引与调用参数预校验。
+"""
+import inspect
+import typing
+from typing import Any
+
+from pydantic import ConfigDict, ValidationError, create_model
+
+from app.core.plugin.plugin_base import PluginBase
+from app.utils.log_utils import setup_logger
+
+logger = setup_logger("plugin_method_index")
+
+method_indexes = {}  # 插件名 -> {方法名: MethodSpec}
+RESERVED_METHODS = {"activate", "deactivate", "cancel_token", "check_cancelled"}  # 生命周期与调用辅助方法，不能通过接口调用
+
+
+class PluginArgumentError(ValueError):
+    """调用的方法不存在或参数不符合方法签名"""
+
+    def __init__(self, message, errors=None):
+        super().__init__(message)
+        self.errors = errors or []
+
+
+class MethodSpec:
+    """单个插件方法的签名信息及据此生成的 pydantic 参数模型"""
+
+    def __init__(self, name, func, args_model):
+        self.name = name
+        self.is_async = inspect.iscoroutinefunction(func)
+        self.parameters = []
+        self.args_model = args_model
+
+        for param in inspect.signature(func).parameters.values():
+            if param.kind in (param.VAR_POSITIONAL, param.VAR_KEYWORD):
+                continue
+            self.parameters.append({
+                "name": param.name,
+                "required": param.default is param.empty,
+                "default": None if param.default is param.empty else _describe_default(param.default),
+                "annotation": None if param.annotation is param.empty else _describe_annotation(param.annotation),
+            })
+
+    @property
+    def param_names(self):
+        return [p["name"] for p in self.parameters]
+
+    def to_dict(self):
+        return {"async": self.is_async, "parameters": self.parameters}
+
+
+def _describe_default(value):
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    return repr(value)
+
+
+def _describe_annotation(annotation):
+    if isinstance(annotation, str):
+        return annotation
+    if isinstance(annotation, type):
+        return annotation.__name__
+    return str(annotation).replace("typing.", "")
+
+
+def _build_args_model(plugin_name, method_name, func):
+    try:
+        hints = typing.get_type_hints(func)
+    except Exception:
+        hints = {}
+
+    fields = {}
+    accepts_extra = False
+    for param in inspect.signature(func).parameters.values():
+        if param.kind == param.VAR_KEYWORD:
+            accepts_extra = True
+            continue
+        if param.kind == param.VAR_POSITIONAL:
+            continue
+        annotation = hints.get(param.name, Any)
+        default = ... if param.default is param.empty else param.default
+        fields[param.name] = (annotation, default)
+
+    config = ConfigDict(extra="allow" if accepts_extra else "forbid", arbitrary_types_allowed=True)
+    model_name = f"{plugin_name}_{method_name}_Args"
+    try:
+        return create_model(model_name, __config__=config, **fields)
+    except Exception:
+        # 注解无法转换为 pydantic 类型时，退化为只校验参数名与必填项
+        logger.warning(f"插件方法 {plugin_name}.{method_name} 参数注解无法解析，仅校验参数名")
+    try:
+        loose_fields = {k: (Any, default) for k, (_, default) in fields.items()}
+        return create_model(model_name, __config__=config, **loose_fields)
+    except Exception:
+        logger.warning(f"插件方法 {plugin_name}.{method_name} 无法生成参数模型，跳过参数校验")
+        return None
+
+
+def _is_plugin_method(plugin, attr_name):
+    """PluginBase 定义的方法（如 health_check、get_metadata）只有被插件重写后才作为调用接口"""
+    if attr_name.startswith("_") or attr_name in RESERVED_METHODS:
+        return False  # 跳过私有和特殊方法
+    base_attr = inspect.getattr_static(PluginBase, attr_name, None)
+    return base_attr is None or inspect.getattr_static(type(plugin), attr_name, None) is not base_attr
+
+
+def build_method_index(plugin_name, plugin):
+    index = {}
+    for attr_name in dir(plugin):
+        if not _is_plugin_method(plugin, attr_name):
+            continue
+        attr = getattr(plugin, attr_name)
+        if not callable(attr):
+            continue
+        try:
+            args_model = _build_args_model(plugin_name, attr_name, attr)
+            index[attr_name] = MethodSpec(attr_name, attr, args_model)
+        except (TypeError, ValueError):
+            logger.warning(f"插件方法 {plugin_name}.{attr_name} 无法获取签名，跳过索引")
+    return index
+
+
+def register_method_index(name, plugin):
+    method_indexes[name] = build_method_index(name, plugin)
+    logger.info(f"插件 {name} 方法索引构建完成，共 {len(method_indexes[name])} 个方法")
+
+
+def remove_method_index(name):
+    method_indexes.pop(name, None)
+
+
+def get_method_index(name):
+    return method_indexes.get(name)
+
+
+def validate_call(name, method_name, args):
+    """在派发到工作进程前校验方法名与参数；插件尚无索引时只拒绝保留的方法名"""
+    if method_name in RESERVED_METHODS:
+        raise PluginArgumentError(f"插件 {name} 没有方法 {method_name}")
+    index = method_indexes.get(name)
+    if index is None:
+        return
+    spec = index.get(method_name)
+    if spec is None:
+        raise PluginArgumentError(f"插件 {name} 没有方法 {method_name}")
+    if spec.args_model is None:
+        return
+    try:
+        spec.args_model.model_validate(args)
+    except ValidationError as e:
+        raise PluginArgumentError(
+            f"插件 {name} 方法 {method_name} 参数校验失败",
+            e.errors(include_url=False, include_context=False, include_input=False),
+        )
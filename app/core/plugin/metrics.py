@@ -0,0 +1,148 @@
+"""
+Author: SmileSion
+Date: 2026-10-18
+Description: 插件调用指标采集与 Prometheus 文本格式输出。
+"""
+import bisect
+import threading
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216, 67108864)
+
+# 指标名 -> (类型, 说明)
+_DEFINITIONS = {
+    "plugin_calls_total": ("counter", "插件方法调用次数（含命中缓存与被拒绝的调用）"),
+    "plugin_call_errors_total": ("counter", "插件方法调用失败次数，reason 为 error / timeout / rejected"),
+    "plugin_call_timeouts_total": ("counter", "插件方法调用超时次数"),
+    "plugin_call_duration_seconds": ("histogram", "插件方法调用总耗时"),
+    "plugin_call_phase_seconds": ("histogram", "插件方法调用各阶段耗时：queue / spawn / execute / serialize"),
+    "plugin_payload_bytes": ("histogram", "工作进程调用的参数（request）与结果（response）序列化后大小"),
+    "plugin_load_phase_seconds": ("histogram", "插件加载各阶段耗时：import / activate / spawn / worker_import / worker_activate"),
+    "plugin_workers": ("gauge", "插件工作进程数，state 为 busy / idle"),
+    "plugin_workers_spawned_total": ("counter", "插件累计启动的工作进程数"),
+    "plugin_workers_recycled_total": ("counter", "插件累计回收的工作进程数"),
+    "plugin_admission_active": ("gauge", "插件正在执行的调用数"),
+    "plugin_admission_queued": ("gauge", "插件排队中的调用数"),
+    "plugin_cache_hits_total": ("counter", "结果缓存命中次数"),
+    "plugin_cache_misses_total": ("counter", "结果缓存未命中次数"),
+    "plugin_health_checks_total": ("counter", "健康检查次数，result 为 ok / fail"),
+    "plugin_circuit_state": ("gauge", "插件熔断器状态，当前状态（closed / open / half_open）为 1"),
+    "plugin_circuit_rejected_total": ("counter", "熔断期间被直接拒绝的调用次数"),
+}
+
+_counters = {}  # (指标名, 标签) -> 值
+_histograms = {}  # (指标名, 标签) -> _Histogram
+_lock = threading.Lock()  # 加载阶段的指标在线程池中记录，其余在调度循环中记录
+
+
+class _Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # 最后一项对应 +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+def inc(metric, labels, value=1):
+    """labels 为 ((标签名, 值), ...) 元组"""
+    key = (metric, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def observe(metric, labels, value, buckets=LATENCY_BUCKETS):
+    key = (metric, labels)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = _Histogram(buckets)
+        histogram.observe(value)
+
+
+def record_call(name, method_name, status, seconds, timing=None):
+    """
+    记录一次调用。status 为 ok / error / timeout / rejected / cache_hit；
+    timing 为工作进程调用的阶段耗时与数据大小，缓存命中、合并等待的调用没有该项。
+    """
+    labels = (("plugin", name), ("method", method_name))
+    inc("plugin_calls_total", labels)
+    if status in ("error", "timeout", "rejected"):
+        inc("plugin_call_errors_total", labels + (("reason", status),))
+    if status == "timeout":
+        inc("plugin_call_timeouts_total", labels)
+    observe("plugin_call_duration_seconds", labels, seconds)
+    if not timing:
+        return
+    for phase in ("queue", "spawn", "execute", "serialize"):
+        if phase in timing:
+            observe("plugin_call_phase_seconds", labels + (("phase", phase),), timing[phase])
+    for direction in ("request", "response"):
+        size = timing.get(f"{direction}_bytes")
+        if size is not None:
+            observe("plugin_payload_bytes", labels + (("direction", direction),), size, SIZE_BUCKETS)
+
+
+def record_load_phase(name, phase, seconds):
+    observe("plugin_load_phase_seconds", (("plugin", name), ("phase", phase)), seconds)
+
+
+def remove_plugin_metrics(name):
+    """插件卸载后删除其指标，避免标签无限增长"""
+    with _lock:
+        for registry in (_counters, _histograms):
+            for key in [key for key in registry if key[1][0] == ("plugin", name)]:
+                del registry[key]
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels) + "}"
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render_metrics(gauges=()):
+    """
+    按 Prometheus 文本格式（0.0.4）输出全部指标。
+    gauges 为输出时读取的当前状态 [(指标名, 标签, 值), ...]，如进程池规模与排队数。
+    """
+    with _lock:
+        counters = list(_counters.items())
+        histograms = [(key, list(h.counts), h.sum, h.count, h.buckets) for key, h in _histograms.items()]
+
+    samples = {}  # 指标名 -> 输出行
+    for (metric, labels), value in counters:
+        samples.setdefault(metric, []).append(f"{metric}{_format_labels(labels)} {_format_value(value)}")
+    for metric, labels, value in gauges:
+        samples.setdefault(metric, []).append(f"{metric}{_format_labels(labels)} {_format_value(value)}")
+    for (metric, labels), counts, total, count, buckets in histograms:
+        lines = samples.setdefault(metric, [])
+        cumulative = 0
+        for bound, bucket_count in zip((*buckets, "+Inf"), counts):
+            cumulative += bucket_count
+            lines.append(f"{metric}_bucket{_format_labels(labels + (('le', bound),))} {cumulative}")
+        lines.append(f"{metric}_sum{_format_labels(labels)} {_format_value(total)}")
+        lines.append(f"{metric}_count{_format_labels(labels)} {count}")
+
+    output = []
+    for metric, (kind, description) in _DEFINITIONS.items():
+        if metric not in samples:
+            continue
+        output.append(f"# HELP {metric} {description}")
+        output.append(f"# TYPE {metric} {kind}")
+        output.extend(samples[metric])
+    return "\n".join(output) + "\n"
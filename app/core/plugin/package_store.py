@@ -0,0 +1,245 @@
+"""
+Author: SmileSion
+Date: 2026-10-18
+Description: 插件包内容寻址存储，文件按 sha256 去重，各版本目录通过硬链接生成。
+"""
+import fnmatch
+import hashlib
+import json
+import os
+import shutil
+import stat
+import threading
+import uuid
+
+from app.utils.file_utils import (
+    MAX_EXTRACTED_SIZE,
+    PLUGIN_ROOT,
+    READ_CHUNK_SIZE,
+    PluginPackage,
+    PluginPackageError,
+    PluginPackageTooLarge,
+)
+from app.utils.log_utils import setup_logger
+
+STORE_ROOT = os.path.abspath(os.getenv("PLUGIN_STORE_ROOT", "plugin_store"))  # 内容寻址存储目录
+BLOBS_DIR = os.path.join(STORE_ROOT, "blobs")  # blobs/<sha256 前两位>/<sha256>，只读
+PACKAGES_DIR = os.path.join(STORE_ROOT, "packages")  # packages/<插件包 sha256>.json，包内路径 -> 文件 sha256
+REFS_DIR = os.path.join(STORE_ROOT, "refs")  # refs/<插件名>，当前版本的内容哈希
+TMP_DIR = os.path.join(STORE_ROOT, "tmp")
+STAGING_DIR = os.path.join(PLUGIN_ROOT, ".staging")  # 插件目录的生成位置，插件名不能以 . 开头，不会与插件目录重名
+WRITE_BUFFER_SIZE = 1024 * 1024
+
+logger = setup_logger("plugin_store")
+
+# 写入与垃圾回收互斥：刚写入、尚未登记到 refs 的插件包记录不能被回收
+_store_lock = threading.Lock()
+
+
+def _blob_path(digest):
+    return os.path.join(BLOBS_DIR, digest[:2], digest)
+
+
+def _tree_hash(files):
+    """插件内容哈希：只由包内路径与文件内容决定，与压缩方式、时间戳无关"""
+    data = json.dumps(sorted(files.items()), separators=(",", ":"))
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+def _write_blob(src, written):
+    """边读边计算 sha256 写入临时文件，存储中已有相同内容时丢弃临时文件"""
+    digest = hashlib.sha256()
+    tmp_path = os.path.join(TMP_DIR, uuid.uuid4().hex)
+    try:
+        with open(tmp_path, "wb", buffering=WRITE_BUFFER_SIZE) as dst:
+            while chunk := src.read(READ_CHUNK_SIZE):
+                written += len(chunk)
+                if written > MAX_EXTRACTED_SIZE:
+                    raise PluginPackageTooLarge("插件包解压后大小超过限制")
+                digest.update(chunk)
+                dst.write(chunk)
+        blob_path = _blob_path(digest.hexdigest())
+        if os.path.exists(blob_path):
+            os.remove(tmp_path)
+            return digest.hexdigest(), written, False
+        os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+        # 只读：硬链接共享 inode，插件改写自身文件会影响其他版本；需要改写的文件见 _is_writable
+        os.chmod(tmp_path, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+        os.replace(tmp_path, blob_path)
+        return digest.hexdigest(), written, True
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _load_record(package_sha):
+    path = os.path.join(PACKAGES_DIR, f"{package_sha}.json")
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        record = json.load(f)
+    # 文件被垃圾回收后需要重新从插件包写入
+    if not all(os.path.exists(_blob_path(digest)) for digest in record["files"].values()):
+        return None
+    return record
+
+
+def _ingest(package: PluginPackage):
+    record = _load_record(package.sha256)
+    if record:
+        logger.info(f"插件包 {package.sha256[:12]} 已在存储中，跳过解压")
+        return record
+
+    os.makedirs(TMP_DIR, exist_ok=True)
+    os.makedirs(PACKAGES_DIR, exist_ok=True)
+    files = {}
+    written = 0
+    new_blobs = 0
+    for relative_path, src in package.members():
+        files[relative_path], written, created = _write_blob(src, written)
+        new_blobs += created
+    record = {"tree": _tree_hash(files), "files": files}
+    record_path = os.path.join(PACKAGES_DIR, f"{package.sha256}.json")
+    with open(f"{record_path}.tmp", "w", encoding="utf-8") as f:
+        json.dump(record, f)
+    os.replace(f"{record_path}.tmp", record_path)
+    logger.info(f"插件 {package.name} 写入存储：{len(files)} 个文件，新增 {new_blobs} 个")
+    return record
+
+
+def ingest_package(package: PluginPackage):
+    """把插件包内容写入存储（已有的文件不重复写入），返回 {"tree": 内容哈希, "files": 路径 -> 文件哈希}"""
+    with _store_lock:
+        return _ingest(package)
+
+
+def _link_or_copy(source, target):
+    try:
+        os.link(source, target)
+    except OSError:
+        # 跨文件系统或不支持硬链接时退化为复制
+        shutil.copyfile(source, target)
+
+
+def _is_writable(relative_path, patterns):
+    """manifest.json 的 writable 字段（glob 列表）匹配的文件复制生成，插件可以改写"""
+    return any(fnmatch.fnmatchcase(relative_path, pattern) for pattern in patterns)
+
+
+def materialize_package(package: PluginPackage, dest_folder):
+    """
+    通过硬链接在 dest_folder 生成插件目录，先在 plugins/.staging 下的临时目录中生成再整体重命名。
+    硬链接的文件只读，manifest.json 的 writable 字段列出的文件改为复制。
+    返回 (补充了 entry_path 的 manifest, 内容哈希)。
+    """
+    dest_folder = os.path.abspath(dest_folder)
+    # 生成前会删除已有的同名目录，只允许 plugins 下的子目录
+    if dest_folder == PLUGIN_ROOT or os.path.commonpath([dest_folder, PLUGIN_ROOT]) != PLUGIN_ROOT:
+        raise PluginPackageError(f"插件目录不在 {PLUGIN_ROOT} 下：{dest_folder}")
+    partial_folder = os.path.join(STAGING_DIR, uuid.uuid4().hex)
+    with _store_lock:
+        record = _ingest(package)
+        writable = package.manifest.get("writable", [])
+        try:
+            for relative_path, digest in record["files"].items():
+                target = os.path.join(partial_folder, *relative_path.split("/"))
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                if _is_writable(relative_path, writable):
+                    shutil.copyfile(_blob_path(digest), target)
+                else:
+                    _link_or_copy(_blob_path(digest), target)
+            if os.path.exists(dest_folder):
+                shutil.rmtree(dest_folder)
+            os.replace(partial_folder, dest_folder)
+        except BaseException:
+            shutil.rmtree(partial_folder, ignore_errors=True)
+            raise
+        finally:
+            try:
+                os.rmdir(STAGING_DIR)  # 只在为空时删除，plugins 下不留多余目录
+            except OSError:
+                pass
+    logger.info(f"插件 {package.name} 生成目录：{dest_folder}")
+    manifest = dict(package.manifest)
+    manifest["entry_path"] = os.path.join(dest_folder, manifest.get("entry", "plugin.py"))
+    return manifest, record["tree"]
+
+
+def find_package_tree(package_sha):
+    """插件包已写入过存储时返回其内容哈希，不读取插件包"""
+    record = _load_record(package_sha)
+    return record["tree"] if record else None
+
+
+def get_plugin_ref(name):
+    path = os.path.join(REFS_DIR, name)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read().strip() or None
+
+
+def set_plugin_ref(name, tree):
+    os.makedirs(REFS_DIR, exist_ok=True)
+    path = os.path.join(REFS_DIR, name)
+    with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+        f.write(tree)
+    os.replace(f"{path}.tmp", path)
+
+
+def remove_plugin_ref(name):
+    path = os.path.join(REFS_DIR, name)
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def _referenced_trees():
+    if not os.path.isdir(REFS_DIR):
+        return set()
+    trees = set()
+    for name in os.listdir(REFS_DIR):
+        if not name.endswith(".tmp"):
+            tree = get_plugin_ref(name)
+            if tree:
+                trees.add(tree)
+    return trees
+
+
+def collect_garbage():
+    """
+    按存储自身的记录回收：refs 中当前版本的内容哈希对应的插件包记录保留，其余记录删除，
+    不被保留的记录引用的文件一并删除。插件目录中的文件是硬链接或副本，删除存储中的文件不影响已生成的目录。
+    """
+    removed_blobs = 0
+    freed_bytes = 0
+    removed_packages = 0
+    with _store_lock:
+        shutil.rmtree(TMP_DIR, ignore_errors=True)
+        shutil.rmtree(STAGING_DIR, ignore_errors=True)
+        trees = _referenced_trees()
+        live_blobs = set()
+        if os.path.isdir(PACKAGES_DIR):
+            for filename in os.listdir(PACKAGES_DIR):
+                if not filename.endswith(".json"):
+                    continue
+                record = _load_record(filename[:-5])
+                if record is not None and record["tree"] in trees:
+                    live_blobs.update(record["files"].values())
+                else:
+                    os.remove(os.path.join(PACKAGES_DIR, filename))
+                    removed_packages += 1
+        if os.path.isdir(BLOBS_DIR):
+            for prefix in os.listdir(BLOBS_DIR):
+                prefix_dir = os.path.join(BLOBS_DIR, prefix)
+                for digest in os.listdir(prefix_dir):
+                    if digest in live_blobs:
+                        continue
+                    blob_path = os.path.join(prefix_dir, digest)
+                    freed_bytes += os.stat(blob_path).st_size
+                    os.remove(blob_path)
+                    removed_blobs += 1
+                if not os.listdir(prefix_dir):
+                    os.rmdir(prefix_dir)
+    logger.info(f"存储垃圾回收完成：删除 {removed_blobs} 个文件（{freed_bytes} 字节），{removed_packages} 个插件包记录")
+    return {"blobs_removed": removed_blobs, "bytes_freed": freed_bytes, "packages_removed": removed_packages}
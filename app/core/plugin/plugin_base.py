@@ -3,8 +3,62 @@ Author: SmileSion
 Date: 2025-07-30
 Description: 插件基本实现。
 """
+import time
 from abc import ABC, abstractmethod
 
+
+def cacheable(ttl=60, max_entries=128):
+    """标记纯函数方法（相同参数返回相同结果），调度器会按参数缓存其返回值"""
+    def decorator(func):
+        func.__plugin_cache__ = {"ttl": ttl, "max_entries": max_entries}
+        return func
+    return decorator
+
+
+def idempotent(func):
+    """标记幂等方法（重复执行没有额外副作用），参数相同的并发调用会合并为一次执行"""
+    func.__plugin_idempotent__ = True
+    return func
+
+
+class PluginCancelledError(Exception):
+    """调用已被取消（客户端断开、超过截止时间或任务被取消），插件据此提前结束执行"""
+
+
+class CancellationToken:
+    """单次调用的取消标记；deadline 为 time.monotonic() 时间，超过后同样视为已取消"""
+    __slots__ = ("deadline", "_cancelled")
+
+    def __init__(self, deadline=None):
+        self.deadline = deadline
+        self._cancelled = False
+
+    @property
+    def cancelled(self):
+        return self._cancelled or (self.deadline is not None and time.monotonic() >= self.deadline)
+
+    def remaining(self):
+        """距截止时间的秒数，没有截止时间时返回 None"""
+        return None if self.deadline is None else max(self.deadline - time.monotonic(), 0.0)
+
+    def cancel(self):
+        self._cancelled = True
+
+    def raise_if_cancelled(self):
+        if self.cancelled:
+            raise PluginCancelledError("插件调用已取消")
+
+
+_NO_CANCEL = CancellationToken()
+_current_token = _NO_CANCEL  # 工作进程一次只执行一个调用，主进程内的调用不会被取消
+
+
+def set_cancel_token(token=None):
+    """工作进程开始、结束一次调用时设置当前调用的取消标记"""
+    global _current_token
+    _current_token = token or _NO_CANCEL
+
+
 class PluginBase(ABC):
     @abstractmethod
     def activate(self):
@@ -16,6 +70,15 @@ class PluginBase(ABC):
         """插件卸载前执行的清理逻辑"""
         pass
     
+    @property
+    def cancel_token(self) -> CancellationToken:
+        """当前调用的取消标记，耗时较长的方法可以定期检查 cancel_token.cancelled 或调用 check_cancelled()"""
+        return _current_token
+
+    def check_cancelled(self):
+        """当前调用已被取消时抛出 PluginCancelledError"""
+        _current_token.raise_if_cancelled()
+
     def health_check(self):
         """用于检测插件运行状态"""
         return True
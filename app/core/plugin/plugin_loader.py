@@ -5,36 +5,77 @@ Description: 插件加载模块。
 """
 import os
 import sys
+import time
+import asyncio
 import importlib.util
-from multiprocessing import Process, Queue
+import inspect
 
+from app.core.plugin.admission import PluginOverloadedError, admit, configure_plugin_limits, remove_plugin_limits
+from app.core.plugin.dependency_builder import expose_plugin_env
+from app.core.plugin.dispatcher import run_async, run_sync
+from app.core.plugin.health_monitor import configure_circuit_breaker, get_circuit_breaker, remove_circuit_breaker
+from app.core.plugin.method_index import register_method_index, remove_method_index
+from app.core.plugin.metrics import record_call, record_load_phase
 from app.core.plugin.plugin_base import PluginBase
-from app.core.plugin.hook.end_hooks import add_process
+from app.core.plugin.profiler import profile_options, save_profile
+from app.core.plugin.result_cache import (
+    collect_cache_policies,
+    collect_coalesced_methods,
+    configure_result_cache,
+    get_result_cache,
+    invalidate_result_cache,
+    make_call_key,
+)
+from app.core.plugin.worker_pool import (
+    PluginPoolClosedError,
+    create_worker_pool,
+    get_worker_pool,
+    replace_worker_pool,
+    shutdown_worker_pool,
+    start_worker_pool,
+    stop_worker_pool,
+)
+from app.utils.file_utils import PLUGIN_ROOT, get_plugin_folder, read_plugin_manifest
 from app.utils.log_utils import setup_logger
 
-PLUGIN_ROOT = os.path.abspath("plugins")
+UPDATE_HEALTH_TIMEOUT = 30  # 新版本工作进程健康检查的超时时间（秒）
+UPDATE_DRAIN_TIMEOUT = float(os.getenv("PLUGIN_UPDATE_DRAIN_TIMEOUT", 300))  # 等待旧版本进行中调用结束的最长时间（秒）
+DEFAULT_CALL_TIMEOUT = float(os.getenv("PLUGIN_CALL_TIMEOUT", 100))  # 未指定超时的调用的截止时间（秒），含排队与执行
 loaded_plugins = {}
+plugin_states = {}  # 插件名 -> 加载状态（registered / loading / warm / failed / timeout）
+_pool_init_locks = {}
+_inflight_calls = {}  # 调用键 -> _InflightCall，仅在调度循环中访问
+coalesce_policies = {}  # 插件名 -> 合并并发调用的方法名集合，True 表示所有方法
 logger = setup_logger("plugin_loader")
 
 
-def load_plugin(entry_path, name):
+def _check_entry_path(entry_path):
     entry_path = os.path.abspath(entry_path)
-    logger.info(f"开始加载插件 {name}，路径：{entry_path}")
-
     if not entry_path.startswith(PLUGIN_ROOT + os.sep):
         logger.error(f"尝试加载非法路径的插件：{entry_path}")
         raise ValueError(f"禁止加载插件目录之外的文件：{entry_path}")
+    return entry_path
+
+
+def _import_plugin(entry_path, name):
+    """导入插件模块并实例化 Plugin 类，不登记到 loaded_plugins"""
+    entry_path = os.path.abspath(entry_path)
+    logger.info(f"开始加载插件 {name}，路径：{entry_path}")
+    _check_entry_path(entry_path)
 
     plugin_dir = os.path.dirname(entry_path)
     if plugin_dir not in sys.path:
         sys.path.insert(0, plugin_dir)
         logger.debug(f"将插件目录加入 sys.path：{plugin_dir}")
+    expose_plugin_env(name, get_plugin_folder(entry_path))
 
     try:
+        started = time.perf_counter()
         spec = importlib.util.spec_from_file_location(name, entry_path)
         mod = importlib.util.module_from_spec(spec)
         sys.modules[name] = mod
         spec.loader.exec_module(mod)
+        record_load_phase(name, "import", time.perf_counter() - started)
         logger.info(f"模块 {name} 加载成功")
     except Exception as e:
         logger.exception(f"插件 {name} 模块加载失败")
@@ -42,35 +83,240 @@ def load_plugin(entry_path, name):
 
     plugin_class = getattr(mod, "Plugin", None)
     if plugin_class and issubclass(plugin_class, PluginBase):
-        plugin = plugin_class()
-        loaded_plugins[name] = plugin
-        logger.info(f"插件 {name} 实例化并缓存成功")
-        return plugin
+        return plugin_class()
 
     logger.error(f"插件 {name} 未找到 Plugin 类或未继承 PluginBase")
     raise ValueError("未找到 Plugin 类或未继承 PluginBase")
 
 
-def enable_plugin(entry_path, name):
-    logger.info(f"启用插件 {name}")
+def load_plugin(entry_path, name):
+    plugin = _import_plugin(entry_path, name)
+    loaded_plugins[name] = plugin
+    register_method_index(name, plugin)
+    logger.info(f"插件 {name} 实例化并缓存成功")
+    return plugin
+
+
+def _run_lifecycle(hook):
+    """执行 activate / deactivate，协程形式的生命周期方法交给调度循环等待"""
+    result = hook()
+    if inspect.isawaitable(result):
+        run_sync(result)
+
+
+def set_plugin_state(name, state, **detail):
+    plugin_states[name] = {"state": state, **detail}
+
+
+def _activate(name, plugin):
+    """执行 activate 并记录耗时；协程形式的 activate 由 _await_activation 等待并记录"""
+    started = time.perf_counter()
+    activation = plugin.activate()
+    if not inspect.isawaitable(activation):
+        record_load_phase(name, "activate", time.perf_counter() - started)
+    return activation
+
+
+async def _await_activation(name, activation):
+    if inspect.isawaitable(activation):
+        started = time.perf_counter()
+        await activation
+        record_load_phase(name, "activate", time.perf_counter() - started)
+
+
+def _load_and_activate(entry_path, name):
     plugin = load_plugin(entry_path, name)
-    plugin.activate()
-    logger.info(f"插件 {name} 激活完成")
+    return plugin, _activate(name, plugin)
+
+
+def _configure_call_policies(name, plugin, manifest):
+    """按插件声明配置结果缓存与并发调用合并"""
+    cache_policies = collect_cache_policies(plugin, manifest)
+    configure_result_cache(name, manifest.get("version"), cache_policies)
+    coalesce_policies[name] = collect_coalesced_methods(plugin, manifest, cache_policies)
+
+
+def _should_coalesce(name, method_name):
+    policy = coalesce_policies.get(name)
+    return policy is True or (policy is not None and method_name in policy)
+
+
+async def enable_plugin_async(entry_path, name):
+    """在调度循环中启用插件：导入与激活放到线程中执行，避免阻塞调度循环"""
+    logger.info(f"启用插件 {name}")
+    started = time.monotonic()
+    set_plugin_state(name, "loading")
+    plugin, activated = None, False
+    try:
+        entry_path = _check_entry_path(entry_path)
+        manifest = read_plugin_manifest(entry_path)
+        # 主进程内的导入激活与工作进程池预热并行进行
+        loop = asyncio.get_running_loop()
+        loading = loop.run_in_executor(None, _load_and_activate, entry_path, name)
+        outcomes = await asyncio.gather(loading, start_worker_pool(name, entry_path, manifest), return_exceptions=True)
+        activation = None
+        if not isinstance(outcomes[0], BaseException):
+            plugin, activation = outcomes[0]
+            activated = not inspect.isawaitable(activation)
+        errors = [o for o in outcomes if isinstance(o, BaseException)]
+        if errors:
+            if inspect.iscoroutine(activation):
+                activation.close()
+            raise errors[0]
+        await _await_activation(name, activation)
+        activated = True
+        logger.info(f"插件 {name} 激活完成")
+        configure_plugin_limits(name, manifest, default_concurrency=outcomes[1].max_workers)
+        _configure_call_policies(name, plugin, manifest)
+        configure_circuit_breaker(name, manifest)
+    except asyncio.CancelledError:
+        set_plugin_state(name, "timeout")
+        await _rollback_enable(name, plugin, activated)
+        raise
+    except Exception as e:
+        set_plugin_state(name, "failed", error=str(e))
+        await _rollback_enable(name, plugin, activated)
+        raise
+    set_plugin_state(name, "warm", load_seconds=round(time.monotonic() - started, 3))
+    logger.info(f"插件 {name} 工作进程池已就绪")
+
+
+async def _rollback_enable(name, plugin, activated):
+    """启用失败时撤销已完成的步骤：停止进程池，停用已激活的实例并移除登记信息"""
+    await stop_worker_pool(name)
+    invalidate_result_cache(name)
+    coalesce_policies.pop(name, None)
+    remove_plugin_limits(name)
+    remove_circuit_breaker(name)
+    if plugin and activated:
+        try:
+            await _call_lifecycle(plugin.deactivate)
+        except Exception:
+            logger.exception(f"插件 {name} 启用失败后停用出错")
+    loaded_plugins.pop(name, None)
+    remove_method_index(name)
+    logger.info(f"插件 {name} 启用失败，已撤销加载")
+
+
+def enable_plugin(entry_path, name):
+    run_sync(enable_plugin_async(entry_path, name))
+
+
+def _import_and_activate(entry_path, name):
+    plugin = _import_plugin(entry_path, name)
+    return plugin, _activate(name, plugin)
+
+
+async def _call_lifecycle(hook):
+    """在调度循环中执行生命周期方法，同步实现放到线程中执行"""
+    result = await asyncio.get_running_loop().run_in_executor(None, hook)
+    if inspect.isawaitable(result):
+        result = await result
+    return result
+
+
+async def _check_new_version(name, plugin, pool):
+    healthy = await _call_lifecycle(plugin.health_check)
+    if not healthy:
+        raise RuntimeError(f"插件 {name} 新版本健康检查未通过")
+    output = await pool.call("health_check", {}, UPDATE_HEALTH_TIMEOUT)
+    if "error" in output or not output["result"]:
+        raise RuntimeError(f"插件 {name} 新版本工作进程健康检查未通过：{output.get('error', '')}")
+
+
+async def _drain_old_version(name, pool, plugin, on_drained):
+    if pool and not await pool.drain(UPDATE_DRAIN_TIMEOUT):
+        logger.warning(f"插件 {name} 旧版本在 {UPDATE_DRAIN_TIMEOUT}s 内未排空，剩余调用将随进程结束")
+    if plugin:
+        try:
+            await _call_lifecycle(plugin.deactivate)
+        except Exception:
+            logger.exception(f"插件 {name} 旧版本停用失败")
+    if on_drained:
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, on_drained)
+        except Exception:
+            logger.exception(f"插件 {name} 旧版本清理失败")
+    logger.info(f"插件 {name} 旧版本已排空")
+
+
+async def swap_plugin_async(name, entry_path, on_drained=None):
+    """
+    蓝绿切换：新版本在后台完成导入、激活、进程池预热与健康检查后原子替换旧版本，
+    旧版本进行中的调用在原进程池中执行完毕后再停用，随后执行 on_drained。
+    新版本任一步骤失败时清理新版本并抛出异常，旧版本继续提供服务。
+    """
+    entry_path = _check_entry_path(entry_path)
+    manifest = read_plugin_manifest(entry_path)
+    logger.info(f"开始预热插件 {name} 新版本：{entry_path}")
+    started = time.monotonic()
+
+    loading = asyncio.get_running_loop().run_in_executor(None, _import_and_activate, entry_path, name)
+    outcomes = await asyncio.gather(loading, create_worker_pool(name, entry_path, manifest), return_exceptions=True)
+    plugin = None if isinstance(outcomes[0], BaseException) else outcomes[0][0]
+    pool = None if isinstance(outcomes[1], BaseException) else outcomes[1]
+    try:
+        for outcome in outcomes:
+            if isinstance(outcome, BaseException):
+                raise outcome
+        await _await_activation(name, outcomes[0][1])
+        await _check_new_version(name, plugin, pool)
+    except BaseException as e:
+        logger.error(f"插件 {name} 新版本预热失败，保留旧版本：{e}")
+        if pool:
+            await pool.shutdown()
+        if plugin:
+            try:
+                await _call_lifecycle(plugin.deactivate)
+            except Exception:
+                logger.exception(f"插件 {name} 新版本停用失败")
+        raise
+
+    # 以下替换在调度循环中同步完成，新调用要么全部落在旧版本，要么全部落在新版本
+    old_pool = replace_worker_pool(name, pool)
+    old_plugin = loaded_plugins.get(name)
+    loaded_plugins[name] = plugin
+    register_method_index(name, plugin)
+    configure_plugin_limits(name, manifest, default_concurrency=pool.max_workers)
+    _configure_call_policies(name, plugin, manifest)
+    configure_circuit_breaker(name, manifest)
+    set_plugin_state(name, "warm", load_seconds=round(time.monotonic() - started, 3))
+    logger.info(f"插件 {name} 已切换到新版本：{entry_path}")
+
+    old_dir = os.path.dirname(old_pool.entry_path) if old_pool else None
+    if old_dir and old_dir != os.path.dirname(entry_path) and old_dir in sys.path:
+        sys.path.remove(old_dir)
+    asyncio.get_running_loop().create_task(_drain_old_version(name, old_pool, old_plugin, on_drained))
+
+
+def swap_plugin(name, entry_path, on_drained=None):
+    run_sync(swap_plugin_async(name, entry_path, on_drained))
+
+
+def is_plugin_loaded(name):
+    return name in loaded_plugins or get_worker_pool(name) is not None
 
 
 def disable_plugin(name):
     logger.info(f"尝试禁用插件 {name}")
+    shutdown_worker_pool(name)
+    invalidate_result_cache(name)
+    coalesce_policies.pop(name, None)
+    remove_plugin_limits(name)
+    remove_circuit_breaker(name)
+    plugin_states.pop(name, None)
     plugin = loaded_plugins.get(name)
     if plugin:
-        plugin.deactivate()
+        _run_lifecycle(plugin.deactivate)
         del loaded_plugins[name]
+        remove_method_index(name)
         logger.info(f"插件 {name} 已禁用并从缓存移除")
     else:
         logger.warning(f"插件 {name} 不存在或未加载")
 
 
 def call_plugin_method(name, method_name, args: dict):
-    logger.info(f"调用插件 {name} 的方法 {method_name}")
+    logger.info("调用插件 %s 的方法 %s", name, method_name)
     plugin = loaded_plugins.get(name)
     if not plugin:
         logger.error(f"插件 {name} 未启用")
@@ -81,50 +327,312 @@ def call_plugin_method(name, method_name, args: dict):
     method = getattr(plugin, method_name)
     try:
         result = method(**args)
-        logger.info(f"插件 {name}.{method_name} 执行成功")
+        logger.info("插件 %s.%s 执行成功", name, method_name)
         return result
     except Exception as e:
-        logger.exception(f"插件方法执行失败：{e}")
+        logger.exception("插件方法执行失败：%s", e)
         raise
 
 
-def _plugin_runner(entry_path, method_name, args, output_queue):
+async def _ensure_worker_pool(name, entry_path):
+    pool = get_worker_pool(name)
+    if pool:
+        return pool
+    # 懒加载模式或启动加载失败时，首次调用再完成插件的导入、激活与进程池创建
+    lock = _pool_init_locks.setdefault(name, asyncio.Lock())
+    async with lock:
+        pool = get_worker_pool(name)
+        if not pool:
+            logger.info(f"插件 {name} 尚未加载，首次调用时启用")
+            await enable_plugin_async(entry_path, name)
+            pool = get_worker_pool(name)
+    return pool
+
+
+class _InflightCall:
+    """
+    一次正在执行的合并调用及其等待者数量，等待者全部离开时才取消执行。
+    截止时间取所有等待者中最晚的一个，随等待者加入而延长；有异步任务加入时准入排队改为一直等待。
+    """
+
+    def __init__(self, deadline, background):
+        self.task = None
+        self.deadline = deadline
+        self.background = background
+        self.sent_deadline = deadline  # 最近一次发往工作进程的截止时间
+        self.waiters = 0
+
+    def join(self, deadline, background):
+        self.deadline = max(self.deadline, deadline)
+        self.background = self.background or background
+
+    def claim_deadline(self):
+        """发往工作进程时才读取截止时间，排队期间加入的等待者同样计入"""
+        self.sent_deadline = self.deadline
+        return self.sent_deadline
+
+
+def _forget_inflight(key, inflight):
+    if _inflight_calls.get(key) is inflight:
+        del _inflight_calls[key]
+
+
+async def _run_flight(inflight, execute):
+    """
+    execute(claim_deadline, background) 执行一次调用。已发往工作进程的调用无法延长截止时间，
+    因此发出后加入的等待者延长了截止时间时，超时后按新的截止时间重新执行；
+    同理，准入被拒绝时若期间有异步任务加入，改为排队等待后重新执行。
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        background = inflight.background
+        try:
+            return await execute(inflight.claim_deadline, background)
+        except TimeoutError:
+            if inflight.deadline <= inflight.sent_deadline or inflight.deadline <= loop.time():
+                raise
+        except PluginOverloadedError:
+            if background or not inflight.background:
+                raise
+        logger.info("合并执行的调用有新的等待者，按其截止时间重新执行")
+
+
+async def _single_flight(key, deadline, background, execute):
+    """
+    参数相同的并发调用只执行一次，所有等待者共享同一结果，执行方式见 _run_flight。
+    工作进程获得的截止时间是当时最晚的等待者的截止时间；各等待者按自己的截止时间放弃等待
+    （见 dispatch_plugin_call），最后一个等待者放弃时才取消执行，某个等待者取消或超时不影响其他等待者。
+    """
+    inflight = _inflight_calls.get(key)
+    if inflight is None or inflight.task.done():
+        inflight = _InflightCall(deadline, background)
+        inflight.task = asyncio.ensure_future(_run_flight(inflight, execute))
+        _inflight_calls[key] = inflight
+        inflight.task.add_done_callback(lambda _, flight=inflight: _forget_inflight(key, flight))
+    else:
+        inflight.join(deadline, background)
+        logger.info("合并相同的并发调用，当前等待数：%d", inflight.waiters + 1)
+
+    inflight.waiters += 1
     try:
-        logger = setup_logger("plugin_runner")
-        logger.info(f"子进程启动，执行 {entry_path} 中的 {method_name}")
+        return await asyncio.shield(inflight.task)
+    finally:
+        inflight.waiters -= 1
+        if inflight.waiters == 0 and not inflight.task.done():
+            inflight.task.cancel()
 
-        spec = importlib.util.spec_from_file_location("plugin", entry_path)
-        mod = importlib.util.module_from_spec(spec)
-        spec.loader.exec_module(mod)
 
-        plugin_class = getattr(mod, "Plugin", None)
-        plugin = plugin_class()
-        plugin.activate()
+def _replacement_pool(pool):
+    """蓝绿切换后旧进程池被关闭，返回替换它的新进程池；插件已停用时返回 None"""
+    current = get_worker_pool(pool.name)
+    return current if current is not pool else None
 
-        result = getattr(plugin, method_name)(**args)
-        output_queue.put({"result": result})
-        logger.info(f"插件方法 {method_name} 执行成功")
-    except Exception as e:
-        logger.exception("子进程插件执行失败")
-        output_queue.put({"error": str(e)})
-
-
-def call_plugin_method_in_process(entry_path, method_name, args: dict, timeout=100):
-    logger.info(f"使用进程执行插件方法：{entry_path}::{method_name}")
-    q = Queue()
-    p = Process(target=_plugin_runner, args=(entry_path, method_name, args, q))
-    add_process(p)
-    p.start()
-    p.join(timeout)
-    if p.is_alive():
-        logger.warning(f"插件方法执行超时：{method_name}")
-        p.terminate()
+
+async def _execute_in_worker(pool, method_name, args, deadline, timing=None, background=False):
+    """
+    deadline 为调度循环时间，工作进程只获得排队后剩余的时间；合并执行时为返回截止时间的函数，排队结束后才读取；
+    timing 字典中写入排队、进程启动、执行与序列化各阶段耗时，见 metrics.record_call；
+    background 的调用（异步任务）在准入队列中等待到截止时间，不受排队超时与队列长度限制
+    """
+    loop = asyncio.get_running_loop()
+    profile = profile_options(pool.name, method_name)
+    while True:
+        try:
+            started = time.perf_counter()
+            async with admit(pool.name, patient=background):
+                if timing is not None:
+                    timing["queue"] = time.perf_counter() - started
+                remaining = (deadline() if callable(deadline) else deadline) - loop.time()
+                if remaining <= 0:
+                    raise TimeoutError("插件调用排队超过截止时间")
+                output = await pool.call(method_name, args, remaining, timing, profile)
+            break
+        except PluginPoolClosedError:
+            pool = _replacement_pool(pool)
+            if pool is None:
+                raise
+        except TimeoutError:
+            logger.warning("插件方法执行超时：%s", method_name)
+            raise
+
+    if "profile" in output:
+        save_profile(pool.name, method_name, profile, output["profile"], output.get("elapsed", 0.0))
+
+    if output.get("cancelled"):
+        # 插件检查取消标记后提前结束，说明已到截止时间
+        logger.warning("插件方法执行超时，已在工作进程中取消：%s", method_name)
         raise TimeoutError("插件执行超时")
 
-    output = q.get()
     if "error" in output:
-        logger.error(f"插件执行出错：{output['error']}")
+        logger.error("插件执行出错：%s", output["error"])
         raise RuntimeError(output["error"])
 
-    logger.info(f"插件方法 {method_name} 执行完毕，返回结果")
+    logger.info("插件方法 %s 执行完毕，返回结果", method_name)
     return output["result"]
+
+
+async def dispatch_plugin_call(name, entry_path, method_name, args, timeout=DEFAULT_CALL_TIMEOUT, background=False):
+    """
+    调度循环内的调用入口：熔断 -> 结果缓存 -> 并发合并 -> 准入控制 -> 工作进程执行。
+    timeout 是整个调用的截止时间，排队、启动进程与执行都计算在内；超时或调用方取消时，
+    工作进程中的调用也会被取消（见 PluginWorkerPool._reclaim）。
+    background 为 True 时（异步任务）准入排队只受 timeout 约束，见 _execute_in_worker。
+    """
+    started = time.perf_counter()
+    timing = {}  # 合并到其他调用上的等待者不记录阶段耗时
+    status = "error"
+    breaker = get_circuit_breaker(name)
+    admitted = probe = False
+    try:
+        if breaker is not None:
+            probe = breaker.acquire()
+            admitted = True
+        deadline = asyncio.get_running_loop().time() + timeout
+        try:
+            result = await asyncio.wait_for(_dispatch(name, entry_path, method_name, args, deadline, timing, background), timeout)
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"插件调用超过截止时间（{round(timeout, 3):g}s）")
+        status = "cache_hit" if timing.get("cache_hit") else "ok"
+        return result
+    except TimeoutError:
+        status = "timeout"
+        raise
+    except PluginOverloadedError:
+        status = "rejected"
+        raise
+    except asyncio.CancelledError:
+        status = "cancelled"
+        raise
+    finally:
+        if admitted:
+            breaker.observe(status, probe)
+        record_call(name, method_name, status, time.perf_counter() - started, timing)
+
+
+async def _dispatch(name, entry_path, method_name, args, deadline, timing, background=False):
+    cache = get_result_cache(name)
+    cache_key = cache.make_key(method_name, args) if cache else None
+    if cache_key is not None:
+        hit, result = cache.get(method_name, cache_key)
+        if hit:
+            logger.info("插件方法 %s.%s 命中结果缓存", name, method_name)
+            timing["cache_hit"] = True
+            return result
+
+    # 首次调用时的插件加载不随本次调用超时或取消而中断，后续调用可以直接使用
+    pool = get_worker_pool(name) or await asyncio.shield(_ensure_worker_pool(name, entry_path))
+    flight_key = make_call_key(name, pool.entry_path, method_name, args) if _should_coalesce(name, method_name) else None
+    if flight_key is None:
+        result = await _execute_in_worker(pool, method_name, args, deadline, timing, background)
+    else:
+        result = await _single_flight(flight_key, deadline, background,
+                                      lambda until, patient: _execute_in_worker(pool, method_name, args, until, timing, patient))
+
+    if cache_key is not None:
+        cache.put(method_name, cache_key, result)
+    return result
+
+
+async def call_plugin_method_in_process_async(name, entry_path, method_name, args: dict,
+                                              timeout=DEFAULT_CALL_TIMEOUT):
+    """可在任意事件循环中等待的插件调用，等待期间不占用线程"""
+    logger.info("使用工作进程执行插件方法：%s::%s", name, method_name)
+    return await run_async(dispatch_plugin_call(name, entry_path, method_name, args, timeout))
+
+
+def call_plugin_method_in_process(name, entry_path, method_name, args: dict, timeout=DEFAULT_CALL_TIMEOUT):
+    logger.info("使用工作进程执行插件方法：%s::%s", name, method_name)
+    return run_sync(dispatch_plugin_call(name, entry_path, method_name, args, timeout))
+
+
+async def _next_stream_chunk(chunks, timeout, deadline):
+    """deadline 为整个流式调用的截止时间（time.monotonic），为 None 时只由 timeout 限制相邻两块的间隔"""
+    if deadline is None:
+        return await chunks.__anext__()
+    try:
+        return await asyncio.wait_for(chunks.__anext__(), max(deadline - time.monotonic(), 0))
+    except asyncio.TimeoutError:
+        raise TimeoutError(f"插件流式调用超过截止时间（{round(timeout, 3):g}s）")
+
+
+async def _stream_in_worker(name, entry_path, method_name, args, timeout, deadline=None):
+    started = time.perf_counter()
+    status = "error"
+    breaker = get_circuit_breaker(name)
+    admitted = probe = False
+    try:
+        if breaker is not None:
+            probe = breaker.acquire()
+            admitted = True
+        pool = await _ensure_worker_pool(name, entry_path)
+        async with admit(name):
+            while True:
+                chunks = pool.stream(method_name, args, timeout)
+                try:
+                    while True:
+                        try:
+                            chunk = await _next_stream_chunk(chunks, timeout, deadline)
+                        except StopAsyncIteration:
+                            break
+                        yield chunk
+                    break
+                except PluginPoolClosedError:
+                    # 只可能在取得工作进程前抛出，此时尚未产出任何分块
+                    pool = _replacement_pool(pool)
+                    if pool is None:
+                        raise
+                finally:
+                    await chunks.aclose()
+        status = "ok"
+    except TimeoutError:
+        status = "timeout"
+        raise
+    except PluginOverloadedError:
+        status = "rejected"
+        raise
+    except (asyncio.CancelledError, GeneratorExit):
+        status = "cancelled"
+        raise
+    finally:
+        if admitted:
+            breaker.observe(status, probe)
+        # 流式调用只记录次数与总耗时
+        record_call(name, method_name, status, time.perf_counter() - started)
+    logger.info("插件流式方法 %s.%s 执行完毕", name, method_name)
+
+
+class _StreamCursor:
+    """在调度循环中逐块推进流式结果，关闭前等待尚未结束的取块操作完成"""
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self._pending = None
+
+    async def next(self):
+        self._pending = asyncio.current_task()
+        return await self.chunks.__anext__()
+
+    async def close(self):
+        if self._pending is not None and not self._pending.done():
+            await asyncio.wait([self._pending])
+        await self.chunks.aclose()
+
+
+async def stream_plugin_method_async(name, entry_path, method_name, args: dict,
+                                     timeout=DEFAULT_CALL_TIMEOUT, deadline=None):
+    """
+    以异步生成器形式逐块返回生成器方法的结果，可在任意事件循环中迭代。
+    每取一块才向调度循环请求下一块，工作进程最多领先 STREAM_WINDOW 块。
+    deadline（time.monotonic）为整个流式调用的截止时间，到期时工作进程中的调用随之结束。
+    """
+    logger.info("使用工作进程流式执行插件方法：%s::%s", name, method_name)
+    cursor = _StreamCursor(_stream_in_worker(name, entry_path, method_name, args, timeout, deadline))
+    try:
+        while True:
+            try:
+                chunk = await run_async(cursor.next())
+            except StopAsyncIteration:
+                return
+            yield chunk
+    finally:
+        await run_async(cursor.close())
@@ -0,0 +1,82 @@
+"""
+Author: SmileSion
+Date: 2026-10-18
+Description: 插件元数据内存快照，调用热路径不再访问数据库。
+"""
+import threading
+from typing import NamedTuple, Optional
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from app.db.models import PluginInfo, PluginStatus
+from app.utils.log_utils import setup_logger
+
+logger = setup_logger("plugin_registry")
+
+# /list 返回的列，不加载完整的 ORM 对象
+LIST_COLUMNS = (PluginInfo.id, PluginInfo.name, PluginInfo.version, PluginInfo.description,
+                PluginInfo.entry_path, PluginInfo.status, PluginInfo.install_time)
+
+plugin_registry = {}
+_registry_lock = threading.Lock()
+
+
+class PluginRecord(NamedTuple):
+    """PluginInfo 行的只读快照，与数据库会话无关"""
+    name: str
+    version: Optional[str]
+    description: Optional[str]
+    entry_path: str
+    status: PluginStatus
+
+    @classmethod
+    def from_model(cls, plugin: PluginInfo):
+        return cls(plugin.name, plugin.version, plugin.description, plugin.entry_path, plugin.status)
+
+
+def load_registry(db: Session):
+    """启动时从数据库全量加载插件快照"""
+    records = {p.name: PluginRecord.from_model(p) for p in db.query(PluginInfo).all()}
+    with _registry_lock:
+        plugin_registry.clear()
+        plugin_registry.update(records)
+    logger.info(f"插件注册表加载完成，共 {len(records)} 个插件")
+
+
+def refresh_plugin(plugin: PluginInfo):
+    """数据库提交后同步单个插件的快照"""
+    with _registry_lock:
+        plugin_registry[plugin.name] = PluginRecord.from_model(plugin)
+
+
+def remove_plugin(name):
+    with _registry_lock:
+        plugin_registry.pop(name, None)
+
+
+def get_plugin(name) -> Optional[PluginRecord]:
+    return plugin_registry.get(name)
+
+
+def get_enabled_plugin(name) -> Optional[PluginRecord]:
+    record = plugin_registry.get(name)
+    if record and record.status == PluginStatus.ENABLED:
+        return record
+    return None
+
+
+def list_enabled_plugins():
+    return [r for r in list(plugin_registry.values()) if r.status == PluginStatus.ENABLED]
+
+
+def query_plugin_page(db: Session, offset, limit, status: Optional[PluginStatus] = None):
+    """按 id（安装顺序）分页查询插件列表，返回 (总数, 当前页各行的字典)"""
+    rows = select(*LIST_COLUMNS).order_by(PluginInfo.id)
+    count = select(func.count()).select_from(PluginInfo)
+    if status is not None:
+        rows = rows.where(PluginInfo.status == status)
+        count = count.where(PluginInfo.status == status)
+    total = db.scalar(count)
+    items = [dict(row) for row in db.execute(rows.offset(offset).limit(limit)).mappings()]
+    return total, items
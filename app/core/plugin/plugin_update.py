@@ -4,105 +4,127 @@ Date: 2025-07-30
 Description: 插件更新模块。
 """
 import os
+import re
 import shutil
-import subprocess
-import tempfile
+import threading
 from sqlalchemy.orm import Session
 
+from app.db.database import SessionLocal
 from app.db.models import PluginInfo, PluginStatus
-from app.utils.file_utils import extract_and_parse_manifest
+from app.utils.file_utils import PluginPackage, get_plugin_folder
 from app.utils.log_utils import setup_logger
-from app.core.plugin.plugin_loader import disable_plugin
+from app.core.plugin.dependency_builder import get_install_state, needs_install, submit_install
+from app.core.plugin.package_store import get_plugin_ref, ingest_package, materialize_package, set_plugin_ref
+from app.core.plugin.plugin_loader import is_plugin_loaded, swap_plugin
+from app.core.plugin.plugin_registry import refresh_plugin
 
 logger = setup_logger("plugin_update")
 
-class UploadedFileWrapper:
-    def __init__(self, file_path, filename):
-        self.file = open(file_path, "rb")
-        self.filename = filename
-    def close(self):
-        if not self.file.closed:
-            self.file.close()
-    def __del__(self):
-        self.close()
-
-def find_plugin_root(path):
-    subdirs = [os.path.join(path, name) for name in os.listdir(path)
-               if os.path.isdir(os.path.join(path, name))]
-    if len(subdirs) == 1:
-        return subdirs[0]
-    elif os.path.isdir(path) and os.path.isfile(os.path.join(path, "plugin.py")):
-        # 整个 tempdir 就是插件目录（无子目录形式）
-        return path
-    else:
-        raise FileNotFoundError(f"无法确定插件根目录，请检查插件包结构是否正确（应包含唯一顶层文件夹）")
-
-def update_plugin(db: Session, plugin_name: str, uploaded_file):
+_update_locks = {}
+_update_locks_guard = threading.Lock()
+
+def _versioned_folder(plugins_root, plugin_name, version):
+    """新版本解压到与当前版本并列的独立目录，如 plugins/demo@1.2.0"""
+    safe_version = re.sub(r"[^\w.-]", "_", str(version))
+    return os.path.join(plugins_root, f"{plugin_name}@{safe_version}")
+
+def _remove_folder(plugins_root, folder):
+    folder = os.path.abspath(folder)
+    if folder.startswith(plugins_root + os.sep) and os.path.exists(folder):
+        logger.info(f"删除旧插件目录：{folder}")
+        shutil.rmtree(folder, ignore_errors=True)
+
+def _get_update_lock(plugin_name):
+    with _update_locks_guard:
+        return _update_locks.setdefault(plugin_name, threading.Lock())
+
+def update_plugin(db: Session, plugin_name: str, package: PluginPackage):
+    """
+    更新插件，返回 (插件记录, 结果)，结果为 updated / installing（等待依赖安装）/ unchanged（内容未变）。
+    依赖需要安装时在后台安装，完成后自动切换版本，期间旧版本继续提供服务。
+    """
+    with _get_update_lock(plugin_name):
+        return _update_plugin(db, plugin_name, package)
+
+def _update_plugin(db: Session, plugin_name: str, package: PluginPackage):
     logger.info(f"开始更新插件：{plugin_name}")
     
     plugin = db.query(PluginInfo).filter_by(name=plugin_name).first()
     if not plugin:
         logger.error(f"插件 {plugin_name} 不存在，无法更新")
         raise ValueError(f"插件 '{plugin_name}' 不存在，无法更新")
+    install_state = get_install_state(plugin_name)
+    if install_state and install_state["state"] == "building":
+        raise ValueError(f"插件 '{plugin_name}' 依赖安装中，请稍后再更新")
 
     plugins_root = os.path.abspath("plugins")
-    dest_folder = os.path.join(plugins_root, plugin_name)
-
-    with tempfile.TemporaryDirectory() as tmpdir:
-        temp_path = os.path.join(tmpdir, uploaded_file.filename)
-        logger.debug(f"写入临时文件：{temp_path}")
-        
-        with open(temp_path, "wb") as f:
-            uploaded_file.file.seek(0)
-            f.write(uploaded_file.file.read())
-
-        wrapper = UploadedFileWrapper(temp_path, uploaded_file.filename)
-        try:
-            manifest = extract_and_parse_manifest(wrapper, dest_folder=tmpdir)
-            logger.debug(f"解析 manifest 成功：{manifest}")
-        finally:
-            wrapper.close()
-
-        new_version = manifest.get("version")
-        if new_version == plugin.version:
-            logger.warning(f"插件 {plugin_name} 版本未变（{new_version}），更新被拒绝")
-            raise ValueError(f"插件 '{plugin_name}' 版本相同 ({new_version})，不允许重复更新")
-
-
-        if plugin.status == PluginStatus.ENABLED:
-            logger.info(f"插件 {plugin_name} 已启用，先进行停用处理")
-            disable_plugin(plugin_name)
-
-        if os.path.exists(dest_folder):
-            logger.info(f"删除旧插件目录：{dest_folder}")
-            shutil.rmtree(dest_folder)
-
-        # 自动探测实际插件目录
+    old_folder = get_plugin_folder(plugin.entry_path)
+
+    if package.name != plugin_name:
+        raise ValueError(f"插件包名称 '{package.name}' 与待更新插件 '{plugin_name}' 不一致")
+
+    # 内容与当前版本完全相同（无论插件包本身是否重新打包）时不做任何处理
+    tree = ingest_package(package)["tree"]
+    if tree == get_plugin_ref(plugin_name):
+        logger.info(f"插件 {plugin_name} 内容未变，跳过更新")
+        return plugin, "unchanged"
+
+    # 版本检查只需包内的 manifest.json，校验通过后才生成新版本目录
+    new_version = package.manifest.get("version")
+    if new_version == plugin.version:
+        logger.warning(f"插件 {plugin_name} 版本未变（{new_version}），更新被拒绝")
+        raise ValueError(f"插件 '{plugin_name}' 版本相同 ({new_version})，不允许重复更新")
+
+    dest_folder = _versioned_folder(plugins_root, plugin_name, new_version)
+    if dest_folder == old_folder:
+        raise ValueError(f"插件 '{plugin_name}' 新版本目录与当前版本冲突：{dest_folder}")
+
+    logger.info(f"暂存插件新版本至：{dest_folder}")
+    manifest, tree = materialize_package(package, dest_folder)
+
+    entry_path = os.path.join(dest_folder, manifest.get("entry", "plugin.py"))
+    if needs_install(plugin_name, dest_folder):
+        def on_ready():
+            with _get_update_lock(plugin_name):
+                db = SessionLocal()
+                try:
+                    plugin = db.query(PluginInfo).filter_by(name=plugin_name).first()
+                    if plugin is None:
+                        _remove_folder(plugins_root, dest_folder)
+                        return
+                    _switch_version(db, plugin, manifest, entry_path, plugins_root, old_folder, tree)
+                finally:
+                    db.close()
+
+        submit_install(plugin_name, dest_folder, on_ready=on_ready,
+                       on_failed=lambda e: _remove_folder(plugins_root, dest_folder))
+        logger.info(f"插件 {plugin_name} 新版本 {new_version} 依赖后台安装中，完成后自动切换")
+        return plugin, "installing"
+
+    submit_install(plugin_name, dest_folder)
+    _switch_version(db, plugin, manifest, entry_path, plugins_root, old_folder, tree)
+    return plugin, "updated"
+
+def _switch_version(db: Session, plugin, manifest, entry_path, plugins_root, old_folder, tree):
+    plugin_name = plugin.name
+    dest_folder = get_plugin_folder(entry_path)
+    if plugin.status == PluginStatus.ENABLED and is_plugin_loaded(plugin_name):
+        # 运行中的插件蓝绿切换：新版本预热并通过健康检查后再替换，旧目录在旧版本排空后删除
+        logger.info(f"插件 {plugin_name} 运行中，预热新版本后切换")
         try:
-            plugin_src_dir = os.path.join(tmpdir, plugin_name)
-            if not os.path.exists(plugin_src_dir):
-                logger.warning(f"未找到指定插件目录 {plugin_src_dir}，尝试自动探测根目录")
-                plugin_src_dir = find_plugin_root(tmpdir)
+            swap_plugin(plugin_name, entry_path, on_drained=lambda: _remove_folder(plugins_root, old_folder))
         except Exception as e:
-            raise RuntimeError(f"插件解压后目录结构异常：{e}")
-
-        logger.info(f"复制插件新版本至：{dest_folder}")
-        shutil.copytree(plugin_src_dir, dest_folder)
-
-    requirements_path = os.path.join(dest_folder, "requirements.txt")
-    if os.path.exists(requirements_path):
-        try:
-            logger.info(f"检测到依赖文件，开始安装：{requirements_path}")
-            subprocess.check_call(["pip", "install", "-r", requirements_path])
-        except subprocess.CalledProcessError as e:
-            logger.exception("插件依赖安装失败")
-            raise RuntimeError(f"安装插件依赖失败: {e}")
+            _remove_folder(plugins_root, dest_folder)
+            raise RuntimeError(f"插件新版本启动失败，已保留版本 {plugin.version}：{e}")
+    else:
+        _remove_folder(plugins_root, old_folder)
 
+    new_version = manifest.get("version")
     plugin.version = new_version
     plugin.description = manifest.get("description", plugin.description)
-    plugin.entry_path = os.path.join(dest_folder, manifest.get("entry", "plugin.py"))
-    plugin.status = PluginStatus.INSTALLED
+    plugin.entry_path = entry_path
     db.commit()
+    refresh_plugin(plugin)
+    set_plugin_ref(plugin_name, tree)
 
     logger.info(f"插件 {plugin_name} 更新成功为版本：{new_version}")
-    return plugin
@@ -0,0 +1,239 @@
+"""
+Author: SmileSion
+Date: 2026-10-18
+Description: 插件方法按需性能剖析：工作进程内执行 cProfile 或采样剖析，主进程保存并提供下载。
+"""
+import cProfile
+import io
+import itertools
+import json
+import marshal
+import os
+import pstats
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+
+from app.utils.log_utils import setup_logger
+
+PROFILE_DIR = os.path.abspath(os.getenv("PLUGIN_PROFILE_DIR", "profiles"))  # 剖析结果保存目录
+PROFILE_MAX_ENTRIES = int(os.getenv("PLUGIN_PROFILE_MAX_ENTRIES", 200))  # 最多保留的剖析结果数，超出后删除最早的
+DEFAULT_SAMPLE_INTERVAL = 0.005  # 采样剖析的采样间隔（秒）
+PROFILERS = ("cprofile", "sampling")
+# 剖析器 -> 保存的文件扩展名
+_PROFILE_SUFFIXES = {"cprofile": "prof", "sampling": "collapsed"}
+
+logger = setup_logger("plugin_profiler")
+
+profiling_configs = {}  # 插件名 -> 剖析配置
+profiles = OrderedDict()  # 调用 id -> 剖析结果元数据，按保存顺序排列
+_profiles_lock = threading.Lock()
+
+
+# ---------- 工作进程内 ----------
+
+class _StackSampler(threading.Thread):
+    """定时读取目标线程的调用栈，按折叠栈格式（根在前，以 ; 分隔）计数；只保留 root 帧以下的部分"""
+
+    def __init__(self, thread_id, root, interval):
+        super().__init__(daemon=True, name="plugin-profile-sampler")
+        self.thread_id = thread_id
+        self.root = root
+        self.interval = interval
+        self.stacks = Counter()
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None and frame is not self.root:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+
+    def collapsed(self):
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common()).encode("utf-8")
+
+
+def run_profiled(options, func):
+    """
+    在剖析器下执行 func，返回 (结果, 异常, 剖析数据)。
+    cprofile 的剖析数据为 pstats 文件内容（marshal 格式），sampling 为折叠栈文本。
+    """
+    result = error = None
+    if options["profiler"] == "sampling":
+        sampler = _StackSampler(threading.get_ident(), sys._getframe(),
+                                options.get("interval") or DEFAULT_SAMPLE_INTERVAL)
+        sampler.start()
+        try:
+            result = func()
+        except Exception as e:
+            error = e
+        finally:
+            sampler.stop()
+        return result, error, sampler.collapsed()
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        result = func()
+    except Exception as e:
+        error = e
+    finally:
+        profiler.disable()
+    profiler.create_stats()
+    return result, error, marshal.dumps(profiler.stats)
+
+
+# ---------- 主进程内 ----------
+
+def configure_profiling(name, profiler="cprofile", methods=None, sample_every=1, interval=None, limit=None):
+    """
+    开启插件的剖析：methods 为空时剖析所有方法；每 sample_every 次执行剖析 1 次；
+    limit 为本次最多保存的剖析结果数，达到后自动关闭。
+    """
+    if profiler not in PROFILERS:
+        raise ValueError(f"不支持的剖析器：{profiler}")
+    config = {
+        "profiler": profiler,
+        "methods": sorted(methods) if methods else None,
+        "sample_every": max(int(sample_every), 1),
+        "interval": interval,
+        "limit": limit,
+        "captured": 0,
+        "_counter": itertools.count(),
+    }
+    profiling_configs[name] = config
+    logger.info(f"插件 {name} 已开启剖析：{get_profiling_config(name)}")
+    return config
+
+
+def disable_profiling(name):
+    if profiling_configs.pop(name, None) is not None:
+        logger.info(f"插件 {name} 已关闭剖析")
+
+
+def get_profiling_config(name):
+    config = profiling_configs.get(name)
+    return {k: v for k, v in config.items() if not k.startswith("_")} if config else None
+
+
+def profile_options(name, method_name):
+    """判断本次执行是否需要剖析，需要时返回发给工作进程的剖析参数（调度循环内调用）"""
+    config = profiling_configs.get(name)
+    if config is None or (config["methods"] and method_name not in config["methods"]):
+        return None
+    if next(config["_counter"]) % config["sample_every"]:
+        return None
+    return {"profiler": config["profiler"], "interval": config["interval"]}
+
+
+def _metadata_path(call_id):
+    return os.path.join(PROFILE_DIR, f"{call_id}.json")
+
+
+def _delete_profile_files(entry):
+    for path in (entry["path"], _metadata_path(entry["call_id"])):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def _evict_profiles():
+    while len(profiles) > PROFILE_MAX_ENTRIES:
+        _, entry = profiles.popitem(last=False)
+        _delete_profile_files(entry)
+
+
+def load_profiles():
+    """启动时从 PROFILE_DIR 中各剖析结果的元数据文件重建索引，数据文件已丢失的条目跳过"""
+    if not os.path.isdir(PROFILE_DIR):
+        return
+    entries = []
+    for filename in os.listdir(PROFILE_DIR):
+        if not filename.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(PROFILE_DIR, filename), "r", encoding="utf-8") as f:
+                entry = json.load(f)
+            entry["path"] = os.path.join(PROFILE_DIR, f"{entry['call_id']}.{_PROFILE_SUFFIXES[entry['profiler']]}")
+        except (OSError, ValueError, KeyError):
+            logger.warning(f"剖析结果元数据无法读取，已跳过：{filename}")
+            continue
+        if os.path.exists(entry["path"]):
+            entries.append(entry)
+    with _profiles_lock:
+        profiles.clear()
+        for entry in sorted(entries, key=lambda e: e["created_at"]):
+            profiles[entry["call_id"]] = entry
+        _evict_profiles()
+    logger.info(f"剖析结果索引已重建，共 {len(profiles)} 条")
+
+
+def save_profile(name, method_name, options, data, seconds):
+    """保存工作进程返回的剖析数据，返回调用 id"""
+    call_id = uuid.uuid4().hex
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    path = os.path.join(PROFILE_DIR, f"{call_id}.{_PROFILE_SUFFIXES[options['profiler']]}")
+    with open(path, "wb") as f:
+        f.write(data)
+    entry = {
+        "call_id": call_id,
+        "plugin": name,
+        "method": method_name,
+        "profiler": options["profiler"],
+        "seconds": round(seconds, 6),
+        "size": len(data),
+        "created_at": time.time(),
+    }
+    # 元数据单独保存，重启后由 load_profiles 重建索引
+    with open(_metadata_path(call_id), "w", encoding="utf-8") as f:
+        json.dump(entry, f, ensure_ascii=False)
+    entry["path"] = path
+    with _profiles_lock:
+        profiles[call_id] = entry
+        _evict_profiles()
+    config = profiling_configs.get(name)
+    if config is not None:
+        config["captured"] += 1
+        if config["limit"] and config["captured"] >= config["limit"]:
+            disable_profiling(name)
+    logger.info(f"插件 {name}.{method_name} 剖析结果已保存：{call_id}")
+    return call_id
+
+
+def list_profiles(name=None):
+    with _profiles_lock:
+        entries = list(profiles.values())
+    return [{k: v for k, v in entry.items() if k != "path"}
+            for entry in reversed(entries) if name is None or entry["plugin"] == name]
+
+
+def get_profile(call_id):
+    return profiles.get(call_id)
+
+
+def render_pstats_text(path, sort="cumulative", limit=50):
+    """将 pstats 文件渲染为文本报表"""
+    stream = io.StringIO()
+    stats = pstats.Stats(path, stream=stream)
+    stats.sort_stats(sort).print_stats(limit)
+    return stream.getvalue()
+
+
+def remove_profiles(name):
+    """插件卸载时删除其全部剖析结果"""
+    disable_profiling(name)
+    with _profiles_lock:
+        for call_id in [call_id for call_id, entry in profiles.items() if entry["plugin"] == name]:
+            _delete_profile_files(profiles.pop(call_id))
@@ -0,0 +1,151 @@
+"""
+Author: SmileSion
+Date: 2026-10-18
+Description: 纯函数插件方法的结果缓存（LRU + TTL）。
+"""
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from app.utils.log_utils import setup_logger
+
+DEFAULT_CACHE_TTL = 60
+DEFAULT_CACHE_MAX_ENTRIES = 128
+
+result_caches = {}
+logger = setup_logger("plugin_result_cache")
+
+
+def make_call_key(name, revision, method_name, args):
+    """
+    规范化调用参数生成调用键，参数无法 JSON 序列化时返回 None（不参与缓存与合并）。
+    revision 为插件版本或入口路径，用于区分同名插件的不同版本。
+    """
+    try:
+        canonical_args = json.dumps(args, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    except (TypeError, ValueError):
+        return None
+    return f"{name}\x00{revision}\x00{method_name}\x00{canonical_args}"
+
+
+class _MethodCache:
+    def __init__(self, ttl, max_entries):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries = OrderedDict()  # key -> (过期时间, 结果)
+
+
+class PluginResultCache:
+    """单个插件的结果缓存，每个可缓存方法拥有独立的 LRU 与 TTL 配置"""
+
+    def __init__(self, name, version, policies):
+        self.name = name
+        self.version = version
+        self._methods = {m: _MethodCache(p["ttl"], p["max_entries"]) for m, p in policies.items()}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def make_key(self, method_name, args):
+        if method_name not in self._methods:
+            return None
+        return make_call_key(self.name, self.version, method_name, args)
+
+    def get(self, method_name, key):
+        """返回 (是否命中, 结果)"""
+        method_cache = self._methods[method_name]
+        with self._lock:
+            entry = method_cache.entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > time.monotonic():
+                    method_cache.entries.move_to_end(key)
+                    self.hits += 1
+                    return True, value
+                del method_cache.entries[key]
+                self.evictions += 1
+            self.misses += 1
+            return False, None
+
+    def put(self, method_name, key, value):
+        method_cache = self._methods[method_name]
+        with self._lock:
+            method_cache.entries[key] = (time.monotonic() + method_cache.ttl, value)
+            method_cache.entries.move_to_end(key)
+            while len(method_cache.entries) > method_cache.max_entries:
+                method_cache.entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "version": self.version,
+                "methods": {m: {"ttl": c.ttl, "max_entries": c.max_entries, "size": len(c.entries)}
+                            for m, c in self._methods.items()},
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+def collect_cache_policies(plugin, manifest=None):
+    """合并 @cacheable 装饰器与 manifest.json 中 cache 字段声明的缓存策略，manifest 优先"""
+    policies = {}
+    plugin_class = type(plugin)
+    for attr_name in dir(plugin_class):
+        if attr_name.startswith("_"):
+            continue
+        options = getattr(getattr(plugin_class, attr_name, None), "__plugin_cache__", None)
+        if options:
+            policies[attr_name] = dict(options)
+    for method_name, options in ((manifest or {}).get("cache") or {}).items():
+        policies[method_name] = {
+            "ttl": float(options.get("ttl", DEFAULT_CACHE_TTL)),
+            "max_entries": int(options.get("max_entries", DEFAULT_CACHE_MAX_ENTRIES)),
+        }
+    return policies
+
+
+def collect_coalesced_methods(plugin, manifest=None, cache_policies=()):
+    """
+    参数相同的并发调用只对声明了幂等的方法合并：@idempotent 装饰的方法、可缓存的方法，
+    以及 manifest.json 中 coalesce 列出的方法；coalesce 为 true 时合并所有方法。
+    """
+    setting = (manifest or {}).get("coalesce", False)
+    if setting is True:
+        return True
+    methods = set(cache_policies)
+    if isinstance(setting, list):
+        methods.update(setting)
+    plugin_class = type(plugin)
+    for attr_name in dir(plugin_class):
+        if not attr_name.startswith("_") and getattr(getattr(plugin_class, attr_name, None),
+                                                     "__plugin_idempotent__", False):
+            methods.add(attr_name)
+    return frozenset(methods)
+
+
+def configure_result_cache(name, version, policies):
+    if not policies:
+        result_caches.pop(name, None)
+        return None
+    cache = PluginResultCache(name, version, policies)
+    result_caches[name] = cache
+    logger.info(f"插件 {name} 启用结果缓存：{', '.join(policies)}")
+    return cache
+
+
+def get_result_cache(name):
+    return result_caches.get(name)
+
+
+def invalidate_result_cache(name):
+    if result_caches.pop(name, None):
+        logger.info(f"插件 {name} 结果缓存已失效")
+
+
+def get_cache_stats(name):
+    cache = result_caches.get(name)
+    return cache.stats() if cache else None
@@ -0,0 +1,100 @@
+"""
+Author: SmileSion
+Date: 2026-10-18
+Description: 工作进程监督：资源限制、内存巡检与定期回收。
+"""
+import asyncio
+import math
+import os
+
+try:
+    import resource
+except ImportError:  # Windows 不支持 rlimit
+    resource = None
+
+from app.core.plugin.hook.end_hooks import reap_processes
+from app.utils.log_utils import setup_logger
+
+SUPERVISOR_INTERVAL = float(os.getenv("PLUGIN_SUPERVISOR_INTERVAL", 10))  # 巡检间隔（秒）
+DEFAULT_MAX_CALLS = int(os.getenv("PLUGIN_WORKER_MAX_CALLS", 0))  # 处理多少次调用后回收进程，0 表示不限
+DEFAULT_MAX_RSS_MB = float(os.getenv("PLUGIN_WORKER_MAX_RSS_MB", 0))  # 常驻内存超过该值时回收进程，0 表示不限
+
+# manifest.json limits 字段 -> (rlimit 名称, 换算系数)；cpu_seconds 是单次调用的预算，见 set_call_cpu_budget
+_RLIMITS = {
+    "memory_mb": ("RLIMIT_AS", 1024 * 1024),
+    "open_files": ("RLIMIT_NOFILE", 1),
+}
+
+logger = setup_logger("plugin_supervisor")
+_supervisor_task = None
+
+
+def parse_worker_limits(manifest=None):
+    """读取 manifest.json 的 limits 字段，未配置的回收阈值使用环境变量默认值"""
+    config = (manifest or {}).get("limits", {})
+    limits = {key: float(config[key]) for key in (*_RLIMITS, "cpu_seconds") if config.get(key)}
+    limits["max_calls"] = int(config.get("max_calls", DEFAULT_MAX_CALLS))
+    limits["max_rss_mb"] = float(config.get("max_rss_mb", DEFAULT_MAX_RSS_MB))
+    return limits
+
+
+def apply_resource_limits(limits):
+    """在工作进程内设置内存与打开文件数的 rlimit"""
+    if resource is None or not limits:
+        return
+    for key, (rlimit_name, unit) in _RLIMITS.items():
+        value = limits.get(key)
+        if not value:
+            continue
+        rlimit = getattr(resource, rlimit_name)
+        _, hard = resource.getrlimit(rlimit)
+        limit = int(value * unit)
+        if hard != resource.RLIM_INFINITY:
+            limit = min(limit, hard)
+        # 软硬限制相同，插件无法自行调高
+        resource.setrlimit(rlimit, (limit, limit))
+
+
+def set_call_cpu_budget(limits):
+    """
+    在工作进程内把 RLIMIT_CPU 软限制设为已用 CPU 时间加上单次调用预算，每次调用前执行；
+    超出预算的进程被内核以 SIGXCPU 终止，由进程池发现后丢弃。
+    硬限制保持不变，常驻进程累计的 CPU 时间不会占用后续调用的预算。
+    """
+    budget = (limits or {}).get("cpu_seconds")
+    if resource is None or not budget:
+        return
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+    soft = math.ceil(usage.ru_utime + usage.ru_stime + budget)
+    if hard != resource.RLIM_INFINITY:
+        soft = min(soft, hard)
+    resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+
+
+def read_rss_bytes(pid):
+    """读取进程常驻内存大小，进程不存在或平台不支持时返回 None"""
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+async def _supervise(pools):
+    while True:
+        await asyncio.sleep(SUPERVISOR_INTERVAL)
+        for pool in list(pools.values()):
+            try:
+                await pool.supervise()
+            except Exception:
+                logger.exception(f"插件 {pool.name} 进程池巡检失败")
+        reap_processes()
+
+
+def start_supervisor(pools):
+    """在调度循环中启动巡检任务（重复调用无副作用）"""
+    global _supervisor_task
+    if _supervisor_task is None or _supervisor_task.done():
+        _supervisor_task = asyncio.get_running_loop().create_task(_supervise(pools))
+        logger.info(f"工作进程巡检已启动，间隔 {SUPERVISOR_INTERVAL}s")
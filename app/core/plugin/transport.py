@@ -0,0 +1,187 @@
+"""
+Author: SmileSion
+Date: 2026-10-18
+Description: 工作进程通信传输层，大块数据通过共享内存带外传输。
+"""
+import glob
+import io
+import itertools
+import mmap
+import os
+import pickle
+from multiprocessing import resource_tracker, shared_memory
+
+SHM_THRESHOLD = int(os.getenv("PLUGIN_SHM_THRESHOLD", 1024 * 1024))  # 小于该大小的缓冲区直接走管道
+SHM_PREFIX = "plugin_shm"
+SHM_DIR = "/dev/shm"  # POSIX 共享内存段所在目录
+
+_segment_counter = itertools.count()
+
+
+def _rebuild_memoryview(buffer):
+    return memoryview(buffer)
+
+
+class _OutOfBandPickler(pickle.Pickler):
+    """NumPy 数组等支持 PickleBuffer 的对象按协议 5 带外序列化；memoryview 转为 PickleBuffer"""
+
+    def reducer_override(self, obj):
+        if type(obj) is memoryview:
+            if obj.nbytes >= SHM_THRESHOLD and obj.contiguous:
+                return _rebuild_memoryview, (pickle.PickleBuffer(obj),)
+            return _rebuild_memoryview, (obj.tobytes(),)
+        return NotImplemented
+
+
+class _ExtractingPickler(_OutOfBandPickler):
+    """
+    bytes、bytearray 与 str 由 pickle 直接写入流内，只能通过 persistent_id 截获后带外传输；
+    每个对象都要调用一次 Python 方法，因此只在消息本身超过阈值时才使用。
+    """
+
+    def __init__(self, file, **kwargs):
+        super().__init__(file, protocol=5, **kwargs)
+        self.extracted = []  # 带外传输的 bytes / bytearray / str 数据
+
+    def persistent_id(self, obj):
+        if type(obj) in (bytes, bytearray) and len(obj) >= SHM_THRESHOLD:
+            self.extracted.append(obj)
+            return len(self.extracted) - 1, type(obj).__name__
+        # 字符数不少于阈值时 UTF-8 编码后也一定超过阈值
+        if type(obj) is str and len(obj) >= SHM_THRESHOLD:
+            self.extracted.append(obj.encode("utf-8", "surrogatepass"))
+            return len(self.extracted) - 1, "str"
+        return None
+
+
+class _SegmentUnpickler(pickle.Unpickler):
+    def __init__(self, file, extracted, **kwargs):
+        super().__init__(file, **kwargs)
+        self.extracted = extracted
+
+    def persistent_load(self, pid):
+        index, kind = pid
+        view = self.extracted[index]
+        if kind == "str":
+            return str(view, "utf-8", "surrogatepass")
+        if kind == "bytearray":
+            return bytearray(view)
+        # 与小于阈值时一样返回 bytes，类型不随大小变化；需要不复制时由发送方传 memoryview
+        return bytes(view)
+
+
+def _dumps(obj):
+    """返回 (pickle 主体, PickleBuffer 缓冲区, 带外的 bytes / bytearray / str 数据)"""
+    buffers = []
+
+    def buffer_callback(buffer):
+        if buffer.raw().nbytes < SHM_THRESHOLD:
+            return True  # 小缓冲区保留在 pickle 流内
+        buffers.append(buffer)
+        return False
+
+    stream = io.BytesIO()
+    _OutOfBandPickler(stream, protocol=5, buffer_callback=buffer_callback).dump(obj)
+    if stream.tell() < SHM_THRESHOLD:
+        return stream.getvalue(), buffers, []
+    # 消息主体仍然很大，说明其中有大的 bytes / str，重新序列化并把它们移到共享内存
+    buffers = []
+    stream = io.BytesIO()
+    pickler = _ExtractingPickler(stream, buffer_callback=buffer_callback)
+    pickler.dump(obj)
+    return stream.getvalue(), buffers, pickler.extracted
+
+
+def _create_segment(data):
+    raw = memoryview(data).cast("B")
+    name = f"{SHM_PREFIX}_{os.getpid()}_{next(_segment_counter)}"
+    shm = shared_memory.SharedMemory(name=name, create=True, size=max(raw.nbytes, 1))
+    try:
+        shm.buf[:raw.nbytes] = raw
+    except Exception:
+        shm.close()
+        shm.unlink()
+        raise
+    # 段的所有权转交接收方，由接收方负责 unlink
+    resource_tracker.unregister(shm._name, "shared_memory")
+    shm.close()
+    return name, raw.nbytes
+
+
+def _map_segment(name, size):
+    """
+    映射对端创建的段并立即删除其名称，返回直接指向共享内存的 memoryview（不复制）。
+    映射随最后一个引用它的对象（memoryview、NumPy 数组等）释放。
+    """
+    path = os.path.join(SHM_DIR, name)
+    fd = os.open(path, os.O_RDWR)
+    try:
+        os.unlink(path)
+        if size == 0:
+            return memoryview(b"")
+        return memoryview(mmap.mmap(fd, size))
+    finally:
+        os.close(fd)
+
+
+def send_message(conn, obj, stats=None):
+    """
+    发送一条消息，返回本次创建的共享内存段名称列表。
+    超过阈值的缓冲区写入共享内存，管道中只传递段名和 pickle 主体。
+    传入 stats 字典时写入消息序列化后的字节数（bytes）。
+    """
+    data, buffers, extracted = _dumps(obj)
+    segments = []
+    try:
+        for buffer in buffers:
+            segments.append(_create_segment(buffer.raw()))
+        for value in extracted:
+            segments.append(_create_segment(value))
+        # 先 PickleBuffer 缓冲区，后 persistent_id 引用的数据
+        conn.send((segments, len(buffers)))
+        conn.send_bytes(data)
+    except Exception:
+        release_segments([name for name, _ in segments])
+        raise
+    if stats is not None:
+        stats["bytes"] = len(data) + sum(size for _, size in segments)
+    return [name for name, _ in segments]
+
+
+def recv_message(conn, stats=None):
+    """
+    接收一条消息。memoryview、NumPy 数组等 PickleBuffer 对象直接引用映射的共享内存（不复制）；
+    大的 bytes、bytearray 与 str 从共享内存复制或解码一次，随后立即释放映射。
+    """
+    segments, pickle_buffers = conn.recv()
+    data = conn.recv_bytes()
+    views = [_map_segment(name, size) for name, size in segments]
+    if stats is not None:
+        stats["bytes"] = len(data) + sum(size for _, size in segments)
+    extracted = views[pickle_buffers:]
+    unpickler = _SegmentUnpickler(io.BytesIO(data), extracted, buffers=views[:pickle_buffers])
+    try:
+        return unpickler.load()
+    finally:
+        for view in extracted:
+            view.release()
+
+
+def release_segments(names):
+    """释放未被对端读取的共享内存段"""
+    for name in names:
+        try:
+            shm = shared_memory.SharedMemory(name=name)
+        except FileNotFoundError:
+            continue
+        shm.close()
+        shm.unlink()
+
+
+def release_process_segments(pid):
+    """清理指定进程遗留的共享内存段（进程被强制终止时调用）"""
+    for path in glob.glob(os.path.join(SHM_DIR, f"{SHM_PREFIX}_{pid}_*")):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,729 @@
+"""
+Author: SmileSion
+Date: 2026-10-18
+Description: 插件常驻工作进程池。
+"""
+import asyncio
+import importlib.util
+import inspect
+import os
+import signal
+import sys
+import time
+from multiprocessing import Pipe, get_context
+
+from app.core.plugin.dependency_builder import activate_plugin_env
+from app.core.plugin.dispatcher import run_sync, wait_readable
+from app.core.plugin.hook.end_hooks import add_process, remove_process
+from app.core.plugin.metrics import record_load_phase
+from app.core.plugin.plugin_base import CancellationToken, PluginCancelledError, set_cancel_token
+from app.core.plugin.profiler import run_profiled
+from app.core.plugin.supervisor import (
+    apply_resource_limits,
+    parse_worker_limits,
+    read_rss_bytes,
+    set_call_cpu_budget,
+    start_supervisor,
+)
+from app.core.plugin.transport import recv_message, release_process_segments, release_segments, send_message
+from app.core.plugin.zygote import WORKER_START_METHOD, ZYGOTE_SUPPORTED, PluginZygote
+from app.utils.file_utils import get_plugin_folder
+from app.utils.log_utils import setup_logger
+
+DEFAULT_MIN_WORKERS = 1
+DEFAULT_MAX_WORKERS = 4
+WORKER_READY_TIMEOUT = 30  # 工作进程加载并激活插件的最长等待时间（秒）
+WORKER_STOP_TIMEOUT = 5
+STREAM_WINDOW = int(os.getenv("PLUGIN_STREAM_WINDOW", 16))  # 流式调用中工作进程最多领先消费方的分块数
+CANCEL_GRACE = float(os.getenv("PLUGIN_CANCEL_GRACE", 2))  # 调用取消后等待工作进程结束当前调用的时间（秒），超时则终止进程
+CANCEL_SIGNAL = getattr(signal, "SIGUSR1", None)  # 通知工作进程取消当前调用的信号
+
+worker_pools = {}
+logger = setup_logger("plugin_worker_pool")
+
+
+def _run_maybe_async(loop, result):
+    """插件方法可以是协程函数，返回可等待对象时在工作进程自身的事件循环中等待"""
+    if inspect.isawaitable(result):
+        return loop.run_until_complete(result)
+    return result
+
+
+class PluginStreamError(RuntimeError):
+    """流式调用中插件自身抛出的异常，工作进程与管道状态仍然正常"""
+
+
+class PluginPoolClosedError(RuntimeError):
+    """进程池已关闭（插件停用或已被新版本替换）"""
+
+
+def _iterate_async(loop, agen):
+    while True:
+        try:
+            yield loop.run_until_complete(agen.__anext__())
+        except StopAsyncIteration:
+            return
+
+
+def _stream_result(loop, conn, result, window):
+    """
+    逐块发送生成器结果。每块之后对端回复一个 ack，未确认的块达到 window 时暂停生成，
+    结束（end / error）前先收齐所有 ack，保证管道中不残留消息。
+    """
+    if inspect.isasyncgen(result):
+        chunks = _iterate_async(loop, result)
+    elif inspect.isgenerator(result):
+        chunks = result
+    else:
+        chunks = iter([result])
+
+    sent = acked = 0
+    try:
+        for chunk in chunks:
+            send_message(conn, {"chunk": chunk})
+            sent += 1
+            while sent - acked >= window:
+                acked += recv_message(conn)["ack"]
+        terminal = {"end": True}
+    except Exception as e:
+        terminal = {"error": str(e)}
+    while acked < sent:
+        acked += recv_message(conn)["ack"]
+    send_message(conn, terminal)
+    return terminal
+
+
+def _install_cancel_handler(loop, current):
+    """收到取消信号时标记当前调用的取消标记，协程方法同时取消其任务；调用之间收到的信号直接忽略"""
+    def on_cancel(signum, frame):
+        token, task = current.get("token"), current.get("task")
+        if token is not None:
+            token.cancel()
+        if task is not None:
+            loop.call_soon_threadsafe(task.cancel)
+
+    signal.signal(CANCEL_SIGNAL, on_cancel)
+
+
+def _run_cancellable(loop, current, result):
+    """协程方法包装为任务执行，取消信号到达时可以在下一个 await 处中断"""
+    if not inspect.isawaitable(result):
+        return result
+    current["task"] = loop.create_task(result)
+    try:
+        return loop.run_until_complete(current["task"])
+    finally:
+        current["task"] = None
+
+
+def _worker_main(name, entry_path, conn, limits=None):
+    """工作进程主循环：加载并激活插件一次，之后通过管道持续处理调用请求"""
+    logger = setup_logger("plugin_worker")
+    loop = asyncio.new_event_loop()
+    current = {}  # 正在执行的调用的取消标记与协程任务
+    if CANCEL_SIGNAL is not None:
+        _install_cancel_handler(loop, current)
+    try:
+        apply_resource_limits(limits)
+        set_call_cpu_budget(limits)  # 导入与激活同样受单次预算限制
+        plugin_dir = os.path.dirname(entry_path)
+        if plugin_dir not in sys.path:
+            sys.path.insert(0, plugin_dir)
+        activate_plugin_env(name, get_plugin_folder(entry_path))
+        started = time.perf_counter()
+        spec = importlib.util.spec_from_file_location(name, entry_path)
+        mod = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(mod)
+        imported = time.perf_counter()
+
+        plugin_class = getattr(mod, "Plugin", None)
+        plugin = plugin_class()
+        _run_maybe_async(loop, plugin.activate())
+        timing = {"import": imported - started, "activate": time.perf_counter() - imported}
+    except Exception as e:
+        logger.exception(f"工作进程加载插件 {name} 失败")
+        send_message(conn, {"error": str(e)})
+        conn.close()
+        return
+
+    send_message(conn, {"ready": True, "timing": timing})
+    logger.info(f"工作进程已就绪：{name}")
+
+    while True:
+        try:
+            request = recv_message(conn)
+        except (EOFError, OSError):
+            break
+        if request is None:
+            break
+
+        method_name = request["method"]
+        profile_options = request.get("profile")
+        profile_data = None
+        started = time.perf_counter()
+        # deadline 为主进程发出请求时剩余的秒数，工作进程按自身的单调时钟换算
+        remaining = request.get("deadline")
+        token = CancellationToken(time.monotonic() + remaining if remaining is not None else None)
+        current["token"] = token
+        set_cancel_token(token)
+        set_call_cpu_budget(limits)
+        try:
+            try:
+                invoke = lambda: _run_cancellable(loop, current, getattr(plugin, method_name)(**request["args"]))
+                if profile_options:
+                    result, error, profile_data = run_profiled(profile_options, invoke)
+                    if error is not None:
+                        raise error
+                else:
+                    result = invoke()
+            except (Exception, asyncio.CancelledError) as e:
+                elapsed = time.perf_counter() - started
+                if token.cancelled or isinstance(e, (PluginCancelledError, asyncio.CancelledError)):
+                    logger.warning("插件方法已取消：%s.%s，耗时 %.3fs", name, method_name, elapsed)
+                    reply = {"error": "插件调用已取消", "cancelled": True, "elapsed": elapsed}
+                else:
+                    logger.exception("插件方法执行失败：%s.%s", name, method_name)
+                    reply = {"error": str(e), "elapsed": elapsed}
+                if profile_data is not None:
+                    reply["profile"] = profile_data
+                send_message(conn, reply)
+                continue
+            elapsed = time.perf_counter() - started
+            if request.get("stream"):
+                terminal = _stream_result(loop, conn, result, request.get("window", STREAM_WINDOW))
+                if "error" in terminal:
+                    logger.error("插件流式方法执行失败：%s.%s，原因：%s", name, method_name, terminal["error"])
+                continue
+        finally:
+            current["token"] = None
+            set_cancel_token(None)
+        reply = {"result": result, "elapsed": elapsed}
+        if profile_data is not None:
+            reply["profile"] = profile_data
+        try:
+            send_message(conn, reply)
+        except Exception as e:
+            logger.exception("插件方法返回值序列化失败：%s.%s", name, method_name)
+            send_message(conn, {"error": f"返回值无法序列化: {e}", "elapsed": elapsed})
+
+    try:
+        _run_maybe_async(loop, plugin.deactivate())
+    except Exception:
+        logger.exception(f"工作进程停用插件 {name} 失败")
+    loop.close()
+    conn.close()
+
+
+class PluginWorker:
+    """
+    单个常驻工作进程，持有与其通信的持久管道；除构造外的方法均在调度循环中调用。
+    未传入 process 时以 spawn 方式从主进程启动（主进程是多线程的，直接 fork 不安全），
+    否则使用模板进程 fork 出的进程与管道。
+    """
+
+    def __init__(self, name, entry_path, limits=None, process=None, conn=None):
+        self.name = name
+        self.entry_path = entry_path
+        self.calls = 0
+        self.spawn_seconds = None  # 从发起创建到插件激活完成的耗时
+        self.pending_segments = ()  # 超时或取消的调用尚未确认被工作进程读取的共享内存段
+        self._terminated = False
+        if process is not None:
+            self.process, self.conn = process, conn
+        else:
+            self.conn, child_conn = Pipe()
+            self.process = get_context("spawn").Process(target=_worker_main, args=(name, entry_path, child_conn, limits), daemon=True)
+            self.process.start()
+            child_conn.close()
+        add_process(self.process)
+
+    @property
+    def pid(self):
+        return self.process.pid
+
+    async def wait_ready(self, timeout=WORKER_READY_TIMEOUT):
+        try:
+            await wait_readable(self.conn.fileno(), timeout)
+        except TimeoutError:
+            self.terminate()
+            raise TimeoutError(f"插件 {self.name} 工作进程启动超时")
+        try:
+            message = recv_message(self.conn)
+        except EOFError:
+            self.terminate()
+            raise RuntimeError(f"插件 {self.name} 工作进程启动时异常退出")
+        if "error" in message:
+            self.terminate()
+            raise RuntimeError(message["error"])
+        for phase, seconds in message.get("timing", {}).items():
+            record_load_phase(self.name, f"worker_{phase}", seconds)
+
+    async def call(self, method_name, args, timeout, timing=None, profile=None):
+        self.calls += 1
+        started = time.perf_counter()
+        request = {"method": method_name, "args": args, "deadline": timeout}
+        if profile:
+            request["profile"] = profile
+        request_stats = {}
+        segments = send_message(self.conn, request, request_stats)
+        try:
+            try:
+                await wait_readable(self.conn.fileno(), timeout)
+            except TimeoutError:
+                raise TimeoutError("插件执行超时")
+            response_stats = {}
+            try:
+                output = recv_message(self.conn, response_stats)
+            except EOFError:
+                raise RuntimeError(f"插件 {self.name} 工作进程异常退出")
+        except (TimeoutError, asyncio.CancelledError):
+            # 进程池会尝试取消工作进程中的调用并继续复用该进程，回收失败时再释放参数的共享内存段
+            self.pending_segments = segments
+            raise
+        except BaseException:
+            # 工作进程可能未读取参数，回收本次创建的共享内存段
+            release_segments(segments)
+            raise
+        if timing is not None:
+            # 往返耗时中除插件方法执行外的部分计为序列化（含管道与共享内存传输）
+            execute = output.get("elapsed", 0.0)
+            timing["execute"] = execute
+            timing["serialize"] = max(time.perf_counter() - started - execute, 0.0)
+            timing["request_bytes"] = request_stats["bytes"]
+            timing["response_bytes"] = response_stats["bytes"]
+        return output
+
+    async def stream(self, method_name, args, timeout, window=STREAM_WINDOW):
+        """逐块产出流式结果；timeout 为相邻两块之间的最长等待时间"""
+        self.calls += 1
+        segments = send_message(self.conn, {"method": method_name, "args": args, "stream": True, "window": window})
+        try:
+            while True:
+                try:
+                    await wait_readable(self.conn.fileno(), timeout)
+                except TimeoutError:
+                    raise TimeoutError("插件执行超时")
+                try:
+                    message = recv_message(self.conn)
+                except EOFError:
+                    raise RuntimeError(f"插件 {self.name} 工作进程异常退出")
+                if "error" in message:
+                    raise PluginStreamError(message["error"])
+                if message.get("end"):
+                    return
+                yield message["chunk"]
+                send_message(self.conn, {"ack": 1})
+        except BaseException:
+            release_segments(segments)
+            raise
+
+    def is_alive(self):
+        return self.process.is_alive()
+
+    def interrupt(self):
+        """通知工作进程取消当前调用，返回是否已发出通知"""
+        if CANCEL_SIGNAL is None or self._terminated or not self.process.is_alive():
+            return False
+        send_signal = getattr(self.process, "send_signal", None)
+        try:
+            if send_signal is not None:
+                # 模板进程 fork 出的进程通过 pidfd 发送，不受 pid 复用影响
+                send_signal(CANCEL_SIGNAL)
+            else:
+                os.kill(self.pid, CANCEL_SIGNAL)
+        except ProcessLookupError:
+            return False
+        return True
+
+    async def stop(self, timeout=WORKER_STOP_TIMEOUT):
+        try:
+            send_message(self.conn, None)
+        except (OSError, ValueError):
+            pass
+        try:
+            await wait_readable(self.process.sentinel, timeout)
+        except TimeoutError:
+            pass
+        if self.process.is_alive():
+            self.terminate()
+        else:
+            self.process.join()
+            self.conn.close()
+            remove_process(self.process)
+
+    def terminate(self):
+        """发送终止信号并立即返回，进程回收在后台完成"""
+        if self._terminated:
+            return
+        self._terminated = True
+        if self.process.is_alive():
+            logger.warning(f"终止插件 {self.name} 工作进程 {self.pid}")
+            self.process.terminate()
+        self.conn.close()
+        asyncio.get_running_loop().create_task(self._reap())
+
+    async def _reap(self):
+        """等待进程退出并回收；SIGTERM 后超时仍未退出则发送 SIGKILL"""
+        try:
+            await wait_readable(self.process.sentinel, WORKER_STOP_TIMEOUT)
+        except TimeoutError:
+            logger.warning(f"插件 {self.name} 工作进程 {self.pid} 未响应 SIGTERM，发送 SIGKILL")
+            self.process.kill()
+            try:
+                await wait_readable(self.process.sentinel, WORKER_STOP_TIMEOUT)
+            except TimeoutError:
+                pass
+        self.process.join(0)
+        remove_process(self.process)
+        release_process_segments(self.pid)
+
+
+class PluginWorkerPool:
+    """单个插件的工作进程池：预先启动 min_workers 个进程，按需扩容至 max_workers"""
+
+    def __init__(self, name, entry_path, min_workers=DEFAULT_MIN_WORKERS, max_workers=DEFAULT_MAX_WORKERS,
+                 preload=(), start_method=WORKER_START_METHOD, limits=None):
+        if min_workers < 0 or max_workers < 1 or min_workers > max_workers:
+            raise ValueError(f"插件 {name} 进程池大小配置非法：min={min_workers}, max={max_workers}")
+        self.name = name
+        self.entry_path = entry_path
+        self.min_workers = min_workers
+        self.max_workers = max_workers
+        self.preload = tuple(preload)  # 模板进程中预先导入的依赖模块
+        self.limits = limits or {}  # 工作进程 rlimit 与回收阈值，见 supervisor.parse_worker_limits
+        self.max_calls = int(self.limits.get("max_calls") or 0)
+        self.max_rss = float(self.limits.get("max_rss_mb") or 0) * 1024 * 1024
+        self.recycled = 0
+        self.reclaimed = 0  # 调用超时或取消后，在宽限时间内结束调用而继续复用的进程数
+        self.start_method = start_method if ZYGOTE_SUPPORTED else "process"
+        self.spawned = 0
+        self.last_spawn_ms = None  # 最近一次从发起创建到插件激活完成的耗时
+        self._spawn_total_ms = 0.0
+        self._zygote = None
+        self._idle = []
+        self._size = 0  # 已启动或正在启动的进程数
+        self._closed = False
+        self._cond = asyncio.Condition()
+
+    async def start(self):
+        logger.info(f"启动插件 {self.name} 进程池：min={self.min_workers}, max={self.max_workers}, "
+                    f"启动方式={self.start_method}")
+        if self.start_method == "zygote":
+            await self._start_zygote()
+        self._size += self.min_workers
+        workers = await asyncio.gather(*(self._spawn() for _ in range(self.min_workers)), return_exceptions=True)
+        errors = [w for w in workers if isinstance(w, BaseException)]
+        async with self._cond:
+            self._idle.extend(w for w in workers if not isinstance(w, BaseException))
+            self._cond.notify_all()
+        if errors:
+            await self.shutdown()
+            raise errors[0]
+
+    async def _start_zygote(self):
+        zygote = PluginZygote(self.name, self.entry_path, self.preload, self.limits, _worker_main)
+        try:
+            failed = await zygote.wait_ready()
+        except BaseException as e:
+            zygote.terminate()
+            if not isinstance(e, Exception):
+                raise
+            logger.warning(f"插件 {self.name} 模板进程启动失败，改为直接创建工作进程：{e}")
+            self.start_method = "process"
+            return
+        if failed:
+            logger.warning(f"插件 {self.name} 模板进程未能预加载：{', '.join(failed)}")
+        self._zygote = zygote
+        logger.info(f"插件 {self.name} 模板进程 {zygote.pid} 已就绪")
+
+    async def _create_worker(self):
+        if self.start_method == "zygote" and not self._closed:
+            if self._zygote is not None and not self._zygote.is_alive():
+                logger.warning(f"插件 {self.name} 模板进程已退出，重新启动")
+                self._zygote = None
+            if self._zygote is None:
+                await self._start_zygote()
+            if self._zygote is not None:
+                process, conn = await self._zygote.fork()
+                return PluginWorker(self.name, self.entry_path, self.limits, process, conn)
+        return PluginWorker(self.name, self.entry_path, self.limits)
+
+    async def _spawn(self):
+        worker = None
+        started = time.perf_counter()
+        try:
+            worker = await self._create_worker()
+            await worker.wait_ready()
+        except BaseException:
+            if worker is not None:
+                worker.terminate()
+            async with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        worker.spawn_seconds = elapsed_ms / 1000
+        record_load_phase(self.name, "spawn", worker.spawn_seconds)
+        self.spawned += 1
+        self.last_spawn_ms = elapsed_ms
+        self._spawn_total_ms += elapsed_ms
+        logger.info(f"插件 {self.name} 新增工作进程 {worker.pid}，启动耗时 {elapsed_ms:.1f} ms")
+        return worker
+
+    async def _acquire(self, timeout, timing=None):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        async with self._cond:
+            while True:
+                if self._closed:
+                    raise PluginPoolClosedError(f"插件 {self.name} 进程池已关闭")
+                while self._idle:
+                    worker = self._idle.pop()
+                    if worker.is_alive():
+                        return worker
+                    worker.terminate()
+                    self._size -= 1
+                if self._size < self.max_workers:
+                    self._size += 1
+                    break
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    raise TimeoutError(f"插件 {self.name} 无空闲工作进程")
+                try:
+                    await asyncio.wait_for(self._cond.wait(), remaining)
+                except asyncio.TimeoutError:
+                    raise TimeoutError(f"插件 {self.name} 无空闲工作进程")
+        worker = await self._spawn()
+        if timing is not None:
+            timing["spawn"] = worker.spawn_seconds
+        return worker
+
+    async def _release(self, worker):
+        reason = None if self._closed else self._recycle_reason(worker)
+        async with self._cond:
+            if self._closed:
+                self._size -= 1
+                self._cond.notify_all()
+            elif reason:
+                self._retire(worker, reason)
+                self._cond.notify()
+                asyncio.get_running_loop().create_task(self._replenish())
+                return
+            else:
+                self._idle.append(worker)
+                self._cond.notify()
+                return
+        await worker.stop()
+
+    def _recycle_reason(self, worker):
+        if self.max_calls and worker.calls >= self.max_calls:
+            return f"已处理 {worker.calls} 次调用"
+        if self.max_rss:
+            rss = read_rss_bytes(worker.pid)
+            if rss and rss > self.max_rss:
+                return f"常驻内存 {rss / 1024 / 1024:.0f} MB 超过上限"
+        return None
+
+    def _retire(self, worker, reason):
+        """将工作进程移出进程池并在后台停止，调用方需持有 self._cond"""
+        self._size -= 1
+        self.recycled += 1
+        logger.info(f"回收插件 {self.name} 工作进程 {worker.pid}：{reason}")
+        if worker.is_alive():
+            asyncio.get_running_loop().create_task(worker.stop())
+        else:
+            worker.terminate()
+
+    async def _replenish(self):
+        """补足 min_workers 个工作进程"""
+        async with self._cond:
+            missing = 0 if self._closed else self.min_workers - self._size
+            if missing <= 0:
+                return
+            self._size += missing
+        workers = await asyncio.gather(*(self._spawn() for _ in range(missing)), return_exceptions=True)
+        spawned = [w for w in workers if not isinstance(w, BaseException)]
+        async with self._cond:
+            if self._closed:
+                self._size -= len(spawned)
+            else:
+                self._idle.extend(spawned)
+                self._cond.notify(len(spawned))
+                spawned = []
+        await asyncio.gather(*(worker.stop() for worker in spawned))
+
+    async def supervise(self):
+        """巡检空闲工作进程：清理已退出的，回收超出内存阈值的，并补足最小进程数"""
+        async with self._cond:
+            idle, self._idle = self._idle, []
+            for worker in idle:
+                reason = self._recycle_reason(worker) if worker.is_alive() else "进程已退出"
+                if reason:
+                    self._retire(worker, reason)
+                else:
+                    self._idle.append(worker)
+        await self._replenish()
+
+    def _discard(self, worker):
+        worker.terminate()
+        self._size -= 1
+        # 不持锁唤醒等待者，被取消的调用也能同步完成清理
+        asyncio.get_running_loop().create_task(self._notify())
+
+    async def _notify(self):
+        async with self._cond:
+            self._cond.notify()
+
+    async def _reclaim(self, worker):
+        """
+        调用超时或被取消后通知工作进程取消该调用：CANCEL_GRACE 内收到其回复（丢弃）则放回进程池，
+        否则终止该进程。回收期间进程仍计入进程池大小。
+        """
+        if worker.interrupt():
+            try:
+                await wait_readable(worker.conn.fileno(), CANCEL_GRACE)
+                recv_message(worker.conn)
+            except Exception:
+                pass
+            else:
+                worker.pending_segments = ()
+                self.reclaimed += 1
+                logger.info(f"插件 {self.name} 工作进程 {worker.pid} 已取消当前调用，继续复用")
+                await self._release(worker)
+                return
+        release_segments(worker.pending_segments)
+        worker.pending_segments = ()
+        self._discard(worker)
+
+    async def call(self, method_name, args, timeout, timing=None, profile=None):
+        """
+        timeout 为取得工作进程与执行的总时间；
+        timing 不为 None 时累加等待空闲进程的时间（queue），并写入进程启动与执行各阶段耗时；
+        profile 为剖析参数（见 profiler.profile_options），剖析数据随结果以 profile 字段返回。
+        """
+        started = time.perf_counter()
+        worker = await self._acquire(timeout, timing)
+        if timing is not None:
+            waited = time.perf_counter() - started - timing.get("spawn", 0.0)
+            timing["queue"] = timing.get("queue", 0.0) + waited
+        # timeout 包含等待空闲进程与启动进程的时间
+        remaining = timeout - (time.perf_counter() - started)
+        if remaining <= 0:
+            await self._release(worker)
+            raise TimeoutError("插件执行超时")
+        try:
+            output = await worker.call(method_name, args, remaining, timing, profile)
+        except (TimeoutError, asyncio.CancelledError):
+            # 超时或取消：在后台取消工作进程中的调用，能及时结束的进程继续复用
+            asyncio.get_running_loop().create_task(self._reclaim(worker))
+            raise
+        except BaseException:
+            # 进程异常后管道状态不可信，直接丢弃该进程
+            self._discard(worker)
+            raise
+        await self._release(worker)
+        return output
+
+    async def stream(self, method_name, args, timeout, window=STREAM_WINDOW):
+        """流式调用期间独占一个工作进程；消费方中途放弃时丢弃该进程"""
+        worker = await self._acquire(timeout)
+        chunks = worker.stream(method_name, args, timeout, window)
+        try:
+            async for chunk in chunks:
+                yield chunk
+        except PluginStreamError:
+            await self._release(worker)
+            raise
+        except BaseException:
+            self._discard(worker)
+            raise
+        finally:
+            await chunks.aclose()
+        await self._release(worker)
+
+    async def shutdown(self):
+        async with self._cond:
+            self._closed = True
+            workers, self._idle = self._idle, []
+            self._size -= len(workers)
+            self._cond.notify_all()
+        await asyncio.gather(*(worker.stop() for worker in workers))
+        zygote, self._zygote = self._zygote, None
+        if zygote is not None:
+            await zygote.stop()
+        logger.info(f"插件 {self.name} 进程池已关闭")
+
+    async def drain(self, timeout):
+        """关闭进程池并等待进行中的调用全部结束，返回是否在超时前排空"""
+        await self.shutdown()
+        async with self._cond:
+            try:
+                await asyncio.wait_for(self._cond.wait_for(lambda: self._size <= 0), timeout)
+            except asyncio.TimeoutError:
+                return False
+        return True
+
+    def stats(self):
+        return {
+            "start_method": "zygote" if self._zygote is not None else "process",
+            "min_workers": self.min_workers,
+            "max_workers": self.max_workers,
+            "size": self._size,
+            "idle": len(self._idle),
+            "spawned": self.spawned,
+            "recycled": self.recycled,
+            "reclaimed": self.reclaimed,
+            "last_spawn_ms": self.last_spawn_ms,
+            "avg_spawn_ms": self._spawn_total_ms / self.spawned if self.spawned else None,
+        }
+
+
+async def create_worker_pool(name, entry_path, manifest=None):
+    """按 manifest.json 中的 workers 配置创建并预热插件进程池，不替换当前登记的进程池"""
+    config = (manifest or {}).get("workers", {})
+    pool = PluginWorkerPool(
+        name,
+        entry_path,
+        min_workers=int(config.get("min", DEFAULT_MIN_WORKERS)),
+        max_workers=int(config.get("max", DEFAULT_MAX_WORKERS)),
+        preload=(manifest or {}).get("preload", ()),
+        limits=parse_worker_limits(manifest),
+    )
+    await pool.start()
+    start_supervisor(worker_pools)
+    return pool
+
+
+async def start_worker_pool(name, entry_path, manifest=None):
+    """创建并登记插件进程池（调度循环内调用）"""
+    pool = await create_worker_pool(name, entry_path, manifest)
+    old_pool = replace_worker_pool(name, pool)
+    if old_pool:
+        await old_pool.shutdown()
+    return pool
+
+
+def replace_worker_pool(name, pool):
+    """登记新的进程池并返回被替换的旧进程池"""
+    old_pool = worker_pools.get(name)
+    worker_pools[name] = pool
+    return old_pool
+
+
+async def stop_worker_pool(name):
+    pool = worker_pools.pop(name, None)
+    if pool:
+        await pool.shutdown()
+
+
+def get_worker_pool(name):
+    return worker_pools.get(name)
+
+
+def get_pool_stats(name):
+    pool = worker_pools.get(name)
+    return pool.stats() if pool else None
+
+
+def shutdown_worker_pool(name):
+    run_sync(stop_worker_pool(name))
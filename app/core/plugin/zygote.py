@@ -0,0 +1,236 @@
+"""
+Author: SmileSion
+Date: 2026-10-18
+Description: 插件工作进程模板（fork-server），预加载依赖后按需 fork 出工作进程。
+"""
+import asyncio
+import gc
+import importlib
+import os
+import select
+import signal
+import sys
+from multiprocessing import Pipe, get_context
+from multiprocessing.connection import Connection
+from multiprocessing.reduction import recv_handle, send_handle
+
+from app.core.plugin.dependency_builder import activate_plugin_env
+from app.core.plugin.dispatcher import wait_readable
+from app.core.plugin.hook.end_hooks import add_process, remove_process
+from app.utils.file_utils import get_plugin_folder
+from app.utils.log_utils import setup_logger
+
+WORKER_START_METHOD = os.getenv("PLUGIN_WORKER_START_METHOD", "zygote")  # zygote / process
+ZYGOTE_SUPPORTED = hasattr(os, "fork") and hasattr(os, "pidfd_open") and hasattr(signal, "pidfd_send_signal")
+ZYGOTE_READY_TIMEOUT = 60  # 模板进程预加载依赖的最长等待时间（秒）
+ZYGOTE_FORK_TIMEOUT = 5
+ZYGOTE_STOP_TIMEOUT = 5
+# 所有插件共用的框架模块，模板进程总是预先导入
+ZYGOTE_BASE_MODULES = ("app.core.plugin.plugin_base", "app.core.plugin.transport", "app.utils.log_utils")
+
+logger = setup_logger("plugin_zygote")
+
+
+def _reap_children():
+    while True:
+        try:
+            pid, _ = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            return
+        if pid == 0:
+            return
+
+
+def _fork_worker(name, entry_path, limits, conn, worker_main):
+    parent_conn, child_conn = Pipe()
+    pid = os.fork()
+    if pid == 0:
+        code = 0
+        try:
+            conn.close()
+            parent_conn.close()
+            worker_main(name, entry_path, child_conn, limits)
+        except BaseException:
+            code = 1
+        finally:
+            # 不执行模板进程继承来的 atexit 与 multiprocessing 清理逻辑
+            os._exit(code)
+
+    child_conn.close()
+    # 先于回收打开 pidfd，主进程据此等待退出和发送信号，不受 pid 复用影响
+    pidfd = os.pidfd_open(pid)
+    try:
+        conn.send({"pid": pid})
+        send_handle(conn, parent_conn.fileno(), None)
+        send_handle(conn, pidfd, None)
+    finally:
+        parent_conn.close()
+        os.close(pidfd)
+
+
+def _zygote_main(name, entry_path, preload, limits, conn, worker_main):
+    """模板进程：导入框架模块与 manifest.json 声明的依赖，之后只负责 fork 工作进程"""
+    logger = setup_logger("plugin_zygote")
+    # 插件目录与其依赖目录加入 sys.path，preload 中可以列出插件自带的模块
+    plugin_dir = os.path.dirname(entry_path)
+    if plugin_dir not in sys.path:
+        sys.path.insert(0, plugin_dir)
+    activate_plugin_env(name, get_plugin_folder(entry_path))
+    failed = []
+    for module in (*ZYGOTE_BASE_MODULES, *preload):
+        try:
+            importlib.import_module(module)
+        except Exception as e:
+            failed.append(module)
+            logger.warning(f"插件 {name} 模板进程预加载 {module} 失败：{e}")
+    # 预加载的对象移出 GC 跟踪，避免子进程中的垃圾回收写入对象头而触发写时复制
+    gc.freeze()
+    conn.send({"ready": True, "failed": failed})
+    logger.info(f"插件 {name} 模板进程已就绪，预加载 {len(preload)} 个依赖")
+
+    while True:
+        if conn.poll(1):
+            try:
+                request = conn.recv()
+            except EOFError:
+                break
+            if request is None:
+                break
+            try:
+                _fork_worker(name, entry_path, limits, conn, worker_main)
+            except Exception as e:
+                logger.exception(f"插件 {name} 模板进程 fork 工作进程失败")
+                conn.send({"error": str(e)})
+        _reap_children()
+    # 进程池关闭时先停止工作进程再停止模板进程，退出前回收已结束的子进程
+    _reap_children()
+    conn.close()
+
+
+class ForkedProcess:
+    """模板进程 fork 出的工作进程句柄，提供与 multiprocessing.Process 相同的常用接口"""
+
+    def __init__(self, pid, pidfd):
+        self.pid = pid
+        self.sentinel = pidfd  # 进程退出后 pidfd 变为可读
+        self._closed = False
+
+    def is_alive(self):
+        if self._closed:
+            return False
+        readable, _, _ = select.select([self.sentinel], [], [], 0)
+        return not readable
+
+    def terminate(self):
+        self.send_signal(signal.SIGTERM)
+
+    def kill(self):
+        self.send_signal(signal.SIGKILL)
+
+    def send_signal(self, sig):
+        if self._closed:
+            return
+        try:
+            signal.pidfd_send_signal(self.sentinel, sig)
+        except ProcessLookupError:
+            pass
+
+    def join(self, timeout=None):
+        if self._closed:
+            return
+        readable, _, _ = select.select([self.sentinel], [], [], timeout)
+        if readable:
+            # 进程由模板进程回收，这里只释放 pidfd
+            self._closed = True
+            os.close(self.sentinel)
+
+
+class PluginZygote:
+    """单个插件的模板进程；fork 请求在调度循环中串行执行"""
+
+    def __init__(self, name, entry_path, preload, limits, worker_main):
+        self.name = name
+        self.preload = tuple(preload)
+        self._lock = asyncio.Lock()
+        self._abandoned = 0  # 已发出但尚未取回应答的 fork 请求数，调用方放弃等待的在下次请求前取回并终止
+        self._closed = False
+        self.conn, child_conn = Pipe()
+        # 模板进程以 spawn 方式启动：主进程有多个线程，直接 fork 可能继承被其他线程持有的锁；
+        # 单线程的模板进程之后再 fork 工作进程是安全的
+        self.process = get_context("spawn").Process(
+            target=_zygote_main,
+            args=(name, entry_path, self.preload, limits, child_conn, worker_main),
+            daemon=True,
+        )
+        self.process.start()
+        add_process(self.process)
+        child_conn.close()
+
+    @property
+    def pid(self):
+        return self.process.pid
+
+    def is_alive(self):
+        return not self._closed and self.process.is_alive()
+
+    async def wait_ready(self, timeout=ZYGOTE_READY_TIMEOUT):
+        try:
+            await wait_readable(self.conn.fileno(), timeout)
+            message = self.conn.recv()
+        except (TimeoutError, EOFError):
+            self.terminate()
+            raise RuntimeError(f"插件 {self.name} 模板进程启动失败")
+        return message["failed"]
+
+    async def fork(self, timeout=ZYGOTE_FORK_TIMEOUT):
+        """请求模板进程 fork 一个工作进程，返回 (进程句柄, 通信管道)"""
+        async with self._lock:
+            while self._abandoned:
+                process, conn = await self._receive(timeout)
+                process.kill()
+                conn.close()
+            self.conn.send("fork")
+            self._abandoned += 1
+            return await self._receive(timeout)
+
+    async def _receive(self, timeout):
+        try:
+            await wait_readable(self.conn.fileno(), timeout)
+        except TimeoutError:
+            self.terminate()
+            raise RuntimeError(f"插件 {self.name} 模板进程无响应")
+        # 可读之后的读取同步完成，取消只可能发生在上面的等待中，不会读到一半
+        try:
+            message = self.conn.recv()
+            if "error" not in message:
+                conn_fd = recv_handle(self.conn)
+                pidfd = recv_handle(self.conn)
+        except (EOFError, OSError):
+            self.terminate()
+            raise RuntimeError(f"插件 {self.name} 模板进程异常退出")
+        self._abandoned -= 1
+        if "error" in message:
+            raise RuntimeError(message["error"])
+        return ForkedProcess(message["pid"], pidfd), Connection(conn_fd)
+
+    async def stop(self, timeout=ZYGOTE_STOP_TIMEOUT):
+        try:
+            self.conn.send(None)
+        except (OSError, ValueError):
+            pass
+        try:
+            await wait_readable(self.process.sentinel, timeout)
+        except TimeoutError:
+            pass
+        self.terminate()
+        self.process.join(timeout)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        remove_process(self.process)
+
+    def terminate(self):
+        self._closed = True
+        if self.process.is_alive():
+            self.process.terminate()
+        self.conn.close()
@@ -1,14 +1,133 @@
-from sqlalchemy import create_engine
+import asyncio
+import os
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.pool import NullPool, StaticPool
+
+from app.utils.log_utils import setup_logger
+
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./plugins.db")  # 可替换为 postgresql:// 等服务端数据库
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL")  # 未设置时服务端数据库由 DATABASE_URL 换成对应的异步驱动
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 5))  # 连接池常驻连接数
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 10))  # 连接池满时最多额外创建的连接数
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 30))  # 等待空闲连接的最长时间（秒）
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 1800))  # 服务端数据库连接的最长复用时间（秒）
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", 5000))  # SQLite 写锁等待时间
+# 同步驱动 -> 异步驱动；SQLite 默认不使用异步驱动（aiosqlite 只是把同步调用放到线程中，还不能复用连接）
+ASYNC_DRIVERS = {"postgresql": "postgresql+asyncpg", "mysql": "mysql+aiomysql"}
+
+logger = setup_logger("plugin_db")
+
+
+def _is_sqlite(url):
+    return url.get_backend_name() == "sqlite"
+
+
+def _is_sqlite_memory(url):
+    return _is_sqlite(url) and url.database in (None, "", ":memory:")
+
+
+def _engine_options(url):
+    if _is_sqlite_memory(url):
+        # 内存数据库只存在于单个连接中，所有会话共用该连接
+        return {"connect_args": {"check_same_thread": False}, "poolclass": StaticPool}
+    options = {"pool_size": DB_POOL_SIZE, "max_overflow": DB_MAX_OVERFLOW, "pool_timeout": DB_POOL_TIMEOUT}
+    if _is_sqlite(url):
+        # WAL 模式下读写互不阻塞，多个连接可以安全并发使用
+        options["connect_args"] = {"check_same_thread": False, "timeout": SQLITE_BUSY_TIMEOUT_MS / 1000}
+    else:
+        options.update(pool_pre_ping=True, pool_recycle=DB_POOL_RECYCLE)
+    return options
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute("PRAGMA journal_mode=WAL")
+        # WAL 下 NORMAL 只在检查点时同步，进程崩溃不会损坏数据库
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+        cursor.execute("PRAGMA foreign_keys=ON")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+    finally:
+        cursor.close()
+
 
-DATABASE_URL = "sqlite:///./plugins.db"
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
-SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False)
+def _create_engine(url):
+    url = make_url(url)
+    engine = create_engine(url, **_engine_options(url))
+    if _is_sqlite(url) and not _is_sqlite_memory(url):
+        event.listen(engine, "connect", _set_sqlite_pragmas)
+    return engine
+
+
+def _async_url(url):
+    if ASYNC_DATABASE_URL:
+        return make_url(ASYNC_DATABASE_URL)
+    url = make_url(url)
+    driver = ASYNC_DRIVERS.get(url.get_backend_name())
+    return url.set(drivername=driver) if driver else None
+
+
+def _create_async_engine(url):
+    """没有可用的异步驱动时返回 None，异步路由改为在线程池中使用同步会话"""
+    async_url = _async_url(url)
+    if async_url is None:
+        return None
+    options = _engine_options(async_url)
+    if _is_sqlite(async_url):
+        # 显式配置 aiosqlite 时：每个连接占用一个非守护线程，池中常驻的连接会阻止进程退出
+        options = {"connect_args": options["connect_args"], "poolclass": NullPool}
+    try:
+        from sqlalchemy.ext.asyncio import create_async_engine
+        engine = create_async_engine(async_url, **options)
+    except ImportError as e:
+        logger.warning(f"数据库异步驱动不可用，异步接口改用线程池执行查询：{e}")
+        return None
+    if _is_sqlite(async_url) and not _is_sqlite_memory(async_url):
+        event.listen(engine.sync_engine, "connect", _set_sqlite_pragmas)
+    return engine
+
+
+engine = _create_engine(DATABASE_URL)
+# 提交后不过期对象：提交后仍要读取字段刷新插件注册表，避免每次再查询一遍
+SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False, expire_on_commit=False)
 Base = declarative_base()
 
+# 内存数据库无法在两个引擎间共享
+async_engine = None if _is_sqlite_memory(make_url(DATABASE_URL)) else _create_async_engine(DATABASE_URL)
+AsyncSessionLocal = None
+if async_engine is not None:
+    from sqlalchemy.ext.asyncio import async_sessionmaker
+    AsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
+
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+
+def _run_in_session(func, args):
+    with SessionLocal() as db:
+        return func(db, *args)
+
+
+async def run_db(func, *args):
+    """
+    在异步路由中执行同步写法的查询 func(session, *args)，不占用事件循环：
+    有异步驱动时通过 AsyncSession.run_sync 执行，否则在线程池中使用连接池中的同步连接。
+    """
+    if AsyncSessionLocal is not None:
+        async with AsyncSessionLocal() as session:
+            return await session.run_sync(func, *args)
+    return await asyncio.to_thread(_run_in_session, func, args)
+
+
+async def dispose_engines():
+    engine.dispose()
+    if async_engine is not None:
+        await async_engine.dispose()
@@ -18,7 +18,7 @@ class PluginInfo(Base):
     __tablename__ = "plugins"
 
     id = Column(Integer, primary_key=True, index=True)
-    name = Column(String, unique=True)
+    name = Column(String, unique=True, index=True)
     version = Column(String)
     description = Column(String)
     entry_path = Column(String)
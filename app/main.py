@@ -4,14 +4,21 @@ Date: 2025-07-30
 Description: 主函数，启动入口。
 """
 from fastapi import FastAPI
+from app.api.metrics_router import router as metrics_router
 from app.api.plugin_router import router as plugin_router
 from app.core.plugin.hook.startup_hooks import register_startup_event
-from app.db.database import Base, engine
+from app.db.database import Base, dispose_engines, engine
 from app.utils.ascii_banner import print_ascii_banner
 
 
 app = FastAPI(title="插件管理系统")
 app.include_router(plugin_router, prefix="/plugins")
+app.include_router(metrics_router)
 Base.metadata.create_all(bind=engine)
 register_startup_event(app)
+
+@app.on_event("shutdown")
+async def close_database():
+    await dispose_engines()
+
 print_ascii_banner()
\ No newline at end of file
@@ -7,72 +7,201 @@ import zipfile
 import tarfile
 import os
 import json
+import hashlib
+import posixpath
+import re
+import stat
 
 from app.utils.log_utils import setup_logger
 
 logger = setup_logger("plugin_utils")
 
 
-def extract_and_parse_manifest(uploaded_file, dest_folder="./plugins"):
-    filename = uploaded_file.filename.lower()
+PLUGIN_ROOT = os.path.abspath("plugins")
+MAX_EXTRACTED_SIZE = int(os.getenv("PLUGIN_MAX_EXTRACTED_SIZE", 64 * 1024 * 1024))  # 解压后总大小上限
+MAX_PACKAGE_FILES = int(os.getenv("PLUGIN_MAX_PACKAGE_FILES", 2000))
+READ_CHUNK_SIZE = 1024 * 1024
+PLUGIN_NAME_PATTERN = re.compile(r"^[A-Za-z0-9_][A-Za-z0-9_.-]*$")  # 不能以 . 开头，排除 . 与 ..
+
+
+class PluginPackageError(ValueError):
+    """插件包格式错误或内容不合法"""
+
+
+class PluginPackageTooLarge(PluginPackageError):
+    """插件包或其解压后内容超过大小限制"""
+
+
+def _safe_member_path(name):
+    """规范化包内路径，拒绝绝对路径与 .. 越界"""
+    path = posixpath.normpath(name.replace("\\", "/"))
+    if path.startswith("/") or path == ".." or path.startswith("../") or re.match(r"^[A-Za-z]:", path):
+        raise PluginPackageError(f"插件包包含非法路径：{name}")
+    return path
+
+
+class PluginPackage:
+    """
+    已上传的插件包：只读取包索引与 manifest.json 完成校验，确认接受后再写入插件包存储。
+    zip 直接读取中央目录；tar.gz 没有索引，校验时顺序扫描一遍头部信息（不落盘）。
+    """
+
+    def __init__(self, fileobj, filename, sha256, size):
+        self.fileobj = fileobj
+        self.filename = filename
+        self.sha256 = sha256
+        self.size = size
+        lower = filename.lower()
+        if lower.endswith(".zip"):
+            self.kind = "zip"
+        elif lower.endswith(".tar.gz") or lower.endswith(".tgz"):
+            self.kind = "tar"
+        else:
+            logger.error("插件格式错误：只支持 zip 和 tar.gz 格式")
+            raise PluginPackageError("只支持 zip 和 tar.gz 格式的插件包")
+        self.default_name = re.sub(r"(\.zip|\.tar\.gz|\.tgz)$", "", os.path.basename(lower))
+        self.files = {}  # 包内规范化路径 -> 文件大小（仅普通文件）
+        self._manifest_bytes = None
+        self._manifest_member = None
+        try:
+            if self.kind == "zip":
+                self._scan_zip()
+            else:
+                self._scan_tar()
+        except (zipfile.BadZipFile, tarfile.TarError, EOFError, OSError) as e:
+            raise PluginPackageError(f"插件包已损坏：{e}")
+        self.manifest = self._parse_manifest()
+
+    def _check_limits(self):
+        if len(self.files) > MAX_PACKAGE_FILES:
+            raise PluginPackageTooLarge(f"插件包文件数超过 {MAX_PACKAGE_FILES}")
+        if sum(self.files.values()) > MAX_EXTRACTED_SIZE:
+            raise PluginPackageTooLarge(f"插件包解压后大小超过 {MAX_EXTRACTED_SIZE / 1024 / 1024:.0f} MB")
+
+    def _scan_zip(self):
+        self.fileobj.seek(0)
+        with zipfile.ZipFile(self.fileobj) as zf:
+            for info in zf.infolist():
+                if info.is_dir():
+                    continue
+                # 高 16 位是 Unix 文件模式，没有记录文件类型时按普通文件处理；与 tar 一样拒绝符号链接等
+                mode = info.external_attr >> 16
+                if stat.S_IFMT(mode) and not stat.S_ISREG(mode):
+                    raise PluginPackageError(f"插件包包含不支持的文件类型：{info.filename}")
+                self.files[_safe_member_path(info.filename)] = info.file_size
+            self._check_limits()
+            member = self._find_manifest()
+            self._manifest_member = member
+            for info in zf.infolist():
+                if not info.is_dir() and _safe_member_path(info.filename) == member:
+                    self._manifest_bytes = zf.read(info)
+                    break
+
+    def _scan_tar(self):
+        self.fileobj.seek(0)
+        manifests = {}
+        with tarfile.open(fileobj=self.fileobj, mode="r|gz") as tar:
+            for info in tar:
+                if info.isdir():
+                    continue
+                if not info.isfile():
+                    raise PluginPackageError(f"插件包包含不支持的文件类型：{info.name}")
+                path = _safe_member_path(info.name)
+                self.files[path] = info.size
+                if posixpath.basename(path) == "manifest.json":
+                    manifests[path] = tar.extractfile(info).read()
+                self._check_limits()
+        self._manifest_member = self._find_manifest()
+        self._manifest_bytes = manifests[self._manifest_member]
+
+    def _find_manifest(self):
+        candidates = [p for p in self.files if posixpath.basename(p) == "manifest.json"]
+        if not candidates:
+            raise PluginPackageError("manifest.json 未找到")
+        # 取层级最浅的 manifest.json，其所在目录即插件根目录
+        return min(candidates, key=lambda p: (p.count("/"), p))
+
+    @property
+    def root(self):
+        root = posixpath.dirname(self._manifest_member)
+        return f"{root}/" if root else ""
+
+    def _parse_manifest(self):
+        try:
+            manifest = json.loads(self._manifest_bytes.decode("utf-8"))
+        except (UnicodeDecodeError, json.JSONDecodeError) as e:
+            raise PluginPackageError(f"manifest.json 解析失败：{e}")
+        if not isinstance(manifest, dict):
+            raise PluginPackageError("manifest.json 内容必须是对象")
+        manifest["name"] = manifest.get("name") or self.default_name
+        if not PLUGIN_NAME_PATTERN.match(manifest["name"]):
+            raise PluginPackageError(f"插件名不合法：{manifest['name']}")
+        writable = manifest.get("writable", [])
+        if not isinstance(writable, list) or not all(isinstance(pattern, str) for pattern in writable):
+            raise PluginPackageError("manifest.json 的 writable 字段必须是字符串列表")
+        entry = _safe_member_path(manifest.get("entry", "plugin.py"))
+        if self.root + entry not in self.files:
+            raise PluginPackageError(f"插件入口文件 {entry} 不存在")
+        return manifest
+
+    @property
+    def name(self):
+        return self.manifest["name"]
+
+    def members(self):
+        """产出 (相对插件根目录的路径, 可读文件对象)，只包含插件根目录下的普通文件"""
+        self.fileobj.seek(0)
+        if self.kind == "zip":
+            with zipfile.ZipFile(self.fileobj) as zf:
+                for info in zf.infolist():
+                    path = None if info.is_dir() else _safe_member_path(info.filename)
+                    if path and path.startswith(self.root):
+                        with zf.open(info) as src:
+                            yield path[len(self.root):], src
+        else:
+            with tarfile.open(fileobj=self.fileobj, mode="r|gz") as tar:
+                for info in tar:
+                    path = _safe_member_path(info.name) if info.isfile() else None
+                    if path and path.startswith(self.root):
+                        yield path[len(self.root):], tar.extractfile(info)
+
+
+def open_plugin_package(uploaded_file, max_size):
+    """
+    读取上传的插件包：边读边计算 sha256 并检查大小，随后只解析包索引与 manifest.json。
+    插件包保留在上传文件对象中，不另行写入临时文件。
+    """
+    filename = uploaded_file.filename or ""
     logger.info(f"开始解析插件包：{filename}")
-    
-    temp_plugin_name = filename.replace(".zip", "").replace(".tar.gz", "").replace(".tgz", "")
-    temp_extract_path = os.path.join(dest_folder, temp_plugin_name)
-
-    # 先清理可能残留目录
-    if os.path.exists(temp_extract_path):
-        import shutil
-        shutil.rmtree(temp_extract_path)
-
-    if filename.endswith(".zip"):
-        logger.debug(f"解压 zip 到临时目录：{temp_extract_path}")
-        with zipfile.ZipFile(uploaded_file.file, 'r') as zip_ref:
-            zip_ref.extractall(temp_extract_path)
-
-    elif filename.endswith(".tar.gz") or filename.endswith(".tgz"):
-        logger.debug(f"解压 tar.gz 到临时目录：{temp_extract_path}")
-        with tarfile.open(fileobj=uploaded_file.file, mode="r:gz") as tar_ref:
-            tar_ref.extractall(temp_extract_path)
-
-    else:
-        logger.error("插件格式错误：只支持 zip 和 tar.gz 格式")
-        raise ValueError("只支持 zip 和 tar.gz 格式的插件包")
-
-    try:
-        manifest_path = find_manifest_json(temp_extract_path)
-        logger.debug(f"manifest.json 路径：{manifest_path}")
-    except FileNotFoundError as e:
-        logger.exception("未找到 manifest.json")
-        raise e
-
+    digest = hashlib.sha256()
+    size = 0
+    uploaded_file.file.seek(0)
+    while chunk := uploaded_file.file.read(READ_CHUNK_SIZE):
+        size += len(chunk)
+        if size > max_size:
+            raise PluginPackageTooLarge(f"文件过大，不能超过 {max_size / 1024 / 1024:.2f} MB")
+        digest.update(chunk)
+    package = PluginPackage(uploaded_file.file, filename, digest.hexdigest(), size)
+    logger.info(f"插件 {package.name} manifest 解析成功，sha256={package.sha256}")
+    return package
+
+
+def get_plugin_folder(entry_path):
+    """
+    插件根目录（manifest.json 与 requirements.txt 所在目录），即 plugins 下的第一级目录；
+    manifest.json 的 entry 可以指向该目录的子目录。
+    """
+    entry_path = os.path.abspath(entry_path)
+    relative = os.path.relpath(entry_path, PLUGIN_ROOT)
+    if relative == os.curdir or relative.startswith(os.pardir + os.sep) or relative == os.pardir:
+        return os.path.dirname(entry_path)
+    return os.path.join(PLUGIN_ROOT, relative.split(os.sep)[0])
+
+
+def read_plugin_manifest(entry_path):
+    """读取插件根目录下的 manifest.json，不存在时返回空字典"""
+    manifest_path = os.path.join(get_plugin_folder(entry_path), "manifest.json")
+    if not os.path.exists(manifest_path):
+        return {}
     with open(manifest_path, 'r', encoding='utf-8') as f:
-        manifest = json.load(f)
-
-    manifest_name = manifest.get("name")
-    if not manifest_name:
-        manifest_name = temp_plugin_name
-
-    # 如果解压目录和 manifest_name 不同，重命名目录
-    final_extract_path = os.path.join(dest_folder, manifest_name)
-    if final_extract_path != temp_extract_path:
-        if os.path.exists(final_extract_path):
-            import shutil
-            shutil.rmtree(final_extract_path)
-        os.rename(temp_extract_path, final_extract_path)
-        logger.info(f"将解压目录 {temp_extract_path} 重命名为 {final_extract_path}")
-
-    manifest["name"] = manifest_name
-    manifest["entry_path"] = os.path.join(final_extract_path, manifest.get("entry", "plugin.py"))
-
-    logger.info(f"插件 {manifest_name} manifest 解析成功")
-    return manifest
-
-
-
-def find_manifest_json(start_path):
-    logger.debug(f"搜索 manifest.json 起始路径：{start_path}")
-    for root, dirs, files in os.walk(start_path):
-        if "manifest.json" in files:
-            return os.path.join(root, "manifest.json")
-    raise FileNotFoundError("manifest.json 未找到")
+        return json.load(f)
@@ -3,67 +3,286 @@ Author: SmileSion
 Date: 2025-07-31
 Description: 日志处理模块。
 """
+import atexit
+import glob
+import gzip
+import itertools
 import logging
-from logging.handlers import RotatingFileHandler
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 import os
-import tarfile
+import queue
+import reprlib
+import shutil
+import sys
 import threading
+import time
 
 LOG_DIR = "logs"
 os.makedirs(LOG_DIR, exist_ok=True)
 LOG_FILE = os.path.join(LOG_DIR, "plugin.log")
+LOG_QUEUE_SIZE = int(os.getenv("PLUGIN_LOG_QUEUE_SIZE", 10000))  # 日志队列长度，写满时丢弃新日志而不阻塞调用方
+LOG_PAYLOAD_LIMIT = int(os.getenv("PLUGIN_LOG_PAYLOAD_LIMIT", 512))  # 日志中参数、返回值的最大字符数
+LOG_PAYLOAD_SAMPLE = max(int(os.getenv("PLUGIN_LOG_PAYLOAD_SAMPLE", 1)), 1)  # 每 N 条调用日志记录 1 次参数、返回值
+COMPRESS_CHUNK_SIZE = 1024 * 1024
 
-def compress_to_tar_gz(filename):
+_formatter = logging.Formatter('[%(asctime)s] %(levelname)s [%(name)s] %(message)s')
+_file_handler = None  # 当前进程唯一的文件 handler，只由写日志线程（子进程中为调用线程）使用
+_queue_handler = None  # 主进程中各 logger 共用的队列 handler
+_listener = None
+# 子进程（spawn 启动的模板进程、fork 出的工作进程）直接写文件，不启动后台线程；
+# spawn 子进程的 sys.argv 会被替换为父进程的参数，只能从 sys.orig_argv 判断
+_use_queue = "--multiprocessing-fork" not in getattr(sys, "orig_argv", sys.argv)
+_setup_lock = threading.Lock()
+_managed_loggers = set()  # setup_logger 配置过的 logger 名
+
+
+# ---------- 轮转压缩 ----------
+
+def compress_log_file(filename):
     """
-    压缩指定日志文件为 .tar.gz 格式，压缩完成后删除原文件。
+    流式压缩指定日志文件为 .gz 格式，压缩完成后删除原文件。
     """
     if not os.path.exists(filename):
         return
-    tar_gz_name = f"{filename}.tar.gz"
-    with tarfile.open(tar_gz_name, "w:gz") as tar:
-        tar.add(filename, arcname=os.path.basename(filename))
+    gz_name = f"{filename}.gz"
+    partial_name = f"{gz_name}.partial"
     try:
+        with open(filename, "rb") as src, gzip.open(partial_name, "wb") as dst:
+            shutil.copyfileobj(src, dst, COMPRESS_CHUNK_SIZE)
+        os.replace(partial_name, gz_name)
         os.remove(filename)
-    except PermissionError:
-        pass
+    except FileNotFoundError:
+        # 其他进程已压缩了同一文件
+        if os.path.exists(partial_name):
+            os.remove(partial_name)
+
+
+def _prune_backups(base_filename, backup_count):
+    """只保留最近 backup_count 个压缩后的日志"""
+    if backup_count <= 0:
+        return
+    backups = sorted(glob.glob(f"{glob.escape(base_filename)}.*.gz"), key=os.path.getmtime)
+    for filename in backups[:-backup_count]:
+        try:
+            os.remove(filename)
+        except FileNotFoundError:
+            pass
+
+
+class _LogCompressor(threading.Thread):
+    """单个后台线程依次压缩切割出的日志，不占用写日志线程"""
+
+    def __init__(self):
+        super().__init__(daemon=True, name="plugin-log-compressor")
+        self.pending = queue.Queue()
+
+    def run(self):
+        while True:
+            filename, base_filename, backup_count = self.pending.get()
+            try:
+                compress_log_file(filename)
+                _prune_backups(base_filename, backup_count)
+            except Exception as e:
+                # 压缩线程不能再通过日志报告自身错误，直接写入标准错误
+                sys.stderr.write(f"日志压缩失败：{filename}，原因：{e}\n")
+                sys.stderr.flush()
+
+
+_compressor = None
+_compressor_lock = threading.Lock()
+
+
+def _submit_compression(filename, base_filename, backup_count):
+    global _compressor
+    if not _use_queue:
+        # 子进程保持单线程（模板进程之后还要 fork），直接压缩；子进程日志很少，切割也很少发生
+        compress_log_file(filename)
+        _prune_backups(base_filename, backup_count)
+        return
+    with _compressor_lock:
+        if _compressor is None:
+            _compressor = _LogCompressor()
+            _compressor.start()
+    _compressor.pending.put((filename, base_filename, backup_count))
+
 
 class CompressingRotatingFileHandler(RotatingFileHandler):
     """
-    按大小切割日志，切割后异步压缩为 tar.gz 格式。
+    按大小切割日志，切割出的文件按时间命名，交给后台线程压缩为 .gz 格式。
     """
+    def __init__(self, filename, *args, **kwargs):
+        super().__init__(filename, *args, **kwargs)
+        self._rollover_seq = itertools.count()
+
+    def compress_leftovers(self):
+        """压缩上次退出时切割出但未压缩完的日志"""
+        for leftover in glob.glob(f"{glob.escape(self.baseFilename)}.*"):
+            if not leftover.endswith((".gz", ".partial")):
+                _submit_compression(leftover, self.baseFilename, self.backupCount)
+
     def doRollover(self):
-        super().doRollover()
-        threading.Thread(target=self.compress_logs, daemon=True).start()
+        if self.stream:
+            self.stream.close()
+            self.stream = None
+        if os.path.exists(self.baseFilename):
+            # 文件名带时间、进程号与序号，多进程同时切割也不会覆盖彼此的文件
+            rotated = (f"{self.baseFilename}.{time.strftime('%Y%m%d-%H%M%S')}"
+                       f".{os.getpid()}.{next(self._rollover_seq)}")
+            try:
+                os.rename(self.baseFilename, rotated)
+            except FileNotFoundError:
+                pass
+            else:
+                _submit_compression(rotated, self.baseFilename, self.backupCount)
+        if not self.delay:
+            self.stream = self._open()
 
-    def compress_logs(self):
-        for filename in os.listdir(LOG_DIR):
-            if filename.startswith("plugin.log.") and not filename.endswith(".tar.gz"):
-                compress_to_tar_gz(os.path.join(LOG_DIR, filename))
 
-def setup_logger(name="plugin_logger", max_bytes=50*1024*1024, backup_count=7):
+# ---------- 队列写日志 ----------
 
-    logger = logging.getLogger(name)
-    logger.setLevel(logging.INFO)
+class _DeferredFormatQueueHandler(QueueHandler):
+    """
+    调用方只把日志记录放入队列，%-style 消息在写日志线程中才格式化。
+    异常堆栈需要在调用方渲染为文本，否则 traceback 会在写日志前被修改或持有大量帧对象。
+    """
+    def prepare(self, record):
+        if record.exc_info:
+            record.exc_text = _formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
 
-    if not logger.handlers:
-        handler = CompressingRotatingFileHandler(
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            pass
+
+
+def _get_file_handler(max_bytes, backup_count):
+    global _file_handler
+    if _file_handler is None:
+        _file_handler = CompressingRotatingFileHandler(
             LOG_FILE,
             maxBytes=max_bytes,
             backupCount=backup_count,
             encoding="utf-8",
             delay=True
         )
-        formatter = logging.Formatter('[%(asctime)s] %(levelname)s [%(name)s] %(message)s')
-        handler.setFormatter(formatter)
-        logger.addHandler(handler)
+        _file_handler.setFormatter(_formatter)
+    return _file_handler
+
+
+def _stop_listener():
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def _get_process_handler(max_bytes, backup_count):
+    """主进程中返回共用的队列 handler（首次调用时启动写日志线程），子进程中返回文件 handler"""
+    global _queue_handler, _listener
+    with _setup_lock:
+        file_handler = _get_file_handler(max_bytes, backup_count)
+        if not _use_queue:
+            return file_handler
+        if _queue_handler is None:
+            log_queue = queue.Queue(LOG_QUEUE_SIZE)
+            _queue_handler = _DeferredFormatQueueHandler(log_queue)
+            _listener = QueueListener(log_queue, file_handler)
+            _listener.start()
+            atexit.register(_stop_listener)
+            file_handler.compress_leftovers()
+        return _queue_handler
+
+
+def _after_fork_in_child():
+    """
+    fork 出的子进程没有写日志线程与压缩线程，队列也可能停在被锁住的状态：
+    丢弃这些对象，已配置的 logger 改为直接写文件。
+    """
+    global _queue_handler, _listener, _use_queue, _compressor, _setup_lock, _compressor_lock
+    _use_queue = False
+    _setup_lock = threading.Lock()
+    _compressor_lock = threading.Lock()
+    _compressor = None
+    _listener = None
+    stale_handler, _queue_handler = _queue_handler, None
+    if stale_handler is None or _file_handler is None:
+        return
+    # 父进程的写日志线程打开的文件对象不再使用，子进程写日志时重新打开
+    _file_handler.stream = None
+    for name in _managed_loggers:
+        logger = logging.getLogger(name)
+        if stale_handler in logger.handlers:
+            logger.removeHandler(stale_handler)
+            logger.addHandler(_file_handler)
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
+
+
+def setup_logger(name="plugin_logger", max_bytes=50*1024*1024, backup_count=7):
+
+    logger = logging.getLogger(name)
+    logger.setLevel(logging.INFO)
+
+    if not logger.handlers:
+        logger.addHandler(_get_process_handler(max_bytes, backup_count))
+        _managed_loggers.add(name)
 
     return logger
 
 def close_logger(logger):
     for handler in logger.handlers[:]:
+        logger.removeHandler(handler)
+        # 共用的 handler 由其他 logger 继续使用，进程退出时统一关闭
+        if handler is _queue_handler or handler is _file_handler:
+            continue
         try:
             handler.close()
         except Exception:
             pass
-        logger.removeHandler(handler)
+    _managed_loggers.discard(logger.name)
+
+
+# ---------- 热路径日志 ----------
+
+class _PayloadRepr(reprlib.Repr):
+    def repr_bytes(self, value, level):
+        return f"<{type(value).__name__} {len(value)} 字节>"
+
+    repr_bytearray = repr_memoryview = repr_bytes
+
 
+_payload_repr = _PayloadRepr()
+_payload_repr.maxstring = LOG_PAYLOAD_LIMIT
+_payload_repr.maxother = LOG_PAYLOAD_LIMIT
+_payload_repr.maxlevel = 3
+_payload_repr.maxdict = _payload_repr.maxlist = _payload_repr.maxtuple = _payload_repr.maxset = 16
+_payload_counter = itertools.count()
+
+
+class _Payload:
+    """写日志时才生成截断后的 repr，大参数、大返回值不会被完整转成字符串"""
+    __slots__ = ("value",)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __str__(self):
+        text = _payload_repr.repr(self.value)
+        if len(text) > LOG_PAYLOAD_LIMIT:
+            text = f"{text[:LOG_PAYLOAD_LIMIT]}...（已截断）"
+        return text
+
+
+def log_payload(value):
+    """
+    热路径日志中记录参数或返回值时使用：logger.info("... %s", log_payload(result))。
+    按 PLUGIN_LOG_PAYLOAD_SAMPLE 采样，未采样到的只记录类型。
+    """
+    if LOG_PAYLOAD_SAMPLE > 1 and next(_payload_counter) % LOG_PAYLOAD_SAMPLE:
+        return f"<{type(value).__name__}，已省略>"
+    return _Payload(value)
@@ -0,0 +1,5 @@
+"""
+Author: SmileSion
+Date: 2026-10-18
+Description: 插件平台热点路径基准测试。
+"""
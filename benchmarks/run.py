@@ -0,0 +1,503 @@
+"""
+Author: SmileSion
+Date: 2026-10-18
+Description: 基准测试入口，结果以 JSON 输出，可与历史结果对比。
+
+在仓库根目录执行：
+    python -m benchmarks.run --output results.json
+    python -m benchmarks.run --suites call,inprocess --quick
+    python -m benchmarks.run --output new.json --compare old.json --fail-on-regression
+"""
+import argparse
+import asyncio
+import atexit
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+from benchmarks.synthetic_plugins import build_package
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SUITES = ("call", "inprocess", "package", "startup", "soak")
+
+# 用例名 -> (插件, 方法, 参数)
+CALL_CASES = {
+    "noop": ("noop", "ping", {}),
+    "cpu": ("cpu", "fib", {"n": 18}),
+    "payload_64k": ("payload", "echo", {"data": "x" * 65536}),
+    "payload_2m": ("payload", "echo", {"data": "x" * (2 * 1024 * 1024)}),  # 超过共享内存阈值（默认 1 MiB）
+}
+BENCH_WORKERS = {"min": 1, "max": 8}
+
+# 对比时数值越大越好的指标，其余指标越小越好；以 _count 结尾的只展示不判定
+HIGHER_IS_BETTER = ("rps", "requests")
+
+
+# ---------- 统计 ----------
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    index = max(0, min(len(sorted_values) - 1, round(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def summarize(latencies, elapsed, errors=0):
+    """latencies 为每次请求耗时（秒），返回毫秒级分位数与吞吐量"""
+    values = sorted(latencies)
+    ms = lambda v: round(v * 1000, 3) if v is not None else None
+    return {
+        "request_count": len(values),
+        "error_count": errors,
+        "rps": round(len(values) / elapsed, 1) if elapsed else None,
+        "mean_ms": ms(statistics.fmean(values)) if values else None,
+        "p50_ms": ms(percentile(values, 50)),
+        "p90_ms": ms(percentile(values, 90)),
+        "p99_ms": ms(percentile(values, 99)),
+        "max_ms": ms(values[-1]) if values else None,
+    }
+
+
+def read_rss_mb(pid):
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+    except (OSError, ValueError, IndexError):
+        return 0.0
+
+
+def descendants(pid):
+    """当前进程的全部子孙进程（工作进程由模板进程 fork，不是主进程的直接子进程）"""
+    result = []
+    try:
+        tids = os.listdir(f"/proc/{pid}/task")
+    except OSError:
+        return result
+    for tid in tids:
+        try:
+            with open(f"/proc/{pid}/task/{tid}/children") as f:
+                children = [int(child) for child in f.read().split()]
+        except OSError:
+            continue
+        for child in children:
+            result.append(child)
+            result.extend(descendants(child))
+    return result
+
+
+# ---------- 被测平台 ----------
+
+class BenchPlatform:
+    """在临时目录中启动应用（插件目录、数据库、日志均位于该目录），同一进程只能创建一次"""
+
+    def __init__(self, workdir):
+        os.makedirs(os.path.join(workdir, "plugins"), exist_ok=True)
+        os.chdir(workdir)
+        from fastapi.testclient import TestClient
+        # 启动横幅打印到标准输出，转到标准错误以免混入 JSON 结果
+        with contextlib.redirect_stdout(sys.stderr):
+            from app.main import app
+        self.app = app
+        self.client = TestClient(app)
+        self.client.__enter__()
+
+    def install(self, kind, name=None, enable=True, **package_options):
+        name = name or kind
+        response = self.client.post("/plugins/upload", files={
+            "file": (f"{name}.zip", build_package(kind, name=name, **package_options)),
+        })
+        response.raise_for_status()
+        if enable:
+            self.client.post(f"/plugins/enable/{name}").raise_for_status()
+
+    def close(self):
+        self.client.__exit__(None, None, None)
+
+
+async def _drive(app, requests, concurrency, duration=None, on_tick=None):
+    """
+    以 concurrency 个并发连接依次发送 requests 中的 (插件, 方法, 参数)；
+    指定 duration 时循环发送直到超时。返回 (耗时列表, 错误数, 总耗时)。
+    """
+    import httpx
+
+    latencies = []
+    errors = 0
+    deadline = time.perf_counter() + duration if duration else None
+    pending = iter(requests)
+
+    async def connection(client):
+        nonlocal errors
+        for name, method, args in pending:
+            if deadline and time.perf_counter() > deadline:
+                return
+            started = time.perf_counter()
+            response = await client.post(f"/plugins/call/{name}", json={"method": method, "args": args})
+            latencies.append(time.perf_counter() - started)
+            if response.status_code != 200:
+                errors += 1
+
+    async def ticker():
+        while True:
+            on_tick()
+            await asyncio.sleep(1)
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        tick_task = asyncio.ensure_future(ticker()) if on_tick else None
+        started = time.perf_counter()
+        await asyncio.gather(*(connection(client) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+        if tick_task:
+            tick_task.cancel()
+    return latencies, errors, elapsed
+
+
+# ---------- 测试项 ----------
+
+def bench_call(bench, options):
+    """/call 在不同并发下的延迟分位数与吞吐量"""
+    results = {}
+    for case, (name, method, args) in CALL_CASES.items():
+        results[case] = {}
+        for concurrency in options.concurrency:
+            # 预热：让进程池扩容到该并发所需的规模
+            asyncio.run(_drive(bench.app, [(name, method, args)] * concurrency * 2, concurrency))
+            total = max(options.requests, concurrency * 10)
+            latencies, errors, elapsed = asyncio.run(
+                _drive(bench.app, [(name, method, args)] * total, concurrency))
+            results[case][f"c{concurrency}"] = summarize(latencies, elapsed, errors)
+            _progress(f"call {case} c={concurrency}: {results[case][f'c{concurrency}']}")
+    return results
+
+
+def bench_inprocess(bench, options):
+    """主进程内直接调用与工作进程调用的单次开销对比"""
+    from app.core.plugin.plugin_loader import call_plugin_method, call_plugin_method_in_process
+    from app.core.plugin.plugin_registry import get_enabled_plugin
+
+    entry_path = get_enabled_plugin("noop").entry_path
+    callers = {
+        "call_plugin_method": lambda: call_plugin_method("noop", "ping", {}),
+        "call_plugin_method_in_process": lambda: call_plugin_method_in_process("noop", entry_path, "ping", {}),
+    }
+    results = {}
+    for label, caller in callers.items():
+        for _ in range(min(options.iterations, 100)):
+            caller()
+        latencies = []
+        started = time.perf_counter()
+        for _ in range(options.iterations):
+            t0 = time.perf_counter()
+            caller()
+            latencies.append(time.perf_counter() - t0)
+        results[label] = summarize(latencies, time.perf_counter() - started)
+        _progress(f"inprocess {label}: {results[label]}")
+    return results
+
+
+def bench_package(bench, options):
+    """上传、更新、重复更新（内容相同）与解析耗时随插件包大小的变化"""
+    from app.utils.file_utils import open_plugin_package
+
+    results = {}
+    for size_kb in options.package_sizes:
+        padding = size_kb * 1024
+        timings = {"parse_ms": [], "upload_ms": [], "update_ms": [], "noop_update_ms": []}
+        for attempt in range(options.repeat):
+            name = f"pkg_{size_kb}k_{attempt}"
+            v1 = build_package("noop", name=name, padding=padding)
+            v2 = build_package("noop", name=name, version="2", padding=padding)
+
+            upload = SimpleNamespace(filename=f"{name}.zip", file=io.BytesIO(v1))
+            started = time.perf_counter()
+            open_plugin_package(upload, len(v1))
+            timings["parse_ms"].append(time.perf_counter() - started)
+
+            for label, path, data in (("upload_ms", "/plugins/upload", v1),
+                                      ("update_ms", f"/plugins/update/{name}", v2),
+                                      ("noop_update_ms", f"/plugins/update/{name}", v2)):
+                started = time.perf_counter()
+                response = bench.client.post(path, files={"file": (f"{name}.zip", data)})
+                timings[label].append(time.perf_counter() - started)
+                response.raise_for_status()
+            bench.client.delete(f"/plugins/uninstall/{name}")
+        results[f"{size_kb}k"] = {
+            "package_bytes": len(v1),
+            **{label: round(statistics.median(values) * 1000, 3) for label, values in timings.items()},
+        }
+        _progress(f"package {size_kb}k: {results[f'{size_kb}k']}")
+
+    # 运行中插件的蓝绿更新
+    swap_ms = []
+    for attempt in range(options.repeat):
+        name = f"swap_{attempt}"
+        bench.install("noop", name=name)
+        started = time.perf_counter()
+        response = bench.client.post(f"/plugins/update/{name}", files={
+            "file": (f"{name}.zip", build_package("noop", name=name, version="2")),
+        })
+        swap_ms.append(time.perf_counter() - started)
+        response.raise_for_status()
+        bench.client.delete(f"/plugins/uninstall/{name}")
+    results["swap_running_ms"] = round(statistics.median(swap_ms) * 1000, 3)
+    return results
+
+
+def bench_startup(options):
+    """启动耗时随已启用插件数量的变化，每次在独立进程中测量"""
+    scenarios = {f"n{count}": [("noop", count)] for count in options.startup_counts}
+    scenarios["slow"] = [("noop", 2), ("slow_import", 1), ("slow_activate", 1)]
+    results = {}
+    for mode in options.startup_modes:
+        results[mode] = {}
+        for label, plugins in scenarios.items():
+            runs = []
+            for _ in range(options.repeat):
+                workdir = tempfile.mkdtemp(prefix="plugin-bench-startup-")
+                try:
+                    spec = ",".join(f"{kind}:{count}" for kind, count in plugins)
+                    _run_child("setup", workdir, ["--plugins", spec])
+                    runs.append(_run_child("startup", workdir, [], {"PLUGIN_STARTUP_MODE": mode}))
+                finally:
+                    shutil.rmtree(workdir, ignore_errors=True)
+            results[mode][label] = {
+                key: round(statistics.median(run[key] for run in runs), 4) for key in runs[0]
+            }
+            _progress(f"startup {mode} {label}: {results[mode][label]}")
+    return results
+
+
+def bench_soak(bench, options):
+    """持续混合调用期间主进程与工作进程的常驻内存变化"""
+    samples = []
+
+    def sample():
+        workers = descendants(os.getpid())
+        samples.append({
+            "t": round(time.perf_counter() - started, 1),
+            "main_mb": round(read_rss_mb(os.getpid()), 2),
+            "workers_mb": round(sum(read_rss_mb(pid) for pid in workers), 2),
+            "processes": len(workers),
+        })
+
+    def mixed_requests():
+        while True:
+            yield from CALL_CASES.values()
+
+    started = time.perf_counter()
+    latencies, errors, elapsed = asyncio.run(
+        _drive(bench.app, mixed_requests(), options.soak_concurrency, options.soak_seconds, sample))
+    sample()
+    first, last = samples[0], samples[-1]
+    result = {
+        **summarize(latencies, elapsed, errors),
+        "requests": len(latencies),
+        "main_start_mb": first["main_mb"],
+        "main_end_mb": last["main_mb"],
+        "main_max_mb": max(s["main_mb"] for s in samples),
+        "main_growth_mb": round(last["main_mb"] - first["main_mb"], 2),
+        "workers_start_mb": first["workers_mb"],
+        "workers_end_mb": last["workers_mb"],
+        "workers_growth_mb": round(last["workers_mb"] - first["workers_mb"], 2),
+        "samples": samples,
+    }
+    _progress(f"soak: {({k: v for k, v in result.items() if k != 'samples'})}")
+    return result
+
+
+# ---------- 子进程（启动耗时） ----------
+
+def _run_child(action, workdir, extra, env=None):
+    command = [sys.executable, "-m", "benchmarks.run", "--child", action, "--workdir", workdir, *extra]
+    child_env = {**os.environ, "PYTHONPATH": REPO_ROOT, **(env or {})}
+    completed = subprocess.run(command, cwd=REPO_ROOT, env=child_env, capture_output=True, text=True, timeout=600)
+    if completed.returncode != 0:
+        raise RuntimeError(f"基准测试子进程 {action} 失败：{completed.stderr[-2000:]}")
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def _child_main(options):
+    if options.child == "setup":
+        bench = BenchPlatform(options.workdir)
+        for item in options.plugins.split(","):
+            kind, count = item.split(":")
+            for index in range(int(count)):
+                bench.install(kind, name=f"{kind}_{index}")
+        bench.close()
+        print(json.dumps({}))
+        return
+
+    started = time.perf_counter()
+    os.chdir(options.workdir)
+    from fastapi.testclient import TestClient
+    with contextlib.redirect_stdout(sys.stderr):
+        from app.main import app
+    imported = time.perf_counter()
+    with TestClient(app) as client:
+        ready = time.perf_counter()
+        client.get("/plugins/ready").raise_for_status()
+    print(json.dumps({
+        "import_s": imported - started,
+        "startup_s": ready - imported,
+        "total_s": ready - started,
+    }))
+
+
+# ---------- 结果对比 ----------
+
+def flatten(data, prefix=""):
+    for key, value in data.items():
+        path = f"{prefix}.{key}" if prefix else key
+        if isinstance(value, dict):
+            yield from flatten(value, path)
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            yield path, value
+
+
+def compare(baseline, current, threshold, file=sys.stdout):
+    """逐项对比两次结果，打印变化并返回退化的指标数"""
+    old = dict(flatten(baseline["results"]))
+    new = dict(flatten(current["results"]))
+    regressions = 0
+    print(f"{'指标':<55} {'基线':>12} {'本次':>12} {'变化':>9}", file=file)
+    for path in sorted(old.keys() & new.keys()):
+        before, after = old[path], new[path]
+        if path.endswith("_count") or not before:
+            continue
+        change = (after - before) / before * 100
+        higher_is_better = path.rsplit(".", 1)[-1] in HIGHER_IS_BETTER
+        regressed = change < -threshold if higher_is_better else change > threshold
+        regressions += regressed
+        marker = "  <-- 退化" if regressed else ""
+        print(f"{path:<55} {before:>12} {after:>12} {change:>+8.1f}%{marker}", file=file)
+    print(f"共 {regressions} 项指标退化超过 {threshold}%", file=file)
+    return regressions
+
+
+# ---------- 入口 ----------
+
+def _progress(message):
+    print(message, file=sys.stderr, flush=True)
+
+
+def _int_list(value):
+    return [int(v) for v in value.split(",") if v]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="插件平台基准测试")
+    parser.add_argument("--suites", default=",".join(SUITES), help=f"要运行的测试项，逗号分隔：{','.join(SUITES)}")
+    parser.add_argument("--output", help="结果 JSON 文件路径，不指定时输出到标准输出")
+    parser.add_argument("--compare", help="与该结果文件对比")
+    parser.add_argument("--threshold", type=float, default=10.0, help="判定为退化的变化百分比")
+    parser.add_argument("--fail-on-regression", action="store_true", help="存在退化时以非零状态码退出")
+    parser.add_argument("--quick", action="store_true", help="缩小规模，用于快速检查")
+    parser.add_argument("--concurrency", type=_int_list, default=[1, 4, 16, 64])
+    parser.add_argument("--requests", type=int, default=2000, help="每个并发级别的请求数")
+    parser.add_argument("--iterations", type=int, default=2000, help="inprocess 测试的调用次数")
+    parser.add_argument("--package-sizes", type=_int_list, default=[0, 256, 1024, 2048], help="插件包附带数据大小（KB）")
+    parser.add_argument("--startup-counts", type=_int_list, default=[1, 4, 8])
+    parser.add_argument("--startup-modes", default="serial,parallel")
+    parser.add_argument("--soak-seconds", type=float, default=60)
+    parser.add_argument("--soak-concurrency", type=int, default=8)
+    parser.add_argument("--repeat", type=int, default=3, help="package / startup 测试的重复次数，取中位数")
+    parser.add_argument("--keep", action="store_true", help="保留临时工作目录")
+    parser.add_argument("--child", choices=("setup", "startup"), help=argparse.SUPPRESS)
+    parser.add_argument("--workdir", help=argparse.SUPPRESS)
+    parser.add_argument("--plugins", help=argparse.SUPPRESS)
+    options = parser.parse_args(argv)
+    options.suites = [s for s in options.suites.split(",") if s]
+    options.startup_modes = [m for m in options.startup_modes.split(",") if m]
+    unknown = set(options.suites) - set(SUITES)
+    if unknown:
+        parser.error(f"未知的测试项：{', '.join(sorted(unknown))}")
+    if options.quick:
+        options.concurrency = [1, 8]
+        options.requests = 200
+        options.iterations = 200
+        options.package_sizes = [0, 1024]
+        options.startup_counts = [1, 4]
+        options.soak_seconds = 5
+        options.repeat = 1
+    return options
+
+
+def _metadata(options):
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=REPO_ROOT, capture_output=True,
+                                text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "suites": options.suites,
+        "quick": options.quick,
+    }
+
+
+def main(argv=None):
+    options = parse_args(argv)
+    if options.child:
+        _child_main(options)
+        return 0
+
+    output = os.path.abspath(options.output) if options.output else None
+    baseline_path = os.path.abspath(options.compare) if options.compare else None
+    report = {"meta": _metadata(options), "results": {}}
+
+    workdir = tempfile.mkdtemp(prefix="plugin-bench-")
+    if not options.keep:
+        # 先于应用注册：atexit 后注册先执行，应用清理子进程并写完日志后再删除工作目录
+        atexit.register(shutil.rmtree, workdir, True)
+    bench = None
+    try:
+        if "startup" in options.suites:
+            report["results"]["startup"] = bench_startup(options)
+        in_app = [suite for suite in options.suites if suite != "startup"]
+        if in_app:
+            bench = BenchPlatform(workdir)
+            for kind in ("noop", "cpu", "payload"):
+                bench.install(kind, workers=BENCH_WORKERS)
+            suites = {"call": bench_call, "inprocess": bench_inprocess, "package": bench_package, "soak": bench_soak}
+            for suite in in_app:
+                report["results"][suite] = suites[suite](bench, options)
+    finally:
+        if bench is not None:
+            bench.close()
+        os.chdir(REPO_ROOT)
+        if options.keep:
+            _progress(f"工作目录：{workdir}")
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            f.write(text)
+        _progress(f"结果已写入 {output}")
+    else:
+        print(text)
+
+    if baseline_path:
+        with open(baseline_path, "r", encoding="utf-8") as f:
+            # 结果 JSON 输出到标准输出时，对比表输出到标准错误
+            regressions = compare(json.load(f), report, options.threshold, sys.stdout if output else sys.stderr)
+        if regressions and options.fail_on_regression:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
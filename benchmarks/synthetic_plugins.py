@@ -0,0 +1,76 @@
+"""
+Author: SmileSion
+Date: 2026-10-18
+Description: 基准测试使用的合成插件，按需打包为 zip 插件包。
+"""
+import io
+import json
+import os
+import zipfile
+
+SLOW_SECONDS = 0.2  # slow_import / slow_activate 插件的导入与激活耗时
+
+_HEADER = """import time
+from app.core.plugin.plugin_base import PluginBase
+"""
+
+PLUGIN_SOURCES = {
+    # 空操作，衡量纯调度开销
+    "noop": _HEADER + """
+class Plugin(PluginBase):
+    def activate(self): pass
+    def deactivate(self): pass
+    def ping(self): return None
+""",
+    # CPU 密集
+    "cpu": _HEADER + """
+def _fib(n):
+    return n if n < 2 else _fib(n - 1) + _fib(n - 2)
+
+class Plugin(PluginBase):
+    def activate(self): pass
+    def deactivate(self): pass
+    def fib(self, n: int): return _fib(n)
+""",
+    # 大参数与大返回值
+    "payload": _HEADER + """
+class Plugin(PluginBase):
+    def activate(self): pass
+    def deactivate(self): pass
+    def echo(self, data: str): return data
+    def blob(self, size: int): return "x" * size
+""",
+    # 导入缓慢
+    "slow_import": _HEADER + f"""
+time.sleep({SLOW_SECONDS})
+
+class Plugin(PluginBase):
+    def activate(self): pass
+    def deactivate(self): pass
+    def ping(self): return None
+""",
+    # 激活缓慢
+    "slow_activate": _HEADER + f"""
+class Plugin(PluginBase):
+    def activate(self): time.sleep({SLOW_SECONDS})
+    def deactivate(self): pass
+    def ping(self): return None
+""",
+}
+
+
+def build_package(kind, name=None, version="1", padding=0, workers=None):
+    """
+    生成 zip 插件包内容。padding 为附带的随机数据大小（字节，不可压缩），用于测试不同大小的插件包；
+    合成插件关闭并发合并，相同参数的并发调用各自执行。
+    """
+    manifest = {"name": name or kind, "version": version, "coalesce": False}
+    if workers:
+        manifest["workers"] = workers
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr("manifest.json", json.dumps(manifest))
+        zf.writestr("plugin.py", PLUGIN_SOURCES[kind])
+        if padding:
+            zf.writestr("data.bin", os.urandom(padding))
+    return buffer.getvalue()